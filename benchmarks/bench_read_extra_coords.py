@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark extra coords of spectral windows read from a multi-window OBS.
+
+Reads a synthetic OBS of several multi-window raster files and reports the
+read time, the memory held by the extra coords of all cubes and the time that
+the previous reader spent deep-copying extra coords for every window of every
+file.  Extra coords are now shared between the windows of a file.
+
+Usage: python benchmarks/bench_read_extra_coords.py
+"""
+import copy
+import os
+import tempfile
+import timeit
+
+from ndcube.utils.cube import convert_extra_coords_dict_to_input_format
+
+from irispy.spectrograph import read_iris_spectrograph_level2_fits
+from irispy.tests.helpers import write_synthetic_raster_file
+
+N_FILES = 50
+N_RASTER_POSITIONS = 400
+N_REPEATS = 3
+
+
+def extra_coords_nbytes(cubes):
+    """Returns bytes held by extra coords of cubes, counting shared values once, and
+    bytes they would hold if each cube had its own copy."""
+    values = [coord["value"] for cube in cubes for coord in cube.extra_coords.values()]
+    unique_values = dict([(id(value), value) for value in values]).values()
+    return (sum([value.nbytes for value in unique_values]),
+            sum([value.nbytes for value in values]))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = [os.path.join(tmpdir, "raster_r{0:05d}.fits".format(i))
+                     for i in range(N_FILES)]
+        for i, filename in enumerate(filenames):
+            write_synthetic_raster_file(filename, raster_index=i,
+                                        n_raster_positions=N_RASTER_POSITIONS)
+        for datetime_objects in [False, True]:
+            read_time = min(timeit.repeat(
+                lambda: read_iris_spectrograph_level2_fits(
+                    filenames, datetime_objects=datetime_objects),
+                number=1, repeat=N_REPEATS))
+            raster = read_iris_spectrograph_level2_fits(filenames,
+                                                        datetime_objects=datetime_objects)
+            cubes = [cube for sequence in raster.data.values() for cube in sequence.data]
+            shared_nbytes, copied_nbytes = extra_coords_nbytes(cubes)
+            # Time of deep copies made by previous reader, one per window per file.
+            cube = cubes[0]
+            general_extra_coords = [
+                coord for coord in convert_extra_coords_dict_to_input_format(
+                    cube.extra_coords, cube.missing_axis) if coord[0] != "exposure time"]
+            deepcopy_time = min(timeit.repeat(lambda: copy.deepcopy(general_extra_coords),
+                                              number=10, repeat=N_REPEATS)) / 10 * len(cubes)
+            print("datetime_objects={0}: {1} files x {2} windows read in {3:.3f} s.  "
+                  "Extra coords {4:.2f} MB (previously {5:.2f} MB).  "
+                  "Deep copies avoided: {6:.3f} s.".format(
+                      datetime_objects, N_FILES, len(raster.data), read_time,
+                      shared_nbytes / 1e6, copied_nbytes / 1e6, deepcopy_time))
+
+
+if __name__ == "__main__":
+    main()
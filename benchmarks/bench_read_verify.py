@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark header verification when reading an OBS of many files.
+
+Writes a synthetic OBS of many raster files and SJI files whose headers hold
+as many keywords as level 2 files, and compares the read time with all
+header cards verified (verify=True, the default) with that when only the
+header keywords used by the readers are verified (verify=False).
+
+Usage: python benchmarks/bench_read_verify.py
+"""
+import os
+import tempfile
+import timeit
+
+from astropy.io import fits
+
+from irispy.sji import read_iris_sji_level2_fits
+from irispy.spectrograph import read_iris_spectrograph_level2_fits
+from irispy.tests.helpers import write_synthetic_raster_file, write_synthetic_sji_file
+
+N_FILES = 100
+N_SJI_FILES = 10
+# Approximate number of keywords in each header of level 2 files.
+N_PRIMARY_KEYWORDS = 300
+N_EXTENSION_KEYWORDS = 50
+N_REPEATS = 3
+
+
+def pad_headers(filename):
+    """Appends keywords to every header of a file, as found in level 2 files."""
+    with fits.open(filename, mode="update") as hdulist:
+        for i, hdu in enumerate(hdulist):
+            n_keywords = N_PRIMARY_KEYWORDS if i == 0 else N_EXTENSION_KEYWORDS
+            for j in range(n_keywords):
+                hdu.header.append(("KEY{0:05d}".format(j), float(j), "Padding keyword"))
+
+
+def time_read(reader, filenames, **kwargs):
+    return min(timeit.repeat(lambda: reader(filenames, **kwargs), number=1, repeat=N_REPEATS))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raster_filenames = [os.path.join(tmpdir, "raster_r{0:05d}.fits".format(i))
+                            for i in range(N_FILES)]
+        for i, filename in enumerate(raster_filenames):
+            write_synthetic_raster_file(filename, raster_index=i)
+            pad_headers(filename)
+        sji_filenames = [os.path.join(tmpdir, "sji_1400_{0:03d}.fits".format(i))
+                         for i in range(N_SJI_FILES)]
+        for filename in sji_filenames:
+            write_synthetic_sji_file(filename)
+            pad_headers(filename)
+        benchmarks = [("raster", read_iris_spectrograph_level2_fits, raster_filenames, {}),
+                      ("raster memmap", read_iris_spectrograph_level2_fits, raster_filenames,
+                       {"memmap": True}),
+                      ("SJI", read_iris_sji_level2_fits, sji_filenames, {})]
+        for name, reader, filenames, kwargs in benchmarks:
+            strict_time = time_read(reader, filenames, verify=True, **kwargs)
+            lenient_time = time_read(reader, filenames, verify=False, **kwargs)
+            print("{0}: {1} files read in {2:.3f} s with verify=True, {3:.3f} s with "
+                  "verify=False, speed-up x{4:.1f}".format(
+                      name, len(filenames), strict_time, lenient_time,
+                      strict_time / lenient_time))
+
+
+if __name__ == "__main__":
+    main()
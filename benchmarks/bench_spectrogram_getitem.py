@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark slicing of IRISSpectrogramCube.
+
+Compares the time taken to index single exposures and slit rows of a cube
+with the time taken by the previous implementation, which built each slice
+twice, deep-copying extra coords and re-checking meta and extra coords.
+
+Usage: python benchmarks/bench_spectrogram_getitem.py
+"""
+import os
+import tempfile
+import timeit
+
+from ndcube.mixins import NDCubeSlicingMixin
+from ndcube.utils.cube import convert_extra_coords_dict_to_input_format
+
+from irispy.spectrograph import IRISSpectrogramCube, read_iris_spectrograph_level2_fits
+from irispy.tests.helpers import write_synthetic_raster_file
+
+N_RASTER_POSITIONS = 400
+N_SLIT_PIXELS = 64
+N_REPEATS = 5
+
+
+def previous_getitem(cube, item):
+    """Slices cube as IRISSpectrogramCube.__getitem__ did before the fast path."""
+    kwargs = cube._slice(item)
+    kwargs["extra_coords"] = NDCubeSlicingMixin._slice_extra_coords(
+        cube, item, kwargs["missing_axis"])
+    result = IRISSpectrogramCube(**kwargs)
+    return IRISSpectrogramCube(
+        result.data, result.wcs, result.uncertainty, result.unit, result.meta,
+        convert_extra_coords_dict_to_input_format(result.extra_coords, result.missing_axis),
+        mask=result.mask, missing_axis=result.missing_axis)
+
+
+def time_slicing(function, cube, items):
+    return min(timeit.repeat(lambda: [function(cube, item) for item in items],
+                             number=1, repeat=N_REPEATS)) / len(items)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "raster_r00000.fits")
+        write_synthetic_raster_file(filename, n_raster_positions=N_RASTER_POSITIONS,
+                                    n_slit_pixels=N_SLIT_PIXELS)
+        raster = read_iris_spectrograph_level2_fits(filename)
+    cube = raster.data["Si IV 1394"][0]
+    benchmarks = [("exposure", [i for i in range(N_RASTER_POSITIONS)]),
+                  ("slit row", [(slice(None), i) for i in range(N_SLIT_PIXELS)])]
+    print("Cube shape: {0}".format(cube.data.shape))
+    for name, items in benchmarks:
+        array_time = time_slicing(lambda cube, item: cube.data[item], cube, items)
+        previous_time = time_slicing(previous_getitem, cube, items)
+        fast_time = time_slicing(lambda cube, item: cube[item], cube, items)
+        print("Per {0} slice: ndarray {1:.2e} s, previous {2:.2e} s, "
+              "current {3:.2e} s, speed-up x{4:.1f}".format(
+                  name, array_time, previous_time, fast_time, previous_time / fast_time))
+
+
+if __name__ == "__main__":
+    main()
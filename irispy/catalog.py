@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a persistent catalog of IRIS level 2 FITS files.
+"""
+
+import os
+import glob
+import sqlite3
+
+from astropy.io import fits
+from sunpy.time import parse_time
+
+__all__ = ['IRISLevel2Catalog', 'CatalogQuery']
+
+# Values of INSTRUME keyword in level 2 files.
+SPECTROGRAPH_INSTRUMENT = "SPEC"
+SJI_INSTRUMENT = "SJI"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    mtime REAL,
+    instrument TEXT,
+    obsid TEXT,
+    obs_desc TEXT,
+    startobs TEXT,
+    endobs TEXT,
+    date_obs TEXT,
+    date_end TEXT,
+    nrasterp INTEGER
+);
+CREATE TABLE IF NOT EXISTS windows (
+    filename TEXT,
+    window_index INTEGER,
+    spectral_window TEXT,
+    detector TEXT,
+    brightest_wavelength REAL,
+    min_wavelength REAL,
+    max_wavelength REAL
+);
+CREATE INDEX IF NOT EXISTS files_time ON files (date_obs, date_end);
+CREATE INDEX IF NOT EXISTS files_obsid ON files (obsid);
+CREATE INDEX IF NOT EXISTS windows_filename ON windows (filename);
+CREATE INDEX IF NOT EXISTS windows_spectral_window ON windows (spectral_window);
+"""
+
+
+class IRISLevel2Catalog(object):
+    """
+    A persistent SQLite catalog of IRIS level 2 spectrograph and SJI files.
+
+    The catalog stores the primary header keywords of each file that are used by
+    `irispy.spectrograph.read_iris_spectrograph_level2_fits` and
+    `irispy.sji.read_iris_sji_level2_fits` to select files, so that files
+    covering a time range or containing a spectral window can be found without
+    opening them.
+
+    Parameters
+    ----------
+    database: `str`
+        Path of the SQLite database file.  It is created if it does not exist.
+        ":memory:" gives a catalog that is not persisted.
+
+    Examples
+    --------
+    >>> from irispy.catalog import IRISLevel2Catalog
+    >>> from irispy.spectrograph import read_iris_spectrograph_level2_fits
+    >>> catalog = IRISLevel2Catalog("iris_level2.db")  # doctest: +SKIP
+    >>> catalog.update("/data/iris/level2")  # doctest: +SKIP
+    >>> query = catalog.query(start_time="2017-02-22 15:00", end_time="2017-02-22 16:00",
+    ...                       spectral_window="Si IV 1403")  # doctest: +SKIP
+    >>> raster = read_iris_spectrograph_level2_fits(query)  # doctest: +SKIP
+
+    """
+    def __init__(self, database):
+        self.database = database
+        self._connection = sqlite3.connect(database)
+        self._connection.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return "<IRISLevel2Catalog database={0} files={1}>".format(self.database, len(self))
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes the connection to the database."""
+        self._connection.close()
+
+    def update(self, paths, pattern="*.fits", prune=False):
+        """
+        Ingests files into the catalog.
+
+        Files already in the catalog are only re-read if their modification
+        time has changed since they were ingested.
+
+        Parameters
+        ----------
+        paths: `str` or iterable of `str`
+            Files and/or directories to ingest.  Directories are searched
+            recursively for files matching pattern.
+
+        pattern: `str`
+            Glob pattern of files to ingest from directories.  Default="*.fits"
+
+        prune: `bool`
+            If True, entries of files that no longer exist are removed from the catalog.
+            Default=False
+
+        Returns
+        -------
+        n_ingested: `int`
+            Number of files (re-)ingested.
+
+        """
+        if type(paths) is str:
+            paths = [paths]
+        filenames = []
+        for path in paths:
+            if os.path.isdir(path):
+                filenames += glob.glob(os.path.join(path, "**", pattern), recursive=True)
+            else:
+                filenames.append(path)
+        catalog_mtimes = dict(self._connection.execute("SELECT filename, mtime FROM files"))
+        n_ingested = 0
+        with self._connection:
+            for filename in filenames:
+                filename = os.path.abspath(filename)
+                mtime = os.path.getmtime(filename)
+                if catalog_mtimes.get(filename) == mtime:
+                    continue
+                self._ingest(filename, mtime)
+                n_ingested += 1
+            if prune:
+                for filename in catalog_mtimes.keys():
+                    if not os.path.exists(filename):
+                        self._remove(filename)
+        return n_ingested
+
+    def query(self, start_time=None, end_time=None, obsid=None, spectral_window=None,
+              detector=None):
+        """
+        Returns a query of the catalog.
+
+        The query can be passed to the level 2 readers in place of a list of filenames.
+        Criteria left as None are not applied.
+
+        Parameters
+        ----------
+        start_time: `str` or `datetime.datetime`
+            Only select files observing at or after this time.
+
+        end_time: `str` or `datetime.datetime`
+            Only select files observing at or before this time.
+
+        obsid: `int` or `str`
+            Only select files from this OBS ID.
+
+        spectral_window: `str` or iterable of `str`
+            Only select files containing one of these spectral windows, e.g. "Si IV 1403".
+            For SJI files, this is the TDESC1 keyword, e.g. "SJI_1400".
+
+        detector: `str`
+            Only select files containing a window observed by this detector.
+            Matches detector types starting with this value, so "FUV" selects both
+            "FUV1" and "FUV2".
+
+        Returns
+        -------
+        query: `irispy.catalog.CatalogQuery`
+
+        """
+        return CatalogQuery(self, start_time=start_time, end_time=end_time, obsid=obsid,
+                            spectral_window=spectral_window, detector=detector)
+
+    def _ingest(self, filename, mtime):
+        hdulist = fits.open(filename, lazy_load_hdus=True)
+        header = hdulist[0].header
+        hdulist.close()
+        instrument = header.get("INSTRUME", "").strip()
+        startobs = _to_iso(header.get("STARTOBS"))
+        endobs = _to_iso(header.get("ENDOBS"))
+        date_obs = _to_iso(header.get("DATE_OBS")) or startobs
+        date_end = _to_iso(header.get("DATE_END")) or endobs
+        self._remove(filename)
+        self._connection.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (filename, mtime, instrument, str(header.get("OBSID")), header.get("OBS_DESC"),
+             startobs, endobs, date_obs, date_end, header.get("NRASTERP")))
+        n_windows = header.get("NWIN", 1 if "TDESC1" in header or "TWAVE1" in header else 0)
+        for i in range(1, n_windows + 1):
+            self._connection.execute(
+                "INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, i, header.get("TDESC{0}".format(i)),
+                 header.get("TDET{0}".format(i), instrument),
+                 header.get("TWAVE{0}".format(i)), header.get("TWMIN{0}".format(i)),
+                 header.get("TWMAX{0}".format(i))))
+
+    def _remove(self, filename):
+        self._connection.execute("DELETE FROM files WHERE filename = ?", (filename,))
+        self._connection.execute("DELETE FROM windows WHERE filename = ?", (filename,))
+
+
+class CatalogQuery(object):
+    """
+    A query of an `irispy.catalog.IRISLevel2Catalog`.
+
+    A CatalogQuery can be passed to `irispy.spectrograph.read_iris_spectrograph_level2_fits`
+    or `irispy.sji.read_iris_sji_level2_fits` in place of a list of filenames.  Each
+    reader only selects files of its own instrument.  Iterating over a CatalogQuery
+    yields the filenames of all instruments matching the query.
+
+    Parameters
+    ----------
+    catalog: `irispy.catalog.IRISLevel2Catalog`
+        Catalog to query.
+
+    start_time, end_time, obsid, spectral_window, detector:
+        See `irispy.catalog.IRISLevel2Catalog.query`.
+
+    """
+    def __init__(self, catalog, start_time=None, end_time=None, obsid=None,
+                 spectral_window=None, detector=None):
+        self.catalog = catalog
+        self.start_time = start_time
+        self.end_time = end_time
+        self.obsid = obsid
+        if type(spectral_window) is str:
+            spectral_window = [spectral_window]
+        self.spectral_window = spectral_window
+        self.detector = detector
+
+    def __iter__(self):
+        return iter(self.filenames())
+
+    def __len__(self):
+        return len(self.filenames())
+
+    def filenames(self, instrument=None):
+        """
+        Returns the filenames matching the query, ordered by observation time.
+
+        Parameters
+        ----------
+        instrument: `str` or `None`
+            If set, only select files with this value of the INSTRUME keyword,
+            i.e. "SPEC" or "SJI".  Default=None
+
+        Returns
+        -------
+        filenames: `list` of `str`
+
+        """
+        conditions = []
+        parameters = []
+        if instrument is not None:
+            conditions.append("files.instrument = ?")
+            parameters.append(instrument)
+        if self.start_time is not None:
+            conditions.append("files.date_end >= ?")
+            parameters.append(_to_iso(self.start_time))
+        if self.end_time is not None:
+            conditions.append("files.date_obs <= ?")
+            parameters.append(_to_iso(self.end_time))
+        if self.obsid is not None:
+            conditions.append("files.obsid = ?")
+            parameters.append(str(self.obsid))
+        if self.spectral_window is not None:
+            conditions.append("windows.spectral_window IN ({0})".format(
+                ", ".join(["?"] * len(self.spectral_window))))
+            parameters += list(self.spectral_window)
+        if self.detector is not None:
+            conditions.append("windows.detector LIKE ?")
+            parameters.append("{0}%".format(self.detector))
+        sql = ("SELECT DISTINCT files.filename, files.date_obs FROM files "
+               "LEFT JOIN windows ON files.filename = windows.filename")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY files.date_obs, files.filename"
+        return [row[0] for row in self.catalog._connection.execute(sql, parameters)]
+
+
+def _to_iso(time):
+    # Converts a time to an ISO string, which SQLite can compare, or
+    # None if it cannot be parsed.
+    if time is None:
+        return None
+    try:
+        time = parse_time(time)
+    except ValueError:
+        return None
+    # Newer versions of sunpy return an astropy Time rather than a datetime.
+    return getattr(time, "datetime", time).isoformat()
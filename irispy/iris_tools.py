@@ -4,15 +4,19 @@
 """Some IRIS instrument tools."""
 
 import datetime
+import json
 import warnings
+import functools
 import os.path
 
 import numpy as np
 import astropy.units as u
 from astropy.units.quantity import Quantity
-from astropy.modeling import fitting
+from astropy.nddata import StdDevUncertainty
 from astropy.modeling.models import custom_model
 from astropy import constants
+from astropy.table import Table
+from astropy.convolution import convolve, Box1DKernel
 import scipy.io
 from scipy import ndimage
 from scipy import interpolate
@@ -52,6 +56,14 @@ RESPONSE_VERSION_FILENAMES = {"1": "iris_sra_20130211.geny",
                               "2": "iris_sra_20130715.geny",
                               "3": "iris_sra_c_20150331.geny",
                               "4": "iris_sra_c_20161022.geny"}
+# Times in response files are in seconds since this time.
+RESPONSE_TIME_REFERENCE = np.datetime64("1979-01-01T00:00:00", "us")
+SECONDS_PER_YEAR = 365.25 * 86400.
+# Wavelength ranges of FUV CCDs 1 and 2 and of the NUV CCD over which time
+# dependent spectrograph effective areas are defined, as in SSW's
+# iris_get_response.  Effective areas are zero outside them.
+SG_WAVELENGTH_RANGES = {"FUV": Quantity([[133.17, 135.84], [138.90, 140.70]], unit=u.nm),
+                        "NUV": Quantity([[278.20, 283.50]], unit=u.nm)}
 
 # Define some custom error messages.
 APPLY_EXPOSURE_TIME_ERROR = ("Exposure time correction has probably already "
@@ -66,12 +78,25 @@ UNDO_EXPOSURE_TIME_ERROR = ("Exposure time correction has probably already "
 # Define whether IRIS WCS is 0 or 1 origin based.
 WCS_ORIGIN = 1
 
+# In-process cache of parsed response files keyed by (path, version, mtime).
+_IRIS_RESPONSE_CACHE = {}
+# Cache of time dependent effective area splines keyed by
+# (detector type, response version, day since RESPONSE_TIME_REFERENCE).
+_TIME_DEPENDENT_EFFECTIVE_AREA_CACHE = {}
+
 def get_iris_response(pre_launch=False, response_file=None, response_version=None,
-                      force_download=False):
+                      force_download=False, use_cache=True, persistent_cache=False):
     """Returns IRIS response structure.
 
     One and only one of pre_launch, response_file and response_version must be set.
 
+    Parsed response files are cached in memory so that repeated calls do not
+    re-read them.  The cache is keyed by the file's path, version and modification
+    time so a changed file is re-read.  It can be emptied with
+    `irispy.iris_tools.clear_iris_response_cache`.  Arrays of a cached response
+    are shared between calls and so are read-only.  Set use_cache=False, or copy
+    them, to change them.
+
     Parameters
     ----------
     pre_launch: `bool`
@@ -83,6 +108,13 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
     response_version : `int`
         Version number of effective area file to be used. Cannot be set
         simultaneously with response_file or pre_launch kwarg. Default=latest
+    use_cache: `bool`
+        If True, a response parsed by a previous call is returned if the
+        file has not changed since.  Default=True
+    persistent_cache: `bool`
+        If True, the contents of the response file are also stored next to it
+        as a .npz file of plain arrays which is read instead of the response
+        file in future, e.g. by other processes, if it is newer.  Default=False
 
     Returns
     -------
@@ -99,14 +131,15 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
         comment: `str`
         version: `int`
         version_date: `datetime.datetime`
+        c_f_time, c_n_time, c_s_time: `numpy.ndarray` of `numpy.datetime64`
+            Only for version 3 and above.
 
     Notes
     -----
-    This routine does not calculate time dependent effective areas using
-    version 3 and above of the response functions as is done in the SSW version
-    of this code.  Therefore, asking it to read a version 3 or above response
-    function will result in an error.  This code should be updated in future
-    versions to calculate time dependent effective areas.
+    The effective areas of response files of version 3 and above are time
+    dependent and so are set to zero in the returned structure.  They can be
+    calculated for given observation times with
+    `irispy.iris_tools.calculate_time_dependent_sg_effective_area`.
 
     """
     # Ensures the file exits in the path given.
@@ -139,8 +172,8 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
         if response_version > 2:
             warnings.warn("Effective areas are not available (i.e. set  to zero).  "
                   "For response file versions > 2 time dependent effective "
-                  "areas must be calculated via fitting, which is not supported "
-                  "by this function at this time. "
+                  "areas must be calculated with "
+                  "irispy.iris_tools.calculate_time_dependent_sg_effective_area. "
                   "Version of this response file = {0}".format(response_version))
         # Define the directory in which the response file should exist
         # to be the sunpy download directory.
@@ -152,10 +185,15 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
         # Define response file as path + filename.
         response_file = os.path.join(download_dir, response_filename)
 
+    # Return cached response if file has not changed since it was parsed.
+    cache_key = (os.path.abspath(response_file), response_version,
+                 os.path.getmtime(response_file))
+    if use_cache and cache_key in _IRIS_RESPONSE_CACHE:
+        return dict(_IRIS_RESPONSE_CACHE[cache_key])
     # Read response file and store in a dictionary.
-    raw_response_data = scipy.io.readsav(response_file)
-    iris_response = dict([(name, raw_response_data["p0"][name][0])
-                          for name in raw_response_data["p0"].dtype.names])
+    raw_response_data = _read_raw_iris_response(response_file, persistent_cache)
+    iris_response = dict([(name, raw_response_data[name][0])
+                          for name in raw_response_data.dtype.names])
     # Convert some properties to more convenient types.
     iris_response["LAMBDA"] = Quantity(iris_response["LAMBDA"], unit=u.nm)
     iris_response["AREA_SG"] = Quantity(iris_response["AREA_SG"], unit=u.cm**2)
@@ -171,35 +209,20 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
             iris_response["DATE_OBS"] = parse_time(iris_response["DATE_OBS"])
         except:
             iris_response["DATE_OBS"] = None
-        # Convert C_F_TIME to array of datetime objects while
-        # conserving shape.
-        c_f_time = np.empty(iris_response["C_F_TIME"].shape, dtype=object)
-        for i, row in enumerate(iris_response["C_F_TIME"]):
-            for j, t in enumerate(row):
-                c_f_time[i][j] = parse_time(float(t))
-        iris_response["C_F_TIME"] = c_f_time
-        # Convert C_F_LAMBDA to Quantity.
+        # Convert time tables, given in seconds since
+        # RESPONSE_TIME_REFERENCE, to datetime64 arrays while conserving shape.
+        for name in ["C_F_TIME", "C_N_TIME", "C_S_TIME"]:
+            iris_response[name] = _convert_response_times(iris_response[name])
+        # Convert C_F_LAMBDA and C_N_LAMBDA to Quantity.
         iris_response["C_F_LAMBDA"] = Quantity(iris_response["C_F_LAMBDA"], unit="nm")
-        # Convert C_N_TIME to array of datetime objects while
-        # conserving shape.
-        c_n_time = np.empty(iris_response["C_N_TIME"].shape, dtype=object)
-        for i, row in enumerate(iris_response["C_N_TIME"]):
-            for j, t in enumerate(row):
-                c_n_time[i][j] = parse_time(float(t))
-        iris_response["C_N_TIME"] = c_n_time
-        # Convert C_N_LAMBDA to Quantity.
         iris_response["C_N_LAMBDA"] = Quantity(iris_response["C_N_LAMBDA"], unit="nm")
-        # Convert C_S_TIME to array of datetime objects while
-        # conserving shape.
-        c_s_time = np.empty(iris_response["C_S_TIME"].shape, dtype=object)
-        for i, row in enumerate(iris_response["C_S_TIME"]):
-            for j, column in enumerate(row):
-                for k, t in enumerate(column):
-                    c_s_time[i][j][k] = parse_time(float(t))
-        iris_response["C_S_TIME"] = c_s_time
-        # Convert DATE in ELEMENTS array to array of datetime objects.
-        for i, t in enumerate(iris_response["ELEMENTS"]["DATE"]):
-            iris_response["ELEMENTS"]["DATE"][i] = parse_time(t.decode())
+        # Convert DATE in ELEMENTS array to datetime64, parsing each
+        # distinct date string only once.
+        element_dates, date_indices = np.unique(iris_response["ELEMENTS"]["DATE"],
+                                                return_inverse=True)
+        element_dates = np.array([_to_datetime64(parse_time(date.decode()))
+                                  for date in element_dates])
+        iris_response["ELEMENTS"]["DATE"][:] = element_dates[date_indices.ravel()]
         # Convert VERSION_DATE to datetime object.
         iris_response["VERSION_DATE"] = parse_time(iris_response["VERSION_DATE"].decode())
     else:
@@ -209,8 +232,109 @@ def get_iris_response(pre_launch=False, response_file=None, response_version=Non
                                                           int(iris_response["DATE"][4:6]),
                                                           int(iris_response["DATE"][6:8]))
         del(iris_response["DATE"])
+    if use_cache:
+        # Cached arrays are shared rather than copied on each call.
+        for value in iris_response.values():
+            _set_read_only(value)
+        _IRIS_RESPONSE_CACHE[cache_key] = iris_response
+        iris_response = dict(iris_response)
     return iris_response
 
+def _set_read_only(value):
+    # Makes an array, and any arrays it holds as objects or record
+    # fields, read-only.
+    if isinstance(value, np.ndarray):
+        if value.dtype.names:
+            for name in value.dtype.names:
+                _set_read_only(value[name])
+        elif value.dtype == object:
+            for item in value.flat:
+                _set_read_only(item)
+        value.flags.writeable = False
+
+def _convert_response_times(seconds):
+    # Converts array of seconds since RESPONSE_TIME_REFERENCE to
+    # datetime64 array of the same shape.
+    seconds = np.round(np.asarray(seconds, dtype=float) * 1e6)
+    return RESPONSE_TIME_REFERENCE + seconds.astype("timedelta64[us]")
+
+def _to_datetime64(time):
+    # Converts output of parse_time to datetime64.  Newer versions of
+    # sunpy return an astropy Time rather than a datetime.
+    return np.datetime64(getattr(time, "datetime", time), "us")
+
+def clear_iris_response_cache():
+    """
+    Empties the in-memory caches of response files parsed by `get_iris_response`.
+
+    Effective area interpolations derived from the response files are also cleared.
+    """
+    _IRIS_RESPONSE_CACHE.clear()
+    _get_effective_area_spline.cache_clear()
+    _evaluate_effective_area_spline.cache_clear()
+    _TIME_DEPENDENT_EFFECTIVE_AREA_CACHE.clear()
+
+def _read_raw_iris_response(response_file, persistent_cache=False):
+    # Returns the p0 structure of a response file.  If persistent_cache
+    # is True, it is read from/written to a .npz file next to the
+    # response file which is faster to read than the IDL save file.  The
+    # .npz file only holds plain arrays and a JSON description of how to
+    # reassemble them so it is loaded without unpickling.
+    npz_file = response_file + ".npz"
+    if persistent_cache and os.path.isfile(npz_file) and \
+            os.path.getmtime(npz_file) >= os.path.getmtime(response_file):
+        try:
+            with np.load(npz_file, allow_pickle=False) as npz:
+                arrays = dict(npz.items())
+            return _decode_response_structure(json.loads(str(arrays.pop("structure"))),
+                                              arrays)
+        except (KeyError, ValueError):
+            # Cache written in an older format, e.g. with pickled objects,
+            # is replaced.
+            pass
+    p0 = scipy.io.readsav(response_file)["p0"]
+    if persistent_cache:
+        arrays = {}
+        structure = _encode_response_structure(p0, arrays)
+        try:
+            np.savez(npz_file, structure=json.dumps(structure), **arrays)
+        except OSError:
+            warnings.warn("Could not write persistent response cache {0}".format(npz_file))
+    return p0
+
+def _encode_response_structure(value, arrays):
+    # Describes value, a record, object or plain array or a scalar as read
+    # by scipy.io.readsav, as a JSON serializable structure.  Plain arrays
+    # and scalars are added to arrays and referred to by their key.
+    if isinstance(value, np.ndarray) and value.dtype.names:
+        return {"kind": "record", "shape": list(value.shape),
+                "fields": [[name, _encode_response_structure(value[name], arrays)]
+                           for name in value.dtype.names]}
+    if isinstance(value, np.ndarray) and value.dtype == object:
+        return {"kind": "object", "shape": list(value.shape),
+                "items": [_encode_response_structure(item, arrays) for item in value.flat]}
+    key = "array{0}".format(len(arrays))
+    arrays[key] = np.asarray(value)
+    if isinstance(value, np.ndarray):
+        return {"kind": "array", "key": key}
+    return {"kind": "scalar", "key": key}
+
+def _decode_response_structure(structure, arrays):
+    # Inverse of _encode_response_structure.
+    kind = structure["kind"]
+    if kind == "record":
+        return np.rec.fromarrays(
+            [_decode_response_structure(field, arrays) for _, field in structure["fields"]],
+            names=[name for name, _ in structure["fields"]], shape=tuple(structure["shape"]))
+    if kind == "object":
+        value = np.empty(len(structure["items"]), dtype=object)
+        for i, item in enumerate(structure["items"]):
+            value[i] = _decode_response_structure(item, arrays)
+        return value.reshape(structure["shape"])
+    if kind == "array":
+        return arrays[structure["key"]]
+    return arrays[structure["key"]][()]
+
 
 @custom_model
 def _gaussian1d_on_linear_bg(x, amplitude=None, mean=None, standard_deviation=None,
@@ -218,9 +342,174 @@ def _gaussian1d_on_linear_bg(x, amplitude=None, mean=None, standard_deviation=No
     return amplitude * np.exp(-((x - mean) / standard_deviation) ** 2) + constant_term + linear_term * x
 
 
-def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_pixel_range=None,
-                                            spline_smoothing=False, fit_individual_profiles=False,
-                                            spacecraft_velocity=None, orbital_phase=None, roll_angle=None):
+def _evaluate_gaussian1d_on_linear_bg(x, parameters):
+    # Evaluates _gaussian1d_on_linear_bg for many parameter sets at once.
+    # parameters has shape (..., 5) in the order amplitude, mean,
+    # standard_deviation, constant_term, linear_term.  Returns array of
+    # shape (..., len(x)).
+    amplitude, mean, standard_deviation, constant_term, linear_term = \
+        [p[..., np.newaxis] for p in np.moveaxis(parameters, -1, 0)]
+    return amplitude * np.exp(-((x - mean) / standard_deviation) ** 2) + \
+        constant_term + linear_term * x
+
+
+def _jacobian_gaussian1d_on_linear_bg(x, parameters):
+    # Derivatives of _evaluate_gaussian1d_on_linear_bg w.r.t. each
+    # parameter.  Returns array of shape (..., len(x), 5).
+    amplitude, mean, standard_deviation, constant_term, linear_term = \
+        [p[..., np.newaxis] for p in np.moveaxis(parameters, -1, 0)]
+    z = (x - mean) / standard_deviation
+    gaussian = np.exp(-z ** 2)
+    d_mean = amplitude * gaussian * 2 * z / standard_deviation
+    return np.stack([gaussian, d_mean, d_mean * z, np.ones_like(d_mean),
+                     np.broadcast_to(x, d_mean.shape)], axis=-1)
+
+
+def _evaluate_double_gaussian1d_on_linear_bg(x, parameters):
+    # Evaluates two Gaussians on a linear background for many parameter
+    # sets at once.  parameters has shape (..., 8) in the order amplitude,
+    # mean and standard_deviation of each Gaussian, then constant_term,
+    # linear_term.  Returns array of shape (..., len(x)).
+    second_gaussian = np.concatenate([parameters[..., 3:6],
+                                      np.zeros(parameters.shape[:-1] + (2,))], axis=-1)
+    return _evaluate_gaussian1d_on_linear_bg(x, parameters[..., [0, 1, 2, 6, 7]]) + \
+        _evaluate_gaussian1d_on_linear_bg(x, second_gaussian)
+
+
+def _jacobian_double_gaussian1d_on_linear_bg(x, parameters):
+    # Derivatives of _evaluate_double_gaussian1d_on_linear_bg w.r.t. each
+    # parameter.  Returns array of shape (..., len(x), 8).
+    first = _jacobian_gaussian1d_on_linear_bg(x, parameters[..., [0, 1, 2, 6, 7]])
+    second = _jacobian_gaussian1d_on_linear_bg(x, parameters[..., [3, 4, 5, 6, 7]])
+    return np.concatenate([first[..., :3], second[..., :3], first[..., 3:]], axis=-1)
+
+
+def _fit_batched_levenberg_marquardt(function, jacobian, x, y, initial_parameters,
+                                     max_iterations=200, tolerance=1e-10, weights=None):
+    """
+    Fits a model to many data series simultaneously by Levenberg-Marquardt least squares.
+
+    All series are iterated together as arrays.  Each series has its own damping
+    factor and stops being updated once it has converged.
+
+    Parameters
+    ----------
+    function: function
+        function(x, parameters) returning model of shape (n_series, len(x))
+        for parameters of shape (n_series, n_parameters).
+
+    jacobian: function
+        jacobian(x, parameters) returning derivatives of the model w.r.t. each
+        parameter of shape (n_series, len(x), n_parameters).
+
+    x: `numpy.ndarray`
+        1-D array of independent variable shared by all series.
+
+    y: `numpy.ndarray`
+        Data of shape (n_series, len(x)).
+
+    initial_parameters: `numpy.ndarray`
+        Initial guesses of shape (n_series, n_parameters) or (n_parameters,)
+        if the same guess is used for all series.
+
+    max_iterations: `int`
+        Maximum number of iterations.  Default=200
+
+    tolerance: `float`
+        Series are considered converged when the relative change in their sum of
+        squared residuals between successful iterations is below this value.
+        Default=1e-10
+
+    weights: `numpy.ndarray` or `None`
+        Weights by which residuals are multiplied, e.g. inverse uncertainties.
+        Must be broadcastable to y.  Points with zero weight are ignored.
+        Default=None, implies all points have unit weight.
+
+    Returns
+    -------
+    parameters: `numpy.ndarray`
+        Best-fit parameters of shape (n_series, n_parameters).  Series containing
+        non-finite data with non-zero weight, or fewer points with non-zero weight
+        than parameters, are not fit and their parameters are NaN.
+
+    converged: `numpy.ndarray` of `bool`
+        Whether each series converged within max_iterations.
+
+    """
+    y = np.asarray(y, dtype=float)
+    parameters = np.array(np.broadcast_to(initial_parameters,
+                                          (len(y), np.shape(initial_parameters)[-1])),
+                          dtype=float)
+    n_parameters = parameters.shape[-1]
+    if weights is None:
+        weights = np.ones(y.shape)
+    else:
+        weights = np.broadcast_to(weights, y.shape)
+        y = np.where(weights != 0, y, 0.)
+    finite = np.isfinite(y).all(axis=-1) & np.isfinite(weights).all(axis=-1) & \
+        ((weights != 0).sum(axis=-1) >= n_parameters)
+    parameters[~finite] = np.nan
+    converged = np.zeros(len(y), dtype=bool)
+    active = finite.copy()
+    damping = np.full(len(y), 1e-3)
+    residuals = weights * (y - function(x, parameters))
+    chi2 = np.sum(residuals ** 2, axis=-1)
+    diagonal = np.arange(n_parameters)
+    for i in range(max_iterations):
+        if not active.any():
+            break
+        index = np.nonzero(active)[0]
+        jac = jacobian(x, parameters[index]) * weights[index, :, np.newaxis]
+        hessian = np.einsum("nmi,nmj->nij", jac, jac)
+        gradient = np.einsum("nmi,nm->ni", jac, residuals[index])
+        # Damp diagonal of approximate hessian.  Small constant keeps it
+        # invertible when a parameter has no effect on the model.
+        hessian[:, diagonal, diagonal] *= 1 + damping[index, np.newaxis]
+        hessian[:, diagonal, diagonal] += 1e-30
+        try:
+            step = np.linalg.solve(hessian, gradient[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.einsum("nij,nj->ni", np.linalg.pinv(hessian), gradient)
+        new_parameters = parameters[index] + step
+        new_residuals = weights[index] * (y[index] - function(x, new_parameters))
+        new_chi2 = np.sum(new_residuals ** 2, axis=-1)
+        # Accept steps that reduce the residuals and reduce damping.
+        # Otherwise increase damping and try again next iteration.
+        improved = np.isfinite(new_chi2) & (new_chi2 <= chi2[index])
+        accepted = index[improved]
+        relative_change = (chi2[accepted] - new_chi2[improved]) / \
+            np.maximum(chi2[accepted], np.finfo(float).tiny)
+        parameters[accepted] = new_parameters[improved]
+        residuals[accepted] = new_residuals[improved]
+        chi2[accepted] = new_chi2[improved]
+        damping[accepted] /= 10.
+        damping[index[~improved]] *= 10.
+        # Mark series as converged when the improvement becomes negligible
+        # or when no step can improve them.
+        converged[accepted[relative_change < tolerance]] = True
+        converged[index[~improved & (damping[index] > 1e10)]] = True
+        active &= ~converged
+    return parameters, converged
+
+
+def _get_nii_wavelength_slice(wavelength):
+    # Returns slice of wavelength axis covering Ni I 2799 line.  Slice
+    # contains at least 5 pixels, the minimum required for a gaussian fit.
+    wavelength = wavelength.to(u.Angstrom).value
+    wavelength_roi_index = np.nonzero(np.logical_and(wavelength >= 2799.3,
+                                                     wavelength <= 2799.8))[0]
+    if len(wavelength_roi_index) == 0:
+        raise ValueError("Wavelength range of data does not include Ni I 2799 line.")
+    start = wavelength_roi_index[0]
+    stop = max(wavelength_roi_index[-1] + 1, min(start + 5, len(wavelength)))
+    return slice(max(min(start, stop - 5), 0), stop)
+
+
+def _calculate_orbital_wavelength_variation(data, wavelength, times, date_data_created=None,
+                                            slit_pixel_range=None, spline_smoothing=False,
+                                            fit_individual_profiles=False,
+                                            spacecraft_velocity=None, orbital_phase=None,
+                                            roll_angle=None):
     """Calculates orbital corrections of spectral line positions using level 2 files.
 
     For data generated from the April 2014 pipeline, thermal and spacecraft velocity components
@@ -230,12 +519,28 @@ def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_
 
     Parameters
     ----------
-    data_array: `xarray.DataArray`
-        IRIS spectrograph data from spectral window Mg II k 2796 as generated by
-        `sunpy.spectra.sources.IRISRaster.`
-    date_data_created: `datetime.datetime`
+    data: `numpy.ndarray` or `numpy.ma.MaskedArray`
+        IRIS spectrograph data from spectral window Mg II k 2796 of shape
+        (exposures, slit pixels, wavelengths).  Masked and non-finite values
+        are ignored.
+    wavelength: `astropy.units.Quantity`
+        Wavelength of each pixel along the spectral axis of data.
+    times: `numpy.ndarray` of `numpy.datetime64`
+        Time of each exposure in data.
+    date_data_created: `datetime.datetime` or `None`
         Date the data was created by IRIS pipeline.  Used to determine where spacecraft
-        velocity etc. needs to be accounted for.
+        velocity etc. needs to be accounted for.  Default=None, implies data were
+        created by the April 2014 pipeline or later.
+    slit_pixel_range: `tuple` of length 2
+        Lower and upper bounds of section of slit over which to average line fits.
+        Default=None, implies whole slit.
+    spline_smoothing: `bool`
+        If True, variation is smoothed to eliminate 5 minute photospheric
+        oscillations.  Default=False
+    fit_individual_profiles: `bool`
+        If True, line is fit in each slit pixel (averaged with its 4 nearest neighbours)
+        and the line positions averaged.  Otherwise the slit averaged line profile
+        is fit.  Default=False
     spacecraft_velocity: `astropy.units.quantity.Quantity`
         Velocity of spacecraft at each exposure in data_array.
         Must be set if date_data_created < 1 April 2014.
@@ -250,11 +555,11 @@ def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_
     -------
     orbital_wavelength_variation: `astropy.table.Table`
         Contains the following columns:
-        time: `datetime.datetime` objects
+        time: `numpy.datetime64`
             Observation times of wavelength variations.
-        FUV: `astropy.quantity.Quantity`
+        wavelength variation FUV: `astropy.quantity.Quantity`
             Wavelength variation in the FUV.
-        NUV: `astropy.quantity.Quantity`
+        wavelength variation NUV: `astropy.quantity.Quantity`
             Wavelength variation in the NUV.
 
     """
@@ -264,120 +569,92 @@ def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_
     specsize = 0.0255
     # Define date of new pipeline.
     date_new_pipeline = datetime.datetime(2014, 4, 1)
-    if date_data_created < date_new_pipeline:
-        # Check that there are measurement times with good values of
-        # spacecraft velocity and orbital phase.
-        bad_aux = np.asarray(np.isfinite(spacecraft_velocity) * np.isfinite(orbital_phase) * (-1), dtype=bool)
-    # Generate wavelength vector containing only Ni I line.
-    wavelength_window = Quantity(data_array.coords["wavelength"].values,
-                                 unit=data_array.attrs["units"]["wavelength"])
-    wavelength_roi_index = np.arange(len(wavelength_window))[
-        np.logical_and(wavelength_window >= 2799.3 * u.Angstrom, wavelength_window <= 2799.8 * u.Angstrom)]
-    # Check that there are at least 5 points in wavelength region.
-    # Must have at least this many for a gaussian fit.
-    if len(wavelength_roi_index) < 5:
-        wavelength_roi_index = np.arange(5) + wavelength_roi_index[0]
-    # Extract wavelength of region around Ni I line as array in units
-    # of Angstroms.
-    wavelength_roi = wavelength_window.to(u.Angstrom).value[wavelength_roi_index]
-    # Keep only data within wavelength region of interest.
-    data_array = data_array.isel(spectral_axis=slice(wavelength_roi_index[0], wavelength_roi_index[-1] + 1))
+    old_pipeline = date_data_created is not None and date_data_created < date_new_pipeline
+    times = np.atleast_1d(np.asarray(times, dtype="datetime64[us]"))
+    # Keep only data within wavelength region around Ni I line and
+    # extract its wavelengths as array in units of Angstroms.
+    wavelength_roi_slice = _get_nii_wavelength_slice(wavelength)
+    wavelength_roi = wavelength.to(u.Angstrom).value[wavelength_roi_slice]
+    data = np.ma.masked_invalid(data[..., wavelength_roi_slice])
     # If user selected a sub-region of the slit, reduce data to just
     # that region.
     if slit_pixel_range:
         if len(slit_pixel_range) == 2:
-            data_array = data_array.isel(slit_axis, slice(slit_pixel_range[0], slit_pixel_range[1]))
+            data = data[:, slit_pixel_range[0]:slit_pixel_range[1]]
         else:
             raise TypeError("slit_pixel_range must be tuple of length 2 giving lower and " +
                             "upper bounds of section of slit over which to average line fits.")
 
     # Derive residual orbital variation.
-    # Define array to hold averaged position of Ni I line at different
-    # times.
-    mean_line_wavelengths = np.empty(len(data_array.time)) * np.nan
-    # Define initial guess for gaussian model.
-    g_init = _gaussian1d_on_linear_bg(amplitude=-2., mean=wavelength_nii.value,
-                                      standard_deviation=2., constant_term=50., linear_term=1.5)
-    # Define fitting method.
-    fit_g = fitting.LevMarLSQFitter()
     # Depending on user choice, either fit line as measured by each
     # pixel then average line position, or fit average line spectrum
-    # from all slit pixels.
+    # from all slit pixels.  All profiles are fit simultaneously.
     if fit_individual_profiles:
-        pixels_in_slit = len(raster.slit_axis)
-        for k in range(len(raster.time)):
-            pixel_line_wavelengths = np.empty(pixels_in_slit)*np.nan
-            data_single_time = raster.isel(raster_axis=k)
-            # Iterate through each pixel along slit and perform fit to
-            # Ni I line.
-            for j in range(2, pixels_in_slit-2):
-                # Average over 5 pixels to improve signal-to-noise.
-                intensity_mean_5pix = data_single_time.isel(slit_axis=slice(j-2, j+3)).mean(axis=0)
-                # Fit gaussian to Ni I line.
-                g = fit_g(g_init, wavelength_roi, intensity_mean_5pix)
-                # Check that fit is within physically reasonable
-                # limits.  If so, store line center wavelength in
-                # mean_line_wavelengths array. Else leave element as
-                # defined, i.e. NaN.
-                if np.isfinite(g.amplitude) and g.amplitude < 0. and \
-                            wavelength_roi[0] < g.mean < wavelength_roi[-1]:
-                    pixel_line_wavelengths[j] = g.mean
-            # Take average of Ni I line position from fits in each
-            # pixel.
-            mean_line_wavelengths[k] = np.nanmean(pixel_line_wavelengths)
+        # Average over 5 pixels along slit to improve signal-to-noise,
+        # ignoring masked pixels.  Pixels within 2 of the slit ends are
+        # not fit.
+        valid = ~np.ma.getmaskarray(data)
+        cumulative_sum = np.cumsum(np.insert(data.filled(0), 0, 0, axis=1), axis=1)
+        cumulative_count = np.cumsum(np.insert(valid, 0, 0, axis=1), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            profiles = (cumulative_sum[:, 5:] - cumulative_sum[:, :-5]) / \
+                (cumulative_count[:, 5:] - cumulative_count[:, :-5])
     else:
-        # Else average all line profiles then perform fit.
-        # Iterate through each measurement time and fit a gaussian to
-        # Ni I line.
-        for k in range(len(raster.time)):
-            # Get data averaged over slit.
-            data_single_time = raster.isel(raster_axis=k)
-            data_slit_averaged = data_single_time.to_masked_array().mean(axis=0).data
-            # Fit Ni I line with a gaussian.
-            # Perform fit.
-            g = fit_g(g_init, wavelength_roi, data_slit_averaged)
-            # Check that fit is within physically reasonable limits.
-            # If so, store line center wavelength in
-            # mean_line_wavelengths array. Else leave element as
-            # defined, i.e. NaN.
-            if np.isfinite(g.amplitude) and g.amplitude < 0. and \
-                        wavelength_roi[0] < g.mean < wavelength_roi[-1]:
-                mean_line_wavelengths[k] = g.mean
-            # If data produced by old pipeline, subtract spacecraft velocity
-            # from the line position.
-            if date_created < date_new_pipeline:
-                mean_line_wavelengths[k] = \
-                    mean_line_wavelengths[k]-spacecraft_velocity[k]/3e8*wavelength_nii.to(u.Angstrom).value
+        # Average all line profiles along slit.
+        profiles = data.mean(axis=1).filled(np.nan)[:, np.newaxis]
+    profiles_shape = profiles.shape[:-1]
+    profiles = profiles.reshape((-1, profiles.shape[-1]))
+    # Define initial guess for gaussian model from each profile, i.e.
+    # absorption line at rest wavelength on a flat background.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        background = np.nanmean(profiles[:, [0, -1]], axis=1)
+        g_init = np.stack([np.nanmin(profiles, axis=1) - background,
+                           np.full(len(profiles), wavelength_nii.value),
+                           np.full(len(profiles), 2 * abs(wavelength_roi[1] - wavelength_roi[0])),
+                           background, np.zeros(len(profiles))], axis=-1)
+    g, _ = _fit_batched_levenberg_marquardt(
+        _evaluate_gaussian1d_on_linear_bg, _jacobian_gaussian1d_on_linear_bg,
+        wavelength_roi, profiles, g_init)
+    amplitude, line_centers = g[:, 0].reshape(profiles_shape), g[:, 1].reshape(profiles_shape)
+    # Check that fits are within physically reasonable limits.  Fits
+    # that are not are set to NaN.
+    good_fit = np.isfinite(amplitude) & (amplitude < 0.) & \
+        (wavelength_roi[0] < line_centers) & (line_centers < wavelength_roi[-1])
+    line_centers = np.where(good_fit, line_centers, np.nan)
+    # Take average of Ni I line position from fits in each pixel.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean_line_wavelengths = np.nanmean(line_centers, axis=1)
+    # If data produced by old pipeline, subtract spacecraft velocity
+    # from the line position.
+    if old_pipeline:
+        mean_line_wavelengths = mean_line_wavelengths - \
+            spacecraft_velocity.to(u.m/u.s).value / 3e8 * wavelength_nii.to(u.Angstrom).value
 
     # Mark abnormal values.  Thermal drift is of the order of 2
     # unsummed wavelength pixels peak-to-peak.
-    w_abnormal = np.where(np.abs(mean_line_wavelengths-np.nanmedian(mean_line_wavelengths)) >= specsize*2)[0]
-    if len(w_abnormal) > 0:
-        mean_line_wavelengths[w_abnormal] = np.nan
+    with np.errstate(invalid="ignore"):
+        w_abnormal = np.abs(mean_line_wavelengths - np.nanmedian(mean_line_wavelengths)) \
+            >= specsize*2
+    mean_line_wavelengths[w_abnormal] = np.nan
     # Further data reduction required for files from old pipeline.
-    if date_created < date_new_pipeline:
+    if old_pipeline:
         dw_th_A = mean_line_wavelengths - np.nanmean(mean_line_wavelengths)
         # Change the unit from Angstrom into unsummed wavelength pixel.
         dw_th_p = dw_th_A/specsize
         # Adjust reference wavelength using orbital phase information.
         if not(np.isfinite(orbital_phase)).all():
             warnings.warn("Orbital phase values are invalid.  Thermal drift may be offset by at most one pixel.")
-            dw_th = dw_th
-            # For absolute wavelength calibration of NUV, the
-            # following amount (unit Angstrom) has to be
-            # subtracted from the wavelengths.
-            abswvl_nuv = np.nanmean(mean_line_wavelengths)-wavelength_nii.to(u.Angstrom).value
+            dw_th = dw_th_p
         else:
             # Define empirical sine fitting at 0 roll angle shifted by
             # different phase.
+            roll_angle = Quantity(roll_angle, unit=u.deg).value
             sine_params = [-0.66615146, -1.0, 53.106583-roll_angle/360.*2*np.pi]
             phase_adj=np.nanmean(sine_params[0]*np.sin(sine_params[1]*orbital_phase+sine_params[2]))
             # thermal component of the orbital variation, in the unit of unsummed wavelength pixel
             dw_th=dw_th_p+phase_adj
-            # For absolute wavelength calibration of NUV the following
-            # amount (unit Angstrom) has to be subtracted from the
-            # wavelengths.
-            abswvl_nuv = np.nanmean(mean_line_wavelengths)-wavelength_nii.to(u.Angstrom).value-phase_adj*specsize
     else:
         # Calculate relative variation of the line position.
         dw_th = mean_line_wavelengths-np.nanmean(mean_line_wavelengths)
@@ -389,42 +666,39 @@ def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_
         spline_knot_spacing = 300.
         # Create array of time in seconds from first time and
         # calculate duration of fitting period.
-        time_s = np.asarray(x.coords["time"]-x.coords["time"][0], dtype=float)/1e9
+        time_s = (times - times[0]) / np.timedelta64(1, "s")
         duration = time_s[-1]-time_s[0]
         # Check whether there is enough good data for a spline fit.
         if duration < spline_knot_spacing:
             raise ValueError("Not enough data for spline fit.")
         # Check whether there is enough good data for a spline fit.
-        wgood = np.isfinite(mean_line_wavelengths)
+        wgood = np.isfinite(dw_th)
         ngood = float(sum(wgood))
-        wbad = not(np.isfinite(mean_line_wavelengths))
-        nbad = float(sum(wbad))
+        nbad = float(sum(~wgood))
         if nbad/ngood > 0.25:
-            raise ValuError("Not enough good data for spline fit.")
+            raise ValueError("Not enough good data for spline fit.")
         # Smooth residual thermal variation curve to eliminate the
         # 5-min photospheric oscillation.
         # Determine number of smoothing point using 3 point
         # lagrangian derivative.
-        deriv_time = np.array([(time_s[i+1]-time_s[i-1])/2. for i in range(1,len(time_s)-1)])
-        deriv_time = np.insert(deriv_time, 0, (-3*time_s[0]+4*time_s[1]-time_s[2])/2)
-        deriv_time = np.insert(deriv_time, -1, (3*time_s[-1]-4*time_s[-2]+time_s[-3])/2)
+        deriv_time = np.gradient(time_s, edge_order=2)
         n_smooth = int(spline_knot_spacing/deriv_time.mean())
-        if n_smooth < len(wgood):
-            dw_good = convolve(dw_th[good], Box1DKernel(n_smooth))
+        if n_smooth < ngood:
+            dw_good = convolve(dw_th[wgood], Box1DKernel(n_smooth), boundary="extend")
         else:
-            dw_good = dw_th[good]
-        time_good = time_s[good]
+            dw_good = dw_th[wgood]
+        time_good = time_s[wgood]
         # Fit spline.
         tck = interpolate.splrep(time_good, dw_good, s=0)
         dw_th = interpolate.splev(time_s, tck)
 
     # Derive residual orbital curves in FUV and NUV and store
     # in a table.
-    times = [datetime.datetime.utcfromtimestamp(t/1e9) for t in raster.coords["time"].values.tolist()]
     # Depeding on which pipeline produced the files...
-    if date_created < date_new_pipeline:
-        dw_orb_fuv = dw_th * (-0.013) + spacecraft_velocity.to(u.km/u.s).value / (3.e5) * 1370. * u.Angstrom
-        dw_orb_nuv = dw_th * 0.0255 + spacecraft_velocity.to(u.km/u.s).value / (3.e5) * 2800. * u.Angstrom
+    if old_pipeline:
+        velocity_shift = spacecraft_velocity.to(u.km/u.s).value / (3.e5)
+        dw_orb_fuv = (dw_th * (-0.013) + velocity_shift * 1370.) * u.Angstrom
+        dw_orb_nuv = (dw_th * 0.0255 + velocity_shift * 2800.) * u.Angstrom
     else:
         dw_orb_fuv = dw_th*(-1)*u.Angstrom
         dw_orb_nuv = dw_th*u.Angstrom
@@ -433,6 +707,205 @@ def _calculate_orbital_wavelength_variation(data_array, date_data_created, slit_
                                          names=("time", "wavelength variation FUV", "wavelength variation NUV"))
     return orbital_wavelength_variation
 
+def calculate_line_moments(data, wavelength, rest_wavelength, mask=None):
+    """
+    Calculates intensity, Doppler velocity and width of spectral lines from their moments.
+
+    All spectra are calculated at once.  The spectral axis must be the last axis
+    of data.  Masked and non-finite pixels do not contribute to the moments.
+
+    Parameters
+    ----------
+    data: `numpy.ndarray`
+        Spectra of shape (..., len(wavelength)).
+
+    wavelength: `astropy.units.Quantity`
+        Wavelength of each pixel along spectral axis.
+
+    rest_wavelength: `astropy.units.Quantity`
+        Rest wavelength of line relative to which Doppler velocity is calculated.
+
+    mask: `numpy.ndarray` of `bool` or `None`
+        True for pixels to be ignored.  Must be broadcastable to data.
+        Default=None, implies only non-finite pixels are ignored.
+
+    Returns
+    -------
+    intensity: `astropy.units.Quantity`
+        Zeroth moment, i.e. spectrum integrated over wavelength, in units of
+        data times Angstrom.  Shape is data.shape[:-1].
+
+    velocity: `astropy.units.Quantity`
+        Doppler velocity of first moment, i.e. intensity weighted centroid, in km/s.
+        NaN where spectrum contains no positive intensity.
+
+    width: `astropy.units.Quantity`
+        Square root of second moment about centroid in Angstrom.
+        NaN where spectrum contains no positive intensity.
+
+    """
+    rest_wavelength = rest_wavelength.to(u.Angstrom).value
+    intensity, centroid, width = _calculate_line_moments(data, wavelength.to(u.Angstrom).value,
+                                                         mask=mask)
+    velocity = (centroid - rest_wavelength) / rest_wavelength * constants.c.to(u.km/u.s).value
+    return intensity * u.Angstrom, velocity * u.km/u.s, width * u.Angstrom
+
+
+def _calculate_line_moments(data, wavelength, mask=None):
+    # Returns intensity, centroid and width of spectra along last axis of
+    # data.  See calculate_line_moments.  wavelength is an array in the
+    # unit in which centroid and width are returned.
+    data = np.asarray(data, dtype=float)
+    valid = np.isfinite(data)
+    if mask is not None:
+        valid &= ~np.asarray(mask, dtype=bool)
+    weights = np.where(valid, data, 0.)
+    weights_sum = weights.sum(axis=-1)
+    intensity = np.dot(weights, np.gradient(wavelength))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights_sum = np.where(weights_sum > 0, weights_sum, np.nan)
+        centroid = np.dot(weights, wavelength) / weights_sum
+        variance = np.sum(weights * (wavelength - centroid[..., np.newaxis]) ** 2,
+                          axis=-1) / weights_sum
+        width = np.sqrt(np.where(variance >= 0, variance, np.nan))
+    return intensity, centroid, width
+
+
+def fit_gaussians_on_linear_bg(data, wavelength, n_gaussians=1, uncertainty=None, mask=None,
+                               max_iterations=200):
+    """
+    Fits one or two Gaussians on a linear background to many spectra simultaneously.
+
+    The model of each Gaussian is that of `_gaussian1d_on_linear_bg`, i.e.
+    amplitude * exp(-((x - mean) / standard_deviation) ** 2).  All spectra
+    are fit at once by a batched Levenberg-Marquardt solver.  Initial guesses
+    are derived from the moments of each spectrum above its minimum.
+
+    Parameters
+    ----------
+    data: `numpy.ndarray`
+        Spectra of shape (..., len(wavelength)).
+
+    wavelength: `astropy.units.Quantity`
+        Wavelength of each pixel along spectral axis.
+
+    n_gaussians: `int`
+        Number of Gaussians in model.  Must be 1 or 2.  Default=1
+
+    uncertainty: `numpy.ndarray` or `None`
+        Standard deviation uncertainty of data.  If given, residuals are
+        weighted by its inverse.  Default=None, implies uniform weights and
+        parameter uncertainties are scaled by the reduced chi-squared.
+
+    mask: `numpy.ndarray` of `bool` or `None`
+        True for pixels to be ignored.  Must be broadcastable to data.
+        Non-finite pixels are always ignored.  Default=None
+
+    max_iterations: `int`
+        Maximum number of solver iterations.  Default=200
+
+    Returns
+    -------
+    parameters: `numpy.ndarray`
+        Best-fit parameters of shape data.shape[:-1] + (3 * n_gaussians + 2,).
+        The order is amplitude, mean and standard_deviation of each Gaussian,
+        then constant_term and linear_term.  mean and standard_deviation are in
+        Angstrom, the linear term in units of data per Angstrom.  NaN where a
+        spectrum could not be fit.
+
+    parameter_uncertainties: `numpy.ndarray`
+        One sigma uncertainties of parameters derived from their covariance.
+
+    converged: `numpy.ndarray` of `bool`
+        Whether the fit of each spectrum converged.  Shape is data.shape[:-1].
+
+    """
+    if n_gaussians == 1:
+        function = _evaluate_gaussian1d_on_linear_bg
+        jacobian = _jacobian_gaussian1d_on_linear_bg
+    elif n_gaussians == 2:
+        function = _evaluate_double_gaussian1d_on_linear_bg
+        jacobian = _jacobian_double_gaussian1d_on_linear_bg
+    else:
+        raise ValueError("n_gaussians must be 1 or 2.")
+    n_parameters = 3 * n_gaussians + 2
+    wavelength = wavelength.to(u.Angstrom).value
+    data = np.asarray(data, dtype=float)
+    spectra_shape = data.shape[:-1]
+    data = data.reshape((-1, data.shape[-1]))
+    valid = np.isfinite(data)
+    if mask is not None:
+        valid &= ~np.broadcast_to(mask, spectra_shape + (data.shape[-1],)).reshape(data.shape)
+    if uncertainty is None:
+        weights = valid.astype(float)
+    else:
+        uncertainty = np.broadcast_to(uncertainty, spectra_shape + (data.shape[-1],)).reshape(
+            data.shape)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            valid &= np.isfinite(uncertainty) & (uncertainty > 0)
+            weights = np.where(valid, 1. / uncertainty, 0.)
+    # Fit relative to central wavelength to keep background terms well
+    # conditioned.
+    reference_wavelength = wavelength.mean()
+    x = wavelength - reference_wavelength
+    # Derive initial guesses from moments of spectra relative to their
+    # median, which is taken as the background.  Lines are assumed to be in
+    # absorption if their deepest pixel deviates more than their brightest.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        valid_data = np.where(valid, data, np.nan)
+        background = np.nanmedian(valid_data, axis=-1)
+        deviation = valid_data - background[:, np.newaxis]
+        maximum_deviation = np.nanmax(deviation, axis=-1)
+        minimum_deviation = np.nanmin(deviation, axis=-1)
+        emission = maximum_deviation >= -minimum_deviation
+        amplitude = np.where(emission, maximum_deviation, minimum_deviation)
+        intensity, centroid, _ = _calculate_line_moments(
+            np.clip(np.where(emission, 1, -1)[:, np.newaxis] * deviation, 0, None), x,
+            mask=~valid)
+        # Width of model Gaussian with same intensity and amplitude.
+        width = intensity / (np.abs(amplitude) * np.sqrt(np.pi))
+    zeros = np.zeros(len(data))
+    if n_gaussians == 1:
+        initial_parameters = [amplitude, centroid, width, background, zeros]
+    else:
+        initial_parameters = [0.8 * amplitude, centroid, width,
+                              0.2 * amplitude, centroid, 3 * width, background, zeros]
+    initial_parameters = np.stack(initial_parameters, axis=-1)
+    parameters, converged = _fit_batched_levenberg_marquardt(
+        function, jacobian, x, np.where(valid, data, 0.), initial_parameters,
+        max_iterations=max_iterations, weights=weights)
+    # Derive parameter covariance from jacobian at best fit.
+    fitted = np.isfinite(parameters).all(axis=-1)
+    converged &= fitted
+    covariance = np.full((len(data), n_parameters, n_parameters), np.nan)
+    if fitted.any():
+        weighted_jacobian = jacobian(x, parameters[fitted]) * weights[fitted, :, np.newaxis]
+        covariance[fitted] = np.linalg.pinv(
+            np.einsum("nmi,nmj->nij", weighted_jacobian, weighted_jacobian))
+        if uncertainty is None:
+            residuals = weights[fitted] * (data[fitted] - function(x, parameters[fitted]))
+            residuals = np.where(valid[fitted], residuals, 0.)
+            degrees_of_freedom = np.maximum(valid[fitted].sum(axis=-1) - n_parameters, 1)
+            covariance[fitted] *= (np.sum(residuals ** 2, axis=-1) /
+                                   degrees_of_freedom)[:, np.newaxis, np.newaxis]
+    # Transform parameters from relative to absolute wavelengths.
+    transform = np.identity(n_parameters)
+    transform[-2, -1] = -reference_wavelength
+    covariance = np.einsum("ij,njk,lk->nil", transform, covariance, transform)
+    parameters = parameters.copy()
+    parameters[:, -2] -= reference_wavelength * parameters[:, -1]
+    for i in range(n_gaussians):
+        parameters[:, 3 * i + 1] += reference_wavelength
+    with np.errstate(invalid="ignore"):
+        parameter_uncertainties = np.sqrt(np.diagonal(covariance, axis1=-2, axis2=-1))
+    # Fits whose parameters are unconstrained are degenerate.
+    converged &= np.isfinite(parameter_uncertainties).all(axis=-1)
+    return (parameters.reshape(spectra_shape + (n_parameters,)),
+            parameter_uncertainties.reshape(spectra_shape + (n_parameters,)),
+            converged.reshape(spectra_shape))
+
+
 def get_detector_type(meta):
     """
     Gets the IRIS detector type from a meta dictionary.
@@ -456,6 +929,64 @@ def get_detector_type(meta):
         detector_type = meta["detector type"]
     return detector_type
 
+def verify_header_keywords(header, keywords):
+    """
+    Verifies and fixes the cards of given keywords in a FITS header.
+
+    This is a cheaper alternative to `astropy.io.fits.HDUList.verify` with
+    option 'fix' when only some keywords of a header are used, as other cards
+    are not parsed.
+
+    Parameters
+    ----------
+    header: `astropy.io.fits.Header`
+        Header to verify.
+
+    keywords: iterable of `str`
+        Keywords whose cards are verified.  Keywords not in header are ignored.
+
+    """
+    for keyword in keywords:
+        if keyword in header:
+            header.cards[keyword].verify("fix")
+
+def calculate_times(start_time, seconds_since_start, datetime_objects=False):
+    """
+    Calculates observation times from a start time and offsets in seconds.
+
+    The start time is only parsed once and the offsets are added in a single
+    vectorized operation.
+
+    Parameters
+    ----------
+    start_time: `str` or `datetime.datetime`
+        Time from which offsets are measured, e.g. STARTOBS keyword.
+
+    seconds_since_start: array-like
+        Offsets from start_time in seconds, e.g. TIME column of auxiliary data.
+
+    datetime_objects: `bool`
+        If True, times are returned as an object array of `datetime.datetime`.
+        Default=False
+
+    Returns
+    -------
+    times: `numpy.ndarray`
+        Times with datetime64[us] dtype, or of `datetime.datetime` objects if
+        datetime_objects=True.  Offsets are rounded to the nearest microsecond.
+
+    """
+    start = _to_datetime64(parse_time(start_time))
+    offsets = np.round(np.asarray(seconds_since_start, dtype=float) * 1e6)
+    times = start + offsets.astype("timedelta64[us]")
+    if datetime_objects:
+        times = times.astype(object)
+    return times
+
+def _as_datetime(time):
+    # Converts a datetime64 or datetime.datetime to a datetime.datetime.
+    return np.datetime64(time, "us").astype(datetime.datetime)
+
 def convert_between_DN_and_photons(old_data_arrays, old_unit, new_unit):
     """Converts arrays from IRIS DN to photons or vice versa.
 
@@ -502,7 +1033,7 @@ def convert_between_DN_and_photons(old_data_arrays, old_unit, new_unit):
     return new_data_arrays, new_unit_time_accounted
 
 def calculate_exposure_time_correction(old_data_arrays, old_unit, exposure_time,
-                                       force=False):
+                                       force=False, inplace=False):
     """
     Applies exposure time correction to data arrays.
 
@@ -517,6 +1048,13 @@ def calculate_exposure_time_correction(old_data_arrays, old_unit, exposure_time,
     exposure_time: `numpy.ndarray`
         Exposure time in seconds for each exposure in data arrays.
 
+    force: `bool`
+        If True, correction is applied regardless of unit.  Default=False
+
+    inplace: `bool`
+        If True, data arrays are modified in place and returned.  They must be
+        writeable floating point arrays.  Default=False
+
     Returns
     -------
     new_data_arrays: `list` of `numpy.ndarray`s
@@ -536,12 +1074,16 @@ def calculate_exposure_time_correction(old_data_arrays, old_unit, exposure_time,
         # exposure does need to be applied, or
         # user has set force=True and wants the correction applied
         # regardless of the unit.
-        new_data_arrays = [old_data/exposure_time for old_data in old_data_arrays]
+        if inplace:
+            new_data_arrays = [np.divide(old_data, exposure_time, out=old_data)
+                               for old_data in old_data_arrays]
+        else:
+            new_data_arrays = [old_data/exposure_time for old_data in old_data_arrays]
         new_unit = old_unit/u.s
     return new_data_arrays, new_unit
 
 def uncalculate_exposure_time_correction(old_data_arrays, old_unit, exposure_time,
-                                         force=False):
+                                         force=False, inplace=False):
     """
     Removes exposure time correction from data arrays.
 
@@ -556,6 +1098,13 @@ def uncalculate_exposure_time_correction(old_data_arrays, old_unit, exposure_tim
     exposure_time: `numpy.ndarray`
         Exposure time in seconds for each exposure in data arrays.
 
+    force: `bool`
+        If True, correction is removed regardless of unit.  Default=False
+
+    inplace: `bool`
+        If True, data arrays are modified in place and returned.  They must be
+        writeable floating point arrays.  Default=False
+
     Returns
     -------
     new_data_arrays: `list` of `numpy.ndarray`s
@@ -575,10 +1124,67 @@ def uncalculate_exposure_time_correction(old_data_arrays, old_unit, exposure_tim
         # exposure does need to be removed, or
         # user has set force=True and wants the correction removed
         # regardless of the unit.
-        new_data_arrays = [old_data * exposure_time for old_data in old_data_arrays]
+        if inplace:
+            new_data_arrays = [np.multiply(old_data, exposure_time, out=old_data)
+                               for old_data in old_data_arrays]
+        else:
+            new_data_arrays = [old_data * exposure_time for old_data in old_data_arrays]
         new_unit = old_unit*u.s
     return new_data_arrays, new_unit
 
+def _apply_exposure_time_correction_inplace(cube, exposure_time, undo=False, force=False):
+    """
+    Applies or undoes exposure time correction to a cube's data and uncertainty in place.
+
+    Only the unit of the cube and its uncertainty are replaced.  No new cube
+    is created.  Data and uncertainty arrays the cube does not own, e.g.
+    views of the cube from which this cube was sliced, are copied before
+    correction so that objects sharing them are left unchanged.
+
+    Parameters
+    ----------
+    cube: `ndcube.NDCube`
+        Cube whose data is a writeable floating point `numpy.ndarray`.
+
+    exposure_time: `numpy.ndarray` or `float`
+        Exposure time in seconds broadcastable to data.
+
+    undo, force: `bool`
+        See `calculate_exposure_time_correction` and
+        `uncalculate_exposure_time_correction`.
+
+    """
+    data = cube.data
+    if not isinstance(data, np.ndarray) or not data.flags.writeable or \
+            not np.issubdtype(data.dtype, np.floating):
+        raise ValueError("In place exposure time correction requires data to be a writeable "
+                         "floating point numpy array, e.g. not memory-mapped.")
+    data_arrays = [data]
+    if cube.uncertainty is not None:
+        # Accessing the uncertainty array calculates any lazily derived
+        # uncertainty before the data it is derived from are changed.
+        uncertainty = cube.uncertainty.array
+        if not uncertainty.flags.owndata or not uncertainty.flags.writeable or \
+                not np.issubdtype(uncertainty.dtype, np.floating) or \
+                np.shares_memory(uncertainty, data):
+            uncertainty = np.array(uncertainty, dtype=float)
+            cube.uncertainty.array = uncertainty
+        data_arrays.append(uncertainty)
+    if not data.flags.owndata:
+        # Copy on write so that the arrays data is a view of are unchanged.
+        data = data.copy()
+        cube._data = data
+        data_arrays[0] = data
+    if undo:
+        _, new_unit = uncalculate_exposure_time_correction(data_arrays, cube.unit, exposure_time,
+                                                           force=force, inplace=True)
+    else:
+        _, new_unit = calculate_exposure_time_correction(data_arrays, cube.unit, exposure_time,
+                                                         force=force, inplace=True)
+    cube._unit = new_unit
+    if cube.uncertainty is not None:
+        cube.uncertainty._unit = new_unit
+
 def convert_or_undo_photons_per_sec_to_radiance(
         data_quantities, obs_wavelength, detector_type,
         spectral_dispersion_per_pixel, solid_angle, undo=False):
@@ -647,10 +1253,14 @@ def convert_or_undo_photons_per_sec_to_radiance(
     return new_data_quantities
 
 def calculate_photons_per_sec_to_radiance_factor(
-        wavelength, detector_type, spectral_dispersion_per_pixel, solid_angle):
+        wavelength, detector_type, spectral_dispersion_per_pixel, solid_angle,
+        obs_times=None, response_version=2):
     """
     Calculates multiplicative factor that converts counts/s to radiance for given wavelengths.
 
+    If obs_times is given, the factor is calculated with the effective area at each
+    time.  This requires response_version to be 3 or greater.
+
     Parameters
     ----------
     wavelength: `astropy.units.Quantity`
@@ -665,23 +1275,170 @@ def calculate_photons_per_sec_to_radiance_factor(
     solid_angle: scalar `astropy.units.Quantity`
         Solid angle corresponding to a pixel.
 
+    obs_times: array-like of `numpy.datetime64` or `datetime.datetime` or `None`
+        Observation times at which to calculate time dependent effective area.
+        Default=None, implies the time independent effective area of
+        response_version is used.
+
+    response_version: `int`
+        Version of response file from which to derive effective area.
+        Default=2, i.e. pre-launch response.
+
     Returns
     -------
     radiance_factor: `astropy.units.Quantity`
         Mutliplicative conversion factor from counts/s to radiance units
-        for input wavelengths.
+        for input wavelengths.  If obs_times is given, there is an extra
+        leading axis corresponding to obs_times.
 
     """
     # Get effective area and interpolate to observed wavelength grid.
-    eff_area_interp = _get_interpolated_effective_area(detector_type, wavelength)
+    eff_area_interp = _get_interpolated_effective_area(
+        detector_type, wavelength, obs_times=obs_times, response_version=response_version)
     # Return radiometric conversed data assuming input data is in units of photons/s.
     return constants.h * constants.c / wavelength / u.photon / \
            spectral_dispersion_per_pixel / eff_area_interp / solid_angle
 
-def _get_interpolated_effective_area(detector_type, obs_wavelength):
-    # Get effective area
-    ########### This needs to be generalized to the time of OBS once that functionality is written #########
-    iris_response = get_iris_response(pre_launch=True)
+def calculate_unit_conversion_factor(old_unit, new_unit_type, detector_type,
+                                     exposure_time=None, radiance_factor=None):
+    """
+    Calculates multiplicative factor converting data between DN, photons and radiance.
+
+    The factor combines the DN/photon conversion, exposure time correction and
+    radiometric calibration so that data can be converted in a single pass with
+    `irispy.iris_tools.apply_unit_conversion_factor`.  The presence or absence
+    of exposure time correction is preserved in conversions between DN and
+    photons.  Data not corrected for exposure time are corrected when converted
+    to radiance.
+
+    Parameters
+    ----------
+    old_unit: `astropy.units.Unit`
+        Unit of data.
+
+    new_unit_type: `str`
+        Unit type to convert data to: "DN", "photons" or "radiance".
+
+    detector_type: `str`
+        Detector type: 'FUV' or 'NUV'.
+
+    exposure_time: `numpy.ndarray` or `None`
+        Exposure time in seconds of each exposure, shaped to broadcast with the
+        data.  Only required when converting data not corrected for exposure
+        time to radiance.
+
+    radiance_factor: `astropy.units.Quantity` or `None`
+        Output of `irispy.iris_tools.calculate_photons_per_sec_to_radiance_factor`
+        shaped to broadcast with the data.  Only required when converting to or
+        from radiance.
+
+    Returns
+    -------
+    factor: `float` or `numpy.ndarray`
+        Factor by which to multiply data to convert them to new_unit.
+
+    new_unit: `astropy.units.Unit`
+        Unit of converted data.
+
+    """
+    old_is_radiance = old_unit.is_equivalent(RADIANCE_UNIT)
+    if new_unit_type == "radiance" and old_is_radiance:
+        return 1., old_unit
+    if new_unit_type == "DN":
+        count_unit = DN_UNIT[detector_type]
+    elif new_unit_type in ["photons", "radiance"]:
+        count_unit = u.photon
+    else:
+        raise ValueError("Input unit type not recognized.")
+    factor = 1.
+    if old_is_radiance:
+        # Undo radiometric calibration to give photons/s.
+        factor = 1. / (radiance_factor * u.photon / u.s).to(old_unit).value
+        old_unit = u.photon / u.s
+    # During DN/photon conversion, the time component due to exposure
+    # time correction, if it has been applied, is ignored.
+    time_corrected = u.s not in (old_unit * u.s).decompose().bases
+    old_count_unit = old_unit * u.s if time_corrected else old_unit
+    if old_count_unit != count_unit:
+        factor = factor * old_count_unit.to(count_unit)
+    if new_unit_type != "radiance":
+        new_unit = count_unit / u.s if time_corrected else count_unit
+        return factor, new_unit
+    if not time_corrected:
+        if exposure_time is None:
+            raise ValueError("exposure_time must be set to convert data not corrected "
+                             "for exposure time to radiance.")
+        factor = factor / exposure_time
+    factor = factor * (radiance_factor * u.photon / u.s).to(RADIANCE_UNIT).value
+    return factor, RADIANCE_UNIT
+
+def apply_unit_conversion_factor(old_data_arrays, factor, out=None):
+    """
+    Multiplies data arrays by a conversion factor in a single pass.
+
+    Parameters
+    ----------
+    old_data_arrays: iterable of `numpy.ndarray`s
+        Arrays of data to be converted.
+
+    factor: `float` or `numpy.ndarray`
+        Output of `irispy.iris_tools.calculate_unit_conversion_factor`.
+
+    out: iterable of `numpy.ndarray`s or `None`
+        Arrays in which to store the converted data, one for each data array.
+        These can be the data arrays themselves to convert them in place.
+        Default=None, implies new arrays are allocated unless factor is 1,
+        in which case the data arrays are returned unchanged.
+
+    Returns
+    -------
+    new_data_arrays: `list` of `numpy.ndarray`s
+        Converted data arrays.
+
+    """
+    if out is None:
+        if np.isscalar(factor) and factor == 1:
+            return [data for data in old_data_arrays]
+        out = [None] * len(old_data_arrays)
+    return [np.multiply(data, factor, out=new_data)
+            for data, new_data in zip(old_data_arrays, out)]
+
+def _get_interpolated_effective_area(detector_type, obs_wavelength, obs_times=None,
+                                     response_version=2):
+    # Interpolate the effective areas to cover the wavelengths
+    # at which the data is recorded.  The spline and its evaluation
+    # are cached so repeated conversions of cubes with the same
+    # spectral axis do not refit or re-evaluate it.
+    eff_area_interp_base_unit = u.Angstrom
+    wavelength = np.ascontiguousarray(obs_wavelength.to(eff_area_interp_base_unit).value,
+                                      dtype=float)
+    if obs_times is None:
+        if response_version > 2:
+            raise ValueError("obs_times must be set to calculate effective areas from "
+                             "response versions of 3 or greater.")
+        eff_area_interp = _evaluate_effective_area_spline(
+            detector_type, response_version, wavelength.tobytes()).reshape(wavelength.shape)
+    else:
+        if response_version < 3:
+            raise ValueError("Time dependent effective areas require a response "
+                             "version of 3 or greater.")
+        # Time dependent effective areas are calculated once per day.
+        day_bins = _get_day_bins(obs_times)
+        unique_day_bins, day_bin_indices = np.unique(day_bins, return_inverse=True)
+        tcks = _get_time_dependent_effective_area_splines(detector_type, response_version,
+                                                         unique_day_bins)
+        eff_area_interp = np.stack([interpolate.splev(wavelength, tck) for tck in tcks])
+        eff_area_interp = eff_area_interp[day_bin_indices.ravel()]
+    return Quantity(eff_area_interp, unit=eff_area_interp_base_unit ** 2, copy=False)
+
+@functools.lru_cache(maxsize=None)
+def _get_effective_area_spline(detector_type, response_version):
+    # Returns B-spline representation of spectrograph effective area
+    # in Angstrom**2 as a function of wavelength in Angstrom.
+    if response_version == 2:
+        iris_response = get_iris_response(pre_launch=True)
+    else:
+        iris_response = get_iris_response(response_version=response_version)
     if detector_type == "FUV":
         detector_type_index = 0
     elif detector_type == "NUV":
@@ -690,14 +1447,138 @@ def _get_interpolated_effective_area(detector_type, obs_wavelength):
         raise ValueError("Detector type not recognized.")
     eff_area = iris_response["AREA_SG"][detector_type_index, :]
     response_wavelength = iris_response["LAMBDA"]
-    # Interpolate the effective areas to cover the wavelengths
-    # at which the data is recorded:
-    eff_area_interp_base_unit = u.Angstrom
-    tck = interpolate.splrep(response_wavelength.to(eff_area_interp_base_unit).value,
-                             eff_area.to(eff_area_interp_base_unit ** 2).value, s=0)
-    eff_area_interp = interpolate.splev(
-        obs_wavelength.to(eff_area_interp_base_unit).value, tck) * eff_area_interp_base_unit ** 2
-    return eff_area_interp
+    return interpolate.splrep(response_wavelength.to(u.Angstrom).value,
+                              eff_area.to(u.Angstrom ** 2).value, s=0)
+
+@functools.lru_cache(maxsize=128)
+def _evaluate_effective_area_spline(detector_type, response_version, wavelength_bytes):
+    # Evaluates effective area spline at wavelengths given as the bytes of a
+    # float64 array so that they can be hashed.  Returned array is read-only
+    # as it is shared between calls.
+    tck = _get_effective_area_spline(detector_type, response_version)
+    eff_area = np.asarray(interpolate.splev(np.frombuffer(wavelength_bytes), tck))
+    eff_area.flags.writeable = False
+    return eff_area
+
+def _get_day_bins(obs_times):
+    # Returns index of the day of each time since 1979-01-01, the
+    # reference time of IRIS response files.
+    obs_times = np.atleast_1d(np.asarray(obs_times, dtype="datetime64[us]"))
+    return (obs_times - RESPONSE_TIME_REFERENCE).astype("timedelta64[D]").astype(int)
+
+def _get_time_dependent_effective_area_splines(detector_type, response_version, day_bins):
+    # Returns B-spline representations of spectrograph effective area
+    # in Angstrom**2 vs wavelength in Angstrom at the middle of each day
+    # bin.  Splines of day bins not already cached are calculated together.
+    keys = [(detector_type, response_version, day_bin) for day_bin in day_bins]
+    new_day_bins = [day_bin for key, day_bin in zip(keys, day_bins)
+                    if key not in _TIME_DEPENDENT_EFFECTIVE_AREA_CACHE]
+    if new_day_bins:
+        iris_response = get_iris_response(response_version=response_version)
+        times = RESPONSE_TIME_REFERENCE + \
+            (np.asarray(new_day_bins) * 24 + 12).astype("timedelta64[h]")
+        eff_areas = calculate_time_dependent_sg_effective_area(iris_response, detector_type,
+                                                               times)
+        response_wavelength = iris_response["LAMBDA"].to(u.Angstrom).value
+        for day_bin, eff_area in zip(new_day_bins, eff_areas.to(u.Angstrom ** 2).value):
+            _TIME_DEPENDENT_EFFECTIVE_AREA_CACHE[(detector_type, response_version, day_bin)] = \
+                interpolate.splrep(response_wavelength, eff_area, s=0)
+    return [_TIME_DEPENDENT_EFFECTIVE_AREA_CACHE[key] for key in keys]
+
+def calculate_time_dependent_sg_effective_area(iris_response, detector_type, obs_times):
+    """
+    Calculates spectrograph effective area at many observation times at once.
+
+    Response files of version 3 and above describe the degradation of the
+    effective area of each detector with time.  At each of a set of reference
+    wavelengths, the effective area in each of a series of time intervals is
+    given by three coefficients, c0, c1, c2, as (c0 + c1*dt) * exp(c2*dt), where
+    dt is the time in years since the start of the interval.  Times after the
+    last interval use the coefficients of the last interval.  As in SSW's
+    iris_get_response, the effective area is then linearly interpolated, and
+    extrapolated, from the reference wavelengths of each CCD to the response
+    wavelengths within that CCD's range.  The two FUV CCDs each have a pair of
+    reference wavelengths.  The effective area is zero outside the CCD ranges
+    given by `irispy.iris_tools.SG_WAVELENGTH_RANGES`, e.g. between the FUV CCDs.
+
+    Parameters
+    ----------
+    iris_response: `dict`
+        Output of `irispy.iris_tools.get_iris_response` for a response file
+        of version 3 or greater.
+
+    detector_type: `str`
+        Detector type: 'FUV' or 'NUV'.
+
+    obs_times: array-like of `numpy.datetime64` or `datetime.datetime`
+        Observation times.
+
+    Returns
+    -------
+    eff_area: `astropy.units.Quantity`
+        Effective area of shape (number of times, number of response wavelengths)
+        at the wavelengths given by iris_response["LAMBDA"].
+
+    """
+    if iris_response["VERSION"] < 3:
+        raise ValueError("Time dependent effective areas require a response "
+                         "version of 3 or greater.")
+    if detector_type == "FUV":
+        time_key, lambda_key, coeffs_key = "C_F_TIME", "C_F_LAMBDA", "COEFFS_FUV"
+    elif detector_type == "NUV":
+        time_key, lambda_key, coeffs_key = "C_N_TIME", "C_N_LAMBDA", "COEFFS_NUV"
+    else:
+        raise ValueError("Detector type not recognized.")
+    reference_wavelength = iris_response[lambda_key].to(u.nm).value
+    response_wavelength = iris_response["LAMBDA"].to(u.nm).value
+    wavelength_ranges = SG_WAVELENGTH_RANGES[detector_type].to(u.nm).value
+    # Each CCD has a pair of reference wavelengths, i.e. FUV CCD 1 uses the
+    # first pair and FUV CCD 2 the second.
+    if len(reference_wavelength) != 2 * len(wavelength_ranges):
+        raise ValueError(
+            "Response version {0} gives {1} {2} reference wavelengths.  Expected a pair "
+            "for each of the {3} {2} CCDs.".format(
+                iris_response["VERSION"], len(reference_wavelength), detector_type,
+                len(wavelength_ranges)))
+    ccd_reference_indices = np.arange(len(reference_wavelength)).reshape((-1, 2))
+    # Effective area at reference wavelengths of shape (n_reference_wavelengths, n_times).
+    reference_eff_area = _calculate_throughput(obs_times, iris_response[time_key],
+                                               iris_response[coeffs_key])
+    eff_area = np.zeros((reference_eff_area.shape[1], len(response_wavelength)))
+    for (range_min, range_max), indices in zip(wavelength_ranges, ccd_reference_indices):
+        in_range = (response_wavelength >= range_min) & (response_wavelength <= range_max)
+        eff_area[:, in_range] = _interpolate_linearly(
+            response_wavelength[in_range], reference_wavelength[indices],
+            reference_eff_area[indices]).T
+    return Quantity(eff_area, unit=u.cm**2)
+
+def _interpolate_linearly(x, xp, fp):
+    # Linearly interpolates fp, of shape (len(xp), ...), from sorted points xp
+    # to x, extrapolating beyond xp from its first and last pairs as IDL's
+    # interpol does.  Returns array of shape (len(x), ...).
+    upper = np.clip(np.searchsorted(xp, x), 1, len(xp) - 1)
+    weight = ((x - xp[upper - 1]) / (xp[upper] - xp[upper - 1])).reshape(
+        (-1,) + (1,) * (fp.ndim - 1))
+    return fp[upper - 1] * (1 - weight) + fp[upper] * weight
+
+def _calculate_throughput(obs_times, interval_times, coeffs):
+    # Evaluates the effective area model of each reference wavelength at
+    # each time.  interval_times has shape (n_intervals, 2) giving the start
+    # and end of each interval.  coeffs has shape
+    # (n_reference_wavelengths, n_intervals, 3).  As in SSW's fit_iris_xput,
+    # dt is measured in years of 365.25 days from the start of the interval
+    # containing each time.  Returns array of shape
+    # (n_reference_wavelengths, n_times).
+    obs_times = np.atleast_1d(np.asarray(obs_times, dtype="datetime64[us]"))
+    interval_starts = np.asarray(interval_times, dtype="datetime64[us]").reshape(
+        (-1, 2))[:, 0]
+    coeffs = np.asarray(coeffs, dtype=float).reshape((-1, len(interval_starts), 3))
+    interval_index = np.clip(np.searchsorted(interval_starts, obs_times, side="right") - 1,
+                             0, len(interval_starts) - 1)
+    dt = (obs_times - interval_starts[interval_index]) / np.timedelta64(1, "s") / \
+        SECONDS_PER_YEAR
+    c0, c1, c2 = np.moveaxis(coeffs[:, interval_index], -1, 0)
+    return (c0 + c1 * dt) * np.exp(c2 * dt)
 
 def _reshape_1D_wavelength_dimensions_for_broadcast(wavelength, n_data_dim):
     if n_data_dim == 1:
@@ -828,3 +1709,207 @@ def calculate_dust_mask(data_array):
     struct = np.array([np.zeros((3, 3)), np.ones((3, 3)), np.zeros((3, 3))], dtype=bool)
     mask = ndimage.binary_dilation(mask, structure=struct).astype(mask.dtype)
     return mask
+
+class LazyArray(object):
+    """
+    Array-like object whose values are derived element-wise from another array on access.
+
+    Slicing a LazyArray slices the source array and returns a new LazyArray so
+    that only the elements actually indexed are ever read and evaluated.  This
+    makes it suitable for wrapping memory-mapped FITS data.
+
+    Parameters
+    ----------
+    source: array-like
+        Array from which values are derived, e.g. a memory-mapped HDU data array.
+        Must support numpy-style slicing.
+
+    function: function
+        Element-wise function applied to source to derive values.  Must be
+        called as function(source, *args).
+
+    args:
+        Additional positional arguments passed to function.
+
+    """
+    def __init__(self, source, function, *args):
+        self.source = source
+        self.function = function
+        self.args = args
+
+    @property
+    def shape(self):
+        return self.source.shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def dtype(self):
+        return self[(0,) * self.ndim].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        sliced_source = self.source[item]
+        if np.ndim(sliced_source) == 0:
+            return self.function(np.asarray(sliced_source), *self.args)[()]
+        return LazyArray(sliced_source, self.function, *self.args)
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.asarray(self.function(np.asarray(self.source), *self.args))
+        if dtype is not None:
+            values = values.astype(dtype)
+        return values
+
+    def __repr__(self):
+        return "<LazyArray shape={0} function={1}>".format(
+            self.shape, getattr(self.function, "__name__", self.function))
+
+
+def _scale_data(data, bscale, bzero):
+    # Apply FITS scaling in the same way as astropy.io.fits, i.e.
+    # returning float32 values.
+    scaled_data = np.array(data, dtype=np.float32)
+    scaled_data *= bscale
+    scaled_data += bzero
+    return scaled_data
+
+
+def get_hdu_data_scaled_on_access(hdu):
+    """
+    Returns an HDU's data, deferring BSCALE/BZERO scaling until it is accessed.
+
+    The HDU must have been opened with do_not_scale_image_data=True so that its
+    data attribute holds the raw (possibly memory-mapped) values.  If the HDU is
+    not scaled, the raw data array is returned unchanged.
+
+    Parameters
+    ----------
+    hdu: `astropy.io.fits.ImageHDU` or `astropy.io.fits.PrimaryHDU`
+        HDU opened with do_not_scale_image_data=True.
+
+    Returns
+    -------
+    data: `numpy.ndarray` or `irispy.iris_tools.LazyArray`
+        Raw data if the HDU is unscaled, else a LazyArray which scales the
+        elements that are indexed when they are accessed.
+
+    """
+    bscale = hdu.header.get("BSCALE", 1)
+    bzero = hdu.header.get("BZERO", 0)
+    if bscale == 1 and bzero == 0:
+        return hdu.data
+    return LazyArray(hdu.data, _scale_data, bscale, bzero)
+
+
+def calculate_poisson_uncertainty(data, unit, readout_noise):
+    """
+    Calculates the uncertainty of data from Poisson and readout noise.
+
+    Parameters
+    ----------
+    data: `numpy.ndarray`
+        Data in units of unit.
+
+    unit: `astropy.units.Unit`
+        Unit of data.  Must be convertible to photons, e.g. a value of DN_UNIT.
+
+    readout_noise: `astropy.units.Quantity`
+        Readout noise of detector.
+
+    Returns
+    -------
+    uncertainty: `numpy.ndarray`
+        Standard deviation uncertainty of data in units of unit.
+
+    """
+    # Calculated with a scalar conversion factor so that the returned array
+    # owns its memory and can be changed in place.
+    photons_per_unit = (1 * unit).to(u.photon).value
+    uncertainty = np.sqrt(np.asarray(data) * photons_per_unit +
+                          readout_noise.to(u.photon).value**2)
+    uncertainty /= photons_per_unit
+    return uncertainty
+
+
+class LazyPoissonUncertainty(StdDevUncertainty):
+    """
+    Standard deviation uncertainty derived from data when it is first accessed.
+
+    The Poisson and readout noise of the data are only calculated, by
+    `irispy.iris_tools.calculate_poisson_uncertainty`, when the array attribute
+    is first accessed.  The result is then stored.  Slicing an uncalculated
+    uncertainty slices the data it is derived from so that only the sliced
+    elements are calculated.
+
+    Parameters
+    ----------
+    array: array-like or `None`
+        Uncertainty values.  If given, data and readout_noise are ignored and
+        this object behaves as a `astropy.nddata.StdDevUncertainty`.
+
+    copy: `bool`
+        See `astropy.nddata.StdDevUncertainty`.
+
+    unit: `astropy.units.Unit`
+        Unit of data and uncertainty.
+
+    data: array-like
+        Data from which uncertainty is derived.  Must support slicing and
+        conversion to a numpy array, e.g. a `numpy.ndarray` or
+        `irispy.iris_tools.LazyArray`.
+
+    readout_noise: `astropy.units.Quantity`
+        Readout noise of detector.
+
+    """
+    def __init__(self, array=None, copy=True, unit=None, data=None, readout_noise=None):
+        if isinstance(array, LazyPoissonUncertainty):
+            data = array._data
+            readout_noise = array._readout_noise
+            if unit is None:
+                unit = array.unit
+            array = array._array
+        self._data = data
+        self._readout_noise = readout_noise
+        super().__init__(array, copy=copy, unit=unit)
+
+    @property
+    def array(self):
+        """`numpy.ndarray` : the uncertainty's value, calculated on first access."""
+        if self._array is None and self._data is not None:
+            self._array = calculate_poisson_uncertainty(
+                np.asarray(self._data), self.unit, self._readout_noise)
+            self._data = None
+        return self._array
+
+    @array.setter
+    def array(self, value):
+        if value is not None:
+            self._data = None
+        StdDevUncertainty.array.fset(self, value)
+
+    @property
+    def calculated(self):
+        """`bool` : Whether the uncertainty values have been calculated."""
+        return self._data is None
+
+    def __getitem__(self, item):
+        if self.calculated:
+            return self.__class__(self._array[item], unit=self.unit, copy=False)
+        return self.__class__(unit=self.unit, data=self._data[item],
+                              readout_noise=self._readout_noise)
+
+    def __getstate__(self):
+        return super().__getstate__() + (self._data, self._readout_noise)
+
+    def __setstate__(self, state):
+        super().__setstate__(state[:3])
+        self._data, self._readout_noise = state[3:]
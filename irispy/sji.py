@@ -2,7 +2,6 @@
 This module provides movie tools for level 2 IRIS SJI fits file
 '''
 
-from datetime import timedelta
 import warnings
 
 import numpy as np
@@ -15,7 +14,7 @@ from ndcube import NDCube
 from ndcube.utils.cube import convert_extra_coords_dict_to_input_format
 from ndcube.ndcube_sequence import NDCubeSequence
 
-from irispy import iris_tools
+from irispy import iris_tools, catalog
 
 __all__ = ['IRISMapCube', 'IRISMapCubeSequence', 'read_iris_sji_level2_fits']
 
@@ -23,6 +22,12 @@ __all__ = ['IRISMapCube', 'IRISMapCubeSequence', 'read_iris_sji_level2_fits']
 BAD_PIXEL_VALUE_SCALED = -200
 # the following value is only appropriate for unscaled images
 BAD_PIXEL_VALUE_UNSCALED = -32768
+# Header keywords read from level 2 SJI files.  Only these are verified
+# when files are read with verify=False.
+PRIMARY_HEADER_KEYWORDS = ["TELESCOP", "INSTRUME", "TWAVE1", "STARTOBS", "ENDOBS", "OBSID",
+                           "OBS_DESC", "FOVX", "FOVY", "XCEN", "YCEN", "BSCALE", "BZERO"]
+AUX_HEADER_KEYWORDS = ["TIME", "PZTX", "PZTY", "XCENIX", "YCENIX", "OBS_VRIX", "OPHASEIX",
+                       "EXPTIMES", "SLTPX1IX", "SLTPX2IX"]
 
 
 class IRISMapCube(NDCube):
@@ -112,8 +117,10 @@ class IRISMapCube(NDCube):
         else:
             instance_start = self.extra_coords["TIME"]["value"]
             instance_end = self.extra_coords["TIME"]["value"]
-        instance_start = instance_start.isoformat() if instance_start else None
-        instance_end = instance_end.isoformat() if instance_end else None
+        instance_start = iris_tools._as_datetime(instance_start).isoformat() \
+            if instance_start else None
+        instance_end = iris_tools._as_datetime(instance_end).isoformat() \
+            if instance_end else None
         # Representation of IRISMapCube object
         return (
             """
@@ -151,7 +158,7 @@ class IRISMapCube(NDCube):
         sliced_self.scaled = self.scaled
         return sliced_self
 
-    def apply_exposure_time_correction(self, undo=False, force=False):
+    def apply_exposure_time_correction(self, undo=False, force=False, inplace=False):
         """
         Applies or undoes exposure time correction to data and uncertainty and adjusts unit.
 
@@ -172,15 +179,23 @@ class IRISMapCube(NDCube):
             If True, correction is applied (undone) regardless of unit.  Unit is still
             adjusted accordingly.
 
+        inplace: `bool`
+            If True, data and uncertainty arrays are divided (multiplied) in place and
+            only the unit of this cube is changed.  Data must be a writeable floating
+            point array, i.e. not read with memmap=True.  Arrays shared with other
+            objects, e.g. the cube this cube was sliced from, are changed too.
+            Default=False
+
         Returns
         -------
-        result: `IRISMapCube`
+        result: `IRISMapCube` or `None`
             A new IRISMapCube is returned with the correction applied (undone).
+            None if inplace=True.
 
         """
-        # Raise an error if this method is called while memmap is used
+        # Raise an error if data are not scaled.
         if not self.scaled:
-            raise ValueError("This method is not available as you are using memmap")
+            raise ValueError("This method is not available for unscaled data.")
         # Get exposure time in seconds and change array's shape so that
         # it can be broadcast with data and uncertainty arrays.
         exposure_time_s = u.Quantity(self.extra_coords["EXPOSURE TIME"]["value"], unit='s').value
@@ -195,13 +210,19 @@ class IRISMapCube(NDCube):
                 raise ValueError(
                     "IRISMapCube dimensions must be 2 or 3. Dimensions={0}".format(
                         self.data.ndim))
+        if inplace:
+            iris_tools._apply_exposure_time_correction_inplace(self, exposure_time_s,
+                                                               undo=undo, force=force)
+            return None
         # Based on value on undo kwarg, apply or remove exposure time correction.
+        # Memory-mapped data are only read for the extent of this cube.
+        data = np.asarray(self.data)
         if undo is True:
             new_data_arrays, new_unit = iris_tools.uncalculate_exposure_time_correction(
-                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
+                (data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
         else:
             new_data_arrays, new_unit = iris_tools.calculate_exposure_time_correction(
-                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
+                (data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
         # Return new instance of IRISMapCube with correction applied/undone.
         return IRISMapCube(
             data=new_data_arrays[0], wcs=self.wcs, uncertainty=new_data_arrays[1],
@@ -227,7 +248,13 @@ class IRISMapCube(NDCube):
             Rewrite self.mask with/without the dust positions.
         """
         # Calculate position of dust pixels
-        dust_mask = iris_tools.calculate_dust_mask(self.data)
+        dust_mask = iris_tools.calculate_dust_mask(np.asarray(self.data))
+        # Read lazily evaluated mask, e.g. of memory-mapped data, into memory
+        # so it can be updated.
+        if self.mask is None:
+            self.mask = np.zeros(dust_mask.shape, dtype=bool)
+        elif not isinstance(self.mask, np.ndarray):
+            self.mask = np.array(self.mask)
         if undo:
             # If undo kwarg IS set, unmask dust pixels.
             self.mask[dust_mask] = False
@@ -270,10 +297,12 @@ class IRISMapCubeSequence(NDCubeSequence):
         endobs = endobs.isoformat() if endobs else None
         # Conversion of the instance start of OBS
         instance_start = self[0].extra_coords["TIME"]["value"]
-        instance_start = instance_start.isoformat() if instance_start else None
+        instance_start = iris_tools._as_datetime(instance_start).isoformat() \
+            if instance_start else None
         # Conversion of the instance end of OBS
         instance_end = self[-1].extra_coords["TIME"]["value"]
-        instance_end = instance_end.isoformat() if instance_end else None
+        instance_end = iris_tools._as_datetime(instance_end).isoformat() \
+            if instance_end else None
         # Representation of IRISMapCube object
         return """
 IRISMapCubeSequence
@@ -388,7 +417,8 @@ Axis Types:\t\t {axis_types}
                                  axes_coordinates=axes_coordinates,
                                  axes_units=axes_units, data_unit=data_unit, **kwargs)
 
-    def apply_exposure_time_correction(self, undo=False, copy=False, force=False):
+    def apply_exposure_time_correction(self, undo=False, copy=False, force=False,
+                                       inplace=False):
         """
         Applies or undoes exposure time correction to data and uncertainty and adjusts unit.
 
@@ -414,6 +444,12 @@ Axis Types:\t\t {axis_types}
             If True, correction is applied (undone) regardless of unit.  Unit is still
             adjusted accordingly.
 
+        inplace: `bool`
+            If True, the data and uncertainty arrays of each cube are corrected in
+            place without allocating new arrays.  Cannot be combined with copy=True.
+            See `IRISMapCube.apply_exposure_time_correction`.
+            Default=False
+
         Returns
         -------
         result: `IRISMapCubeSequence`
@@ -423,6 +459,12 @@ Axis Types:\t\t {axis_types}
             applied (undone).
 
         """
+        if inplace:
+            if copy is True:
+                raise ValueError("copy and inplace cannot both be True.")
+            for cube in self.data:
+                cube.apply_exposure_time_correction(undo=undo, force=force, inplace=True)
+            return None
         corrected_data = [cube.apply_exposure_time_correction(undo=undo, force=force)
                           for cube in self.data]
         if copy is True:
@@ -452,19 +494,48 @@ Axis Types:\t\t {axis_types}
             cube.apply_dust_mask(undo=undo)
 
 
-def read_iris_sji_level2_fits(filenames, memmap=False):
+def read_iris_sji_level2_fits(filenames, memmap=False, datetime_objects=False, frames=None,
+                              region=None, verify=True):
     """
     Read IRIS level 2 SJI FITS from an OBS into an IRISMapCube instance.
 
     Parameters
     ----------
-    filenames: `list` of `str` or `str`
+    filenames: `list` of `str` or `str` or `irispy.catalog.CatalogQuery`
         Filename or filenames to be read.  They must all be associated with the same
-        OBS number.
+        OBS number.  If a CatalogQuery, the SJI files matching the query are read.
 
     memmap : `bool`
-        Default value is `False`.
-        If the user wants to use it, he has to set `True`
+        If True, data are memory-mapped read-only rather than read into memory.
+        BSCALE/BZERO scaling, replacement of bad pixels by NaN, the bad pixel
+        mask and the uncertainty are then only calculated for the elements that
+        are accessed, e.g. after slicing.  Default=False
+
+    datetime_objects : `bool`
+        If True, the TIME extra coord is an object array of `datetime.datetime`
+        as in previous versions.  Otherwise it has datetime64 dtype.
+        Default=False
+
+    frames : `slice` or `tuple` of `int` or `None`
+        Frames to read from each file, given as a slice or as (start, stop) or
+        (start, stop, step).  Default=None, implies all frames.
+
+    region : `tuple` of length 2 or `None`
+        Spatial region to read, given as ((y_start, y_stop), (x_start, x_stop)).
+        Bounds are either pixel indices or `astropy.units.Quantity` world
+        coordinates, i.e. latitude for y and longitude for x.  A world coordinate
+        region is converted to the smallest pixel region containing it.
+        Default=None, implies whole field of view.
+
+    verify : `bool`
+        If True, every header card of every HDU is verified and fixed when a file
+        is opened.  If False, only the cards of the header keywords used by the
+        reader are, which is faster for files with many keywords.
+        Default=True
+
+    Only the requested frames and region are read from disk.  The WCS and
+    extra coords are sliced accordingly and the uncertainty is only derived
+    for the pixels read.
 
     Returns
     -------
@@ -472,47 +543,64 @@ def read_iris_sji_level2_fits(filenames, memmap=False):
 
     """
     list_of_cubes = []
+    if isinstance(filenames, catalog.CatalogQuery):
+        filenames = filenames.filenames(instrument=catalog.SJI_INSTRUMENT)
+        if not filenames:
+            raise ValueError("No SJI files match catalog query.")
     if type(filenames) is str:
         filenames = [filenames]
     for filename in filenames:
         # Open a fits file
         hdulist = fits.open(filename, memmap=memmap, do_not_scale_image_data=memmap)
-        hdulist.verify('fix')
-        # Derive WCS, data and mask for NDCube from fits file.
+        if verify:
+            hdulist.verify('fix')
+        else:
+            iris_tools.verify_header_keywords(hdulist[0].header, PRIMARY_HEADER_KEYWORDS)
+            iris_tools.verify_header_keywords(hdulist[1].header, AUX_HEADER_KEYWORDS)
+        # Derive WCS, data and mask for NDCube from fits file.  Only the
+        # requested section of the data is read.
         wcs = WCS(hdulist[0].header)
-        data = hdulist[0].data
-        data_nan_masked = hdulist[0].data
+        item = _get_sji_section_item(hdulist[0].header, wcs, frames, region)
+        wcs = wcs.slice(item)
         if memmap:
-            data_nan_masked[data == BAD_PIXEL_VALUE_UNSCALED] = 0
-            mask = None
-            scaled = False
-            unit = iris_tools.DN_UNIT["SJI_UNSCALED"]
-            uncertainty = None
-        elif not memmap:
-            data_nan_masked[data == BAD_PIXEL_VALUE_SCALED] = np.nan
+            # Leave data on disk, read-only.  Scaling, replacement of bad
+            # pixels by NaN and the mask are only evaluated on access.
+            raw_data = hdulist[0].data[item]
+            raw_data.flags.writeable = False
+            data_nan_masked = iris_tools.LazyArray(
+                raw_data, _scale_sji_data, hdulist[0].header.get("BSCALE", 1),
+                hdulist[0].header.get("BZERO", 0))
+            mask = iris_tools.LazyArray(data_nan_masked, np.isnan)
+        else:
+            data_nan_masked = hdulist[0].section[item]
             mask = data_nan_masked == BAD_PIXEL_VALUE_SCALED
-            scaled = True
-            # Derive unit and readout noise from the detector
-            unit = iris_tools.DN_UNIT["SJI"]
-            readout_noise = iris_tools.READOUT_NOISE["SJI"]
-            # Derive uncertainty of data for NDCube from fits file.
-            uncertainty = u.Quantity(np.sqrt((data_nan_masked*unit).to(u.photon).value
-                                             + readout_noise.to(u.photon).value**2),
-                                     unit=u.photon).to(unit).value
+            data_nan_masked[mask] = np.nan
+        scaled = True
+        # Derive unit and readout noise from the detector
+        unit = iris_tools.DN_UNIT["SJI"]
+        readout_noise = iris_tools.READOUT_NOISE["SJI"]
+        # Derive uncertainty of data for NDCube when it is first accessed.
+        uncertainty = iris_tools.LazyPoissonUncertainty(unit=unit, data=data_nan_masked,
+                                                        readout_noise=readout_noise)
+        # Read auxiliary data of requested frames only.
+        aux_data = hdulist[1].section[item[0], :]
+        aux_header = hdulist[1].header
         # Derive exposure time from detector.
-        exposure_times = hdulist[1].data[:, hdulist[1].header["EXPTIMES"]]
+        exposure_times = aux_data[:, aux_header["EXPTIMES"]]
         # Derive extra coordinates for NDCube from fits file.
-        times = np.array([parse_time(hdulist[0].header["STARTOBS"])
-                          + timedelta(seconds=s)
-                          for s in hdulist[1].data[:, hdulist[1].header["TIME"]]])
-        pztx = hdulist[1].data[:, hdulist[1].header["PZTX"]] * u.arcsec
-        pzty = hdulist[1].data[:, hdulist[1].header["PZTY"]] * u.arcsec
-        xcenix = hdulist[1].data[:, hdulist[1].header["XCENIX"]] * u.arcsec
-        ycenix = hdulist[1].data[:, hdulist[1].header["YCENIX"]] * u.arcsec
-        obs_vrix = hdulist[1].data[:, hdulist[1].header["OBS_VRIX"]] * u.m/u.s
-        ophaseix = hdulist[1].data[:, hdulist[1].header["OPHASEIX"]]
-        slit_pos_x = hdulist[1].data[:, hdulist[1].header["SLTPX1IX"]]
-        slit_pos_y = hdulist[1].data[:, hdulist[1].header["SLTPX2IX"]]
+        times = iris_tools.calculate_times(hdulist[0].header["STARTOBS"],
+                                           aux_data[:, aux_header["TIME"]],
+                                           datetime_objects=datetime_objects)
+        pztx = aux_data[:, aux_header["PZTX"]] * u.arcsec
+        pzty = aux_data[:, aux_header["PZTY"]] * u.arcsec
+        xcenix = aux_data[:, aux_header["XCENIX"]] * u.arcsec
+        ycenix = aux_data[:, aux_header["YCENIX"]] * u.arcsec
+        obs_vrix = aux_data[:, aux_header["OBS_VRIX"]] * u.m/u.s
+        ophaseix = aux_data[:, aux_header["OPHASEIX"]]
+        # Slit position is in pixels of full field of view so is shifted to
+        # pixels of region read.
+        slit_pos_x = aux_data[:, aux_header["SLTPX1IX"]] - item[2].start
+        slit_pos_y = aux_data[:, aux_header["SLTPX2IX"]] - item[1].start
         extra_coords = [('TIME', 0, times), ("PZTX", 0, pztx), ("PZTY", 0, pzty),
                         ("XCENIX", 0, xcenix), ("YCENIX", 0, ycenix),
                         ("OBS_VRIX", 0, obs_vrix), ("OPHASEIX", 0, ophaseix),
@@ -529,7 +617,7 @@ def read_iris_sji_level2_fits(filenames, memmap=False):
                 'TWAVE1': hdulist[0].header.get('TWAVE1', None),
                 'STARTOBS': startobs,
                 'ENDOBS': endobs,
-                'NBFRAMES': hdulist[0].data.shape[0],
+                'NBFRAMES': data_nan_masked.shape[0],
                 'OBSID': hdulist[0].header.get('OBSID', None),
                 'OBS_DESC': hdulist[0].header.get('OBS_DESC', None),
                 'FOVX': hdulist[0].header.get('FOVX', None),
@@ -554,6 +642,67 @@ def read_iris_sji_level2_fits(filenames, memmap=False):
         return IRISMapCubeSequence(list_of_cubes, meta=meta, common_axis=0)
 
 
+def _scale_sji_data(data, bscale, bzero):
+    # Scales raw SJI data and replaces bad pixels with NaN.
+    scaled_data = iris_tools._scale_data(data, bscale, bzero)
+    scaled_data[scaled_data == BAD_PIXEL_VALUE_SCALED] = np.nan
+    return scaled_data
+
+
+def _get_sji_section_item(header, wcs, frames=None, region=None):
+    """
+    Returns tuple of slices selecting frames and spatial region of SJI data.
+
+    Parameters
+    ----------
+    header: `astropy.io.fits.Header`
+        Header of HDU holding SJI data.
+
+    wcs: `astropy.wcs.WCS`
+        WCS of SJI data.
+
+    frames, region:
+        See `read_iris_sji_level2_fits`.
+
+    Returns
+    -------
+    item: `tuple` of `slice`
+        Slices of time, y and x axes with non-negative start and stop.
+
+    """
+    shape = (header["NAXIS3"], header["NAXIS2"], header["NAXIS1"])
+    if frames is None:
+        frames = slice(None)
+    elif not isinstance(frames, slice):
+        frames = slice(*frames)
+    if frames.step is not None and frames.step < 1:
+        raise ValueError("Step of frames must be positive.")
+    if region is None:
+        spatial_slices = [slice(None), slice(None)]
+    else:
+        y_range, x_range = region
+        if any([isinstance(bound, u.Quantity) for bound in list(y_range) + list(x_range)]):
+            # Convert world region to smallest pixel region containing it.
+            celestial_wcs = wcs.celestial
+            lon, lat = np.meshgrid(
+                u.Quantity(list(x_range)).to(celestial_wcs.wcs.cunit[0]).value,
+                u.Quantity(list(y_range)).to(celestial_wcs.wcs.cunit[1]).value)
+            x_pixel, y_pixel = celestial_wcs.all_world2pix(lon.ravel(), lat.ravel(), 0)
+            y_range = (int(np.floor(y_pixel.min() + 0.5)), int(np.floor(y_pixel.max() + 0.5)) + 1)
+            x_range = (int(np.floor(x_pixel.min() + 0.5)), int(np.floor(x_pixel.max() + 0.5)) + 1)
+        spatial_slices = [slice(max(int(y_range[0]), 0), int(y_range[1])),
+                          slice(max(int(x_range[0]), 0), int(x_range[1]))]
+    item = [frames] + spatial_slices
+    # Replace None and negative bounds so WCS and slit position can be
+    # shifted by the start of each slice.
+    item = tuple([slice(*axis_slice.indices(axis_length))
+                  for axis_slice, axis_length in zip(item, shape)])
+    if any([len(range(axis_slice.start, axis_slice.stop, axis_slice.step)) == 0
+            for axis_slice in item]):
+        raise ValueError("frames and region do not overlap with data.")
+    return item
+
+
 class SJIMap(GenericMap):
     def __init__(self, data, header, **kwargs):
         raise ImportError("This class has been replaced by irispy.sji.IRISMapCube.")
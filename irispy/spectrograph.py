@@ -1,21 +1,46 @@
 # -*- coding: utf-8 -*-
 # Author: Daniel Ryan <ryand5@tcd.ie>
 
-import copy
-import datetime
+import collections
+import functools
+import concurrent.futures
 
 import numpy as np
 import astropy.units as u
 from astropy.io import fits
 from astropy.table import Table
+from astropy.nddata import StdDevUncertainty
 from ndcube import NDCube, NDCubeSequence
 from ndcube.utils.wcs import WCS
 from ndcube.utils.cube import convert_extra_coords_dict_to_input_format
 from sunpy.time import parse_time
 
-from irispy import iris_tools
-
-__all__ = ['IRISSpectrograph']
+from irispy import iris_tools, catalog
+
+__all__ = ['IRISSpectrograph', 'scan_iris_spectrograph_level2_fits',
+           'iter_iris_spectrograph_level2_fits',
+           'calculate_orbital_wavelength_variation', 'apply_orbital_wavelength_correction']
+
+# Value of bad pixels in level 2 spectrograph data.
+BAD_PIXEL_VALUE = -200.
+# Header keywords read from level 2 spectrograph files.  Only these are
+# verified when files are read with verify=False.  Primary header keywords
+# of each spectral window are formatted with the window's index.
+PRIMARY_HEADER_KEYWORDS = ["NWIN", "TELESCOP", "INSTRUME", "DATA_LEV", "OBSID", "OBS_DESC",
+                           "STARTOBS", "ENDOBS", "DATE_OBS", "DATE_END", "DATE", "SAT_ROT",
+                           "AECNOBS", "FOVX", "FOVY", "SUMSPTRN", "SUMSPTRF", "SUMSPAT",
+                           "NEXPOBS", "NRASTERP", "KEYWDDOC", "HLZ", "SAA", "DSUN_OBS",
+                           "IAECEVFL", "IAECFLAG", "IAECFLFL"]
+PRIMARY_WINDOW_HEADER_KEYWORDS = ["TDESC{0}", "TDET{0}", "TWAVE{0}", "TWMIN{0}", "TWMAX{0}"]
+# Keywords of spectral window HDU headers from which data are scaled and
+# the WCS and sections of the data are derived.
+WINDOW_HEADER_KEYWORDS = ["NAXIS", "WCSAXES", "BSCALE", "BZERO", "BUNIT"] + [
+    keyword.format(i) for i in range(1, 4)
+    for keyword in ["NAXIS{0}", "CTYPE{0}", "CUNIT{0}", "CRVAL{0}", "CDELT{0}", "CRPIX{0}",
+                    "CROTA{0}"]] + [
+    "PC{0}_{1}".format(i, j) for i in range(1, 4) for j in range(1, 4)]
+AUX_HEADER_KEYWORDS = ["TIME", "PZTX", "PZTY", "XCENIX", "YCENIX", "OBS_VRIX", "OPHASEIX",
+                       "EXPTIMEF", "EXPTIMEN"]
 
 class IRISSpectrograph(object):
     """
@@ -59,8 +84,10 @@ class IRISSpectrograph(object):
                 for name in self.spectral_windows["spectral window"]])
         obs_start = self.meta["STARTOBS"]
         obs_end = self.meta["ENDOBS"]
-        time_start = self.data[spectral_window][0].extra_coords["time"]["value"].min()
-        time_end = self.data[spectral_window][-1].extra_coords["time"]["value"].max()
+        time_start = iris_tools._as_datetime(
+            self.data[spectral_window][0].extra_coords["time"]["value"].min())
+        time_end = iris_tools._as_datetime(
+            self.data[spectral_window][-1].extra_coords["time"]["value"].max())
         result = []
         # If starting and ending times in same day, print date only once
         for start, end in zip([obs_start, time_start], [obs_end, time_end]):
@@ -129,6 +156,8 @@ class IRISSpectrogramCubeSequence(NDCubeSequence):
         # Initialize Sequence.
         super(IRISSpectrogramCubeSequence, self).__init__(
             data_list, meta=meta, common_axis=common_axis)
+        # Contiguous data, uncertainty and mask arrays of all cubes if packed.
+        self._packed_arrays = None
 
     def __repr__(self):
         return """IRISSpectrogramCubeSequence
@@ -144,10 +173,15 @@ Axis Types: {axis_types}
            inst_end=self[-1].extra_coords["time"]["value"][-1],
            seq_shape=self.dimensions, axis_types=self.world_axis_physical_types)
 
-    def convert_to(self, new_unit_type, copy=False):
+    def convert_to(self, new_unit_type, copy=False, response_version=2, workers=None):
         """
         Converts data, uncertainty and unit of each spectrogram in sequence to new unit.
 
+        Detector type, wavelength grid, spectral dispersion, solid angle and
+        radiometric calibration factor are derived once for the whole sequence
+        provided the spectrograms share a spectral axis and unit.  Otherwise
+        each spectrogram is converted independently.
+
         Parameters
         ----------
         new_unit_type: `str`
@@ -161,17 +195,60 @@ Axis Types: {axis_types}
             If False, the current instance is overwritten.
             Default=False
 
+        response_version: `int`
+            Version of response file used in radiometric calibration.
+            See `IRISSpectrogramCube.convert_to`.  Default=2
+
+        workers: `int` or `None`
+            Number of threads with which to convert spectrograms concurrently.
+            Default=None, implies spectrograms are converted serially.
+
         """
-        converted_data_list = []
-        for cube in self.data:
-            converted_data_list.append(cube.convert_to(new_unit_type))
+        cubes = self.data
+        if len(set([cube.unit for cube in cubes])) == 1 and \
+                len(set([cube._get_radiometric_key() for cube in cubes])) == 1:
+            detector_type = iris_tools.get_detector_type(cubes[0].meta)
+            radiance_factors = [None] * len(cubes)
+            if (new_unit_type == "radiance") != \
+                    cubes[0].unit.is_equivalent(iris_tools.RADIANCE_UNIT):
+                obs_wavelength, spectral_dispersion_per_pixel, solid_angle = \
+                    cubes[0]._get_radiometric_pixel_properties()
+                if response_version > 2:
+                    # Calculate effective areas at times of all exposures at once
+                    # and split them between spectrograms.
+                    cube_times = [np.atleast_1d(cube.extra_coords["time"]["value"])
+                                  for cube in cubes]
+                    radiance_factor = iris_tools.calculate_photons_per_sec_to_radiance_factor(
+                        obs_wavelength, detector_type, spectral_dispersion_per_pixel,
+                        solid_angle, obs_times=np.concatenate(cube_times),
+                        response_version=response_version)
+                    radiance_factors = np.split(
+                        radiance_factor, np.cumsum([len(times) for times in cube_times])[:-1])
+                else:
+                    radiance_factors = [iris_tools.calculate_photons_per_sec_to_radiance_factor(
+                        obs_wavelength, detector_type, spectral_dispersion_per_pixel,
+                        solid_angle, response_version=response_version)] * len(cubes)
+            conversions = [functools.partial(cube._convert_to_with_radiance_factor,
+                                             new_unit_type, detector_type, radiance_factor)
+                           for cube, radiance_factor in zip(cubes, radiance_factors)]
+        else:
+            conversions = [functools.partial(cube.convert_to, new_unit_type,
+                                             response_version=response_version)
+                           for cube in cubes]
+        if workers:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(conversion) for conversion in conversions]
+                converted_data_list = [future.result() for future in futures]
+        else:
+            converted_data_list = [conversion() for conversion in conversions]
         if copy is True:
             return IRISSpectrogramCubeSequence(
                 converted_data_list, meta=self.meta, common_axis=self._common_axis)
         else:
             self.data = converted_data_list
 
-    def apply_exposure_time_correction(self, undo=False, copy=False, force=False):
+    def apply_exposure_time_correction(self, undo=False, copy=False, force=False,
+                                       inplace=False):
         """
         Applies or undoes exposure time correction to data and uncertainty and adjusts unit.
 
@@ -197,6 +274,13 @@ Axis Types: {axis_types}
             If True, correction is applied (undone) regardless of unit.  Unit is still
             adjusted accordingly.
 
+        inplace: `bool`
+            If True, the data and uncertainty arrays of each cube are corrected in
+            place without allocating new arrays.  Cannot be combined with copy=True.
+            See `IRISSpectrogramCube.apply_exposure_time_correction`.  The packed
+            arrays of a packed sequence are corrected as a whole and so stay packed.
+            Default=False
+
         Returns
         -------
         result: `None` or `IRISSpectrogramCubeSequence`
@@ -206,6 +290,13 @@ Axis Types: {axis_types}
             applied (undone).
 
         """
+        if inplace:
+            if copy is True:
+                raise ValueError("copy and inplace cannot both be True.")
+            if not self._apply_packed_exposure_time_correction(undo, force):
+                for cube in self.data:
+                    cube.apply_exposure_time_correction(undo=undo, force=force, inplace=True)
+            return None
         converted_data_list = []
         for cube in self.data:
             converted_data_list.append(cube.apply_exposure_time_correction(undo=undo,
@@ -216,6 +307,195 @@ Axis Types: {axis_types}
         else:
             self.data = converted_data_list
 
+    def pack(self):
+        """
+        Stores the data, uncertainty and mask of all spectrograms in contiguous arrays.
+
+        Each array has one more axis than the spectrograms, its first, which
+        corresponds to the spectrograms, e.g. rasters, of the sequence.  The data,
+        uncertainty and mask of each spectrogram are replaced by views into these
+        arrays.  Therefore slicing across spectrograms, e.g. the time series of a
+        pixel, does not copy data and reductions over the whole sequence are single
+        numpy calls on packed_data, packed_uncertainty and packed_mask.
+
+        All spectrograms must have the same shape.  Memory-mapped data are read
+        into memory and lazily derived uncertainties are calculated.
+
+        """
+        shapes = [cube.data.shape for cube in self.data]
+        if len(set(shapes)) != 1:
+            raise ValueError("Spectrograms must all have the same shape to be packed. "
+                             "Shapes: {0}".format(shapes))
+        packed_shape = (len(self.data),) + shapes[0]
+        data = np.empty(packed_shape,
+                        dtype=np.result_type(*[cube.data.dtype for cube in self.data]))
+        if all([cube.uncertainty is not None for cube in self.data]):
+            uncertainty = np.empty(packed_shape, dtype=np.result_type(
+                *[cube.uncertainty.array.dtype for cube in self.data]))
+        else:
+            uncertainty = None
+        if any([cube.mask is not None for cube in self.data]):
+            mask = np.zeros(packed_shape, dtype=bool)
+        else:
+            mask = None
+        packed_cubes = []
+        for i, cube in enumerate(self.data):
+            data[i] = np.asarray(cube.data)
+            cube_uncertainty = None
+            if uncertainty is not None:
+                uncertainty[i] = cube.uncertainty.array
+                cube_uncertainty = cube.uncertainty.__class__(
+                    uncertainty[i], unit=cube.uncertainty.unit, copy=False)
+            cube_mask = None
+            if mask is not None:
+                if cube.mask is not None:
+                    mask[i] = np.asarray(cube.mask, dtype=bool)
+                cube_mask = mask[i]
+            packed_cubes.append(IRISSpectrogramCube(
+                data[i], cube.wcs, cube_uncertainty, cube.unit, cube.meta,
+                convert_extra_coords_dict_to_input_format(cube.extra_coords,
+                                                          cube.missing_axis),
+                mask=cube_mask, missing_axis=cube.missing_axis))
+        self.data = packed_cubes
+        self._packed_arrays = (data, uncertainty, mask)
+
+    @property
+    def packed_data(self):
+        """
+        `numpy.ndarray` or `None` : Data of all spectrograms in one contiguous array.
+
+        None if the sequence has not been packed or its spectrograms no longer
+        share the packed arrays, e.g. after a conversion with copy=False.
+        See `IRISSpectrogramCubeSequence.pack`.
+        """
+        return self._get_packed_array(0)
+
+    @property
+    def packed_uncertainty(self):
+        """
+        `numpy.ndarray` or `None` : Uncertainty of all spectrograms in one contiguous array.
+
+        See `IRISSpectrogramCubeSequence.packed_data`.
+        """
+        return self._get_packed_array(1)
+
+    @property
+    def packed_mask(self):
+        """
+        `numpy.ndarray` or `None` : Mask of all spectrograms in one contiguous array.
+
+        See `IRISSpectrogramCubeSequence.packed_data`.
+        """
+        return self._get_packed_array(2)
+
+    def _apply_packed_exposure_time_correction(self, undo, force):
+        # Corrects the packed data and uncertainty arrays in place, of which
+        # the cubes' arrays are views, rather than each cube separately which
+        # would copy them.  Returns False if the sequence is not packed.
+        data = self.packed_data
+        uncertainty = self.packed_uncertainty
+        if data is None or uncertainty is None or \
+                not np.issubdtype(data.dtype, np.floating) or \
+                not np.issubdtype(uncertainty.dtype, np.floating) or \
+                len(set([cube.unit for cube in self.data])) != 1 or \
+                not all([cube.uncertainty.array.base is uncertainty for cube in self.data]):
+            return False
+        # Stack exposure times with a leading axis for the cubes and trailing
+        # length 1 axes so they broadcast against the packed arrays.
+        exposure_time = np.stack([np.asarray(cube._get_exposure_time_for_broadcast())
+                                  for cube in self.data])
+        exposure_time = exposure_time.reshape(
+            exposure_time.shape + (1,) * (data.ndim - exposure_time.ndim))
+        if undo:
+            _, new_unit = iris_tools.uncalculate_exposure_time_correction(
+                [data, uncertainty], self.data[0].unit, exposure_time, force=force,
+                inplace=True)
+        else:
+            _, new_unit = iris_tools.calculate_exposure_time_correction(
+                [data, uncertainty], self.data[0].unit, exposure_time, force=force,
+                inplace=True)
+        for cube in self.data:
+            cube._unit = new_unit
+            cube.uncertainty._unit = new_unit
+        return True
+
+    def _get_packed_array(self, index):
+        # Sliced sequences may not have been initialized by __init__.
+        packed_arrays = getattr(self, "_packed_arrays", None)
+        if packed_arrays is None:
+            return None
+        data = packed_arrays[0]
+        if len(self.data) != len(data) or not all(
+                [getattr(cube.data, "base", None) is data for cube in self.data]):
+            return None
+        return packed_arrays[index]
+
+    def calculate_line_moments(self, rest_wavelength, wavelength_range=None,
+                               chunk_size=None, workers=None):
+        """
+        Calculates intensity, Doppler velocity and width maps of a spectral line.
+
+        See `IRISSpectrogramCube.calculate_line_moments`.
+
+        Parameters
+        ----------
+        rest_wavelength, wavelength_range, chunk_size, workers:
+            See `IRISSpectrogramCube.calculate_line_moments`.
+
+        Returns
+        -------
+        moments: `collections.OrderedDict` of `ndcube.NDCubeSequence`
+            Sequences of moment maps keyed by "intensity", "velocity" and "width".
+
+        """
+        cube_moments = [cube.calculate_line_moments(
+            rest_wavelength, wavelength_range=wavelength_range, chunk_size=chunk_size,
+            workers=workers) for cube in self.data]
+        return self._produce_spectral_map_sequences(cube_moments)
+
+    def fit_gaussians(self, n_gaussians=1, wavelength_range=None, chunk_size=None,
+                      workers=None):
+        """
+        Fits one or two Gaussians on a linear background to every spectrum.
+
+        See `IRISSpectrogramCube.fit_gaussians`.
+
+        Parameters
+        ----------
+        n_gaussians, wavelength_range, chunk_size:
+            See `IRISSpectrogramCube.fit_gaussians`.
+
+        workers: `int` or `None`
+            Number of processes with which to fit spectrograms, e.g. rasters,
+            concurrently.  Default=None, implies spectrograms are fit serially.
+
+        Returns
+        -------
+        parameters: `collections.OrderedDict` of `ndcube.NDCubeSequence`
+            Sequences of parameter maps keyed by parameter name.
+
+        """
+        fit_inputs = [cube._get_gaussian_fit_inputs(wavelength_range) for cube in self.data]
+        fit_function = functools.partial(_fit_gaussians_to_arrays, n_gaussians=n_gaussians,
+                                         chunk_size=chunk_size)
+        if workers:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                fit_arrays = list(pool.map(fit_function, *zip(*fit_inputs)))
+        else:
+            fit_arrays = [fit_function(*fit_input) for fit_input in fit_inputs]
+        return self._produce_spectral_map_sequences(
+            [cube._produce_gaussian_fit_maps(n_gaussians, *cube_fit_arrays)
+             for cube, cube_fit_arrays in zip(self.data, fit_arrays)])
+
+    def _produce_spectral_map_sequences(self, cube_maps):
+        # Combines dicts of maps derived from each cube into dict of sequences.
+        sequences = collections.OrderedDict()
+        for key in cube_maps[0]:
+            sequences[key] = NDCubeSequence([maps[key] for maps in cube_maps],
+                                            meta=self.meta, common_axis=self._common_axis)
+        return sequences
+
+
 class IRISSpectrogramCube(NDCube):
     """
     Class representing IRISSpectrogramCube data described by a single WCS.
@@ -281,11 +561,39 @@ class IRISSpectrogramCube(NDCube):
             unit=unit, extra_coords=extra_coords, copy=copy, missing_axis=missing_axis)
 
     def __getitem__(self, item):
-        result = super(IRISSpectrogramCube, self).__getitem__(item)
-        return IRISSpectrogramCube(
-            result.data, result.wcs, result.uncertainty, result.unit, result.meta,
-            convert_extra_coords_dict_to_input_format(result.extra_coords, result.missing_axis),
-            mask=result.mask, missing_axis=result.missing_axis)
+        if item is None or (isinstance(item, tuple) and None in item):
+            raise IndexError("None indices not supported")
+        if self.data.shape == ():
+            raise TypeError("scalars cannot be sliced.")
+        # Slice data, uncertainty, mask, wcs and extra coords with parent
+        # machinery.  A slice of a valid cube is valid so the result is
+        # initialized as an NDCube without re-checking IRISSpectrogramCube
+        # requirements.  Meta is shared, not copied.
+        kwargs = self._slice(item)
+        result = self.__class__.__new__(self.__class__)
+        super(IRISSpectrogramCube, result).__init__(**kwargs)
+        return result
+
+    def _slice_extra_coords(self, item, missing_axis):
+        """
+        Slices extra coords in the same way as NDCube without copying them.
+
+        Values of the sliced cube are views of, or shared with, those of this cube.
+        """
+        if self.extra_coords is None:
+            return None
+        sliced_extra_coords = {}
+        for name, coord in self.extra_coords.items():
+            value = coord["value"]
+            axis = coord["axis"]
+            if isinstance(item, (slice, int)):
+                if axis == 0:
+                    value = value[item]
+            elif isinstance(item, tuple) and axis is not None and axis < len(item):
+                value = value[item[axis]]
+            sliced_extra_coords[name] = {
+                "wcs axis": self._extra_coords_wcs_axis[name]["wcs axis"], "value": value}
+        return convert_extra_coords_dict_to_input_format(sliced_extra_coords, missing_axis)
 
     def __repr__(self):
         if self.extra_coords["time"]["axis"] is None:
@@ -308,7 +616,7 @@ Axis Types: {axis_types}
            inst_start=instance_start, inst_end=instance_end,
            shape=self.dimensions, axis_types=self.world_axis_physical_types)
 
-    def convert_to(self, new_unit_type):
+    def convert_to(self, new_unit_type, response_version=2):
         """
         Converts data, unit and uncertainty attributes to new unit type.
 
@@ -323,6 +631,11 @@ Axis Types: {axis_types}
            "photons": photon counts
            "radiance": Perorms radiometric calibration conversion.
 
+        response_version: `int`
+            Version of response file used in radiometric calibration.
+            For versions 3 and above, the effective area at the time of
+            each exposure is used.  Default=2, i.e. pre-launch response.
+
         Returns
         -------
         result: `IRISSpectrogramCube`
@@ -330,69 +643,79 @@ Axis Types: {axis_types}
 
         """
         detector_type = iris_tools.get_detector_type(self.meta)
-        if new_unit_type == "radiance" or self.unit.is_equivalent(iris_tools.RADIANCE_UNIT):
-            # Get spectral dispersion per pixel.
-            spectral_wcs_index = np.where(np.array(self.wcs.wcs.ctype) == "WAVE")[0][0]
-            spectral_dispersion_per_pixel = self.wcs.wcs.cdelt[spectral_wcs_index] * \
-                                            self.wcs.wcs.cunit[spectral_wcs_index]
-            # Get solid angle from slit width for a pixel.
-            lat_wcs_index = ["HPLT" in c for c in self.wcs.wcs.ctype]
-            lat_wcs_index = np.arange(len(self.wcs.wcs.ctype))[lat_wcs_index]
-            lat_wcs_index = lat_wcs_index[0]
-            solid_angle = self.wcs.wcs.cdelt[lat_wcs_index] * \
-                          self.wcs.wcs.cunit[lat_wcs_index] * iris_tools.SLIT_WIDTH
-            # Get wavelength for each pixel.
-            spectral_data_index = (-1) * (np.arange(len(self.dimensions)) + 1)[spectral_wcs_index]
-            obs_wavelength = self.axis_world_coords(2)
-        if new_unit_type == "DN" or new_unit_type == "photons":
-            if self.unit.is_equivalent(iris_tools.RADIANCE_UNIT):
-                # Convert from radiance to counts/s
-                new_data_quantities = iris_tools.convert_or_undo_photons_per_sec_to_radiance(
-                    (self.data * self.unit, self.uncertainty.array * self.unit),
-                    obs_wavelength, detector_type, spectral_dispersion_per_pixel, solid_angle,
-                    undo=True)
-                new_data = new_data_quantities[0].value
-                new_uncertainty = new_data_quantities[1].value
-                new_unit = new_data_quantities[0].unit
-                self = IRISSpectrogramCube(
-                    new_data, self.wcs, new_uncertainty, new_unit, self.meta,
-                    convert_extra_coords_dict_to_input_format(self.extra_coords, self.missing_axis),
-                    mask=self.mask, missing_axis=self.missing_axis)
-            if new_unit_type == "DN":
-                new_unit = iris_tools.DN_UNIT[detector_type]
+        radiance_factor = None
+        if (new_unit_type == "radiance") != self.unit.is_equivalent(iris_tools.RADIANCE_UNIT):
+            # Get wavelength, spectral dispersion and solid angle of pixels.
+            obs_wavelength, spectral_dispersion_per_pixel, solid_angle = \
+                self._get_radiometric_pixel_properties()
+            # Get radiometric calibration factor.
+            if response_version > 2:
+                obs_times = self.extra_coords["time"]["value"]
             else:
-                new_unit = u.photon
-            new_data_arrays, new_unit = iris_tools.convert_between_DN_and_photons(
-                (self.data, self.uncertainty.array), self.unit, new_unit)
-            new_data = new_data_arrays[0]
-            new_uncertainty = new_data_arrays[1]
-        elif new_unit_type == "radiance":
-            if self.unit.is_equivalent(iris_tools.RADIANCE_UNIT):
-                new_data = self.data
-                new_uncertainty = self.uncertainty
-                new_unit = self.unit
-            else:
-                # Ensure spectrogram is in units of counts/s.
-                cube = self.convert_to("photons")
-                try:
-                    cube = cube.apply_exposure_time_correction()
-                except ValueError(iris_tools.APPLY_EXPOSURE_TIME_ERROR):
-                    pass
-                # Convert to radiance units.
-                new_data_quantities = iris_tools.convert_or_undo_photons_per_sec_to_radiance(
-                    (cube.data*cube.unit, cube.uncertainty.array*cube.unit),
-                    obs_wavelength, detector_type, spectral_dispersion_per_pixel, solid_angle)
-                new_data = new_data_quantities[0].value
-                new_uncertainty = new_data_quantities[1].value
-                new_unit = new_data_quantities[0].unit
-        else:
-            raise ValueError("Input unit type not recognized.")
+                obs_times = None
+            radiance_factor = iris_tools.calculate_photons_per_sec_to_radiance_factor(
+                obs_wavelength, detector_type, spectral_dispersion_per_pixel,
+                solid_angle, obs_times=obs_times, response_version=response_version)
+        return self._convert_to_with_radiance_factor(new_unit_type, detector_type,
+                                                     radiance_factor)
+
+    def _get_radiometric_pixel_properties(self):
+        # Returns wavelength of each spectral pixel, spectral dispersion per
+        # pixel and solid angle of a pixel, as used in radiometric calibration.
+        # Get spectral dispersion per pixel.
+        spectral_wcs_index = np.where(np.array(self.wcs.wcs.ctype) == "WAVE")[0][0]
+        spectral_dispersion_per_pixel = self.wcs.wcs.cdelt[spectral_wcs_index] * \
+                                        self.wcs.wcs.cunit[spectral_wcs_index]
+        # Get solid angle from slit width for a pixel.
+        lat_wcs_index = ["HPLT" in c for c in self.wcs.wcs.ctype]
+        lat_wcs_index = np.arange(len(self.wcs.wcs.ctype))[lat_wcs_index]
+        lat_wcs_index = lat_wcs_index[0]
+        solid_angle = self.wcs.wcs.cdelt[lat_wcs_index] * \
+                      self.wcs.wcs.cunit[lat_wcs_index] * iris_tools.SLIT_WIDTH
+        # Get wavelength for each pixel.
+        obs_wavelength = self.axis_world_coords(2)
+        return obs_wavelength, spectral_dispersion_per_pixel, solid_angle
+
+    def _get_radiometric_key(self):
+        # Returns properties of the WCS which determine the output of
+        # _get_radiometric_pixel_properties.  Cubes with equal keys share it.
+        spectral_wcs_index = np.where(np.array(self.wcs.wcs.ctype) == "WAVE")[0][0]
+        lat_wcs_index = ["HPLT" in c for c in self.wcs.wcs.ctype].index(True)
+        return (self.data.ndim, self.data.shape[-1], str(self.wcs.wcs.cunit[spectral_wcs_index]),
+                self.wcs.wcs.cdelt[spectral_wcs_index], self.wcs.wcs.crval[spectral_wcs_index],
+                self.wcs.wcs.crpix[spectral_wcs_index], str(self.wcs.wcs.cunit[lat_wcs_index]),
+                self.wcs.wcs.cdelt[lat_wcs_index])
+
+    def _convert_to_with_radiance_factor(self, new_unit_type, detector_type,
+                                         radiance_factor=None):
+        # Converts cube to new unit type given the output of
+        # iris_tools.calculate_photons_per_sec_to_radiance_factor for this cube.
+        exposure_time_s = None
+        if radiance_factor is not None:
+            # Shape radiometric calibration factor to broadcast with data.
+            if radiance_factor.ndim > 1 and len(radiance_factor) == 1:
+                radiance_factor = radiance_factor[0]
+            if radiance_factor.ndim == 1:
+                radiance_factor = iris_tools._reshape_1D_wavelength_dimensions_for_broadcast(
+                    radiance_factor, self.data.ndim)
+            elif self.data.ndim == 3:
+                # Time dependent factor varies along the exposure axis.
+                radiance_factor = radiance_factor[:, np.newaxis, :]
+            if not self.unit.is_equivalent(iris_tools.RADIANCE_UNIT):
+                exposure_time_s = self._get_exposure_time_for_broadcast()
+        # Combine all stages of the conversion into a single factor and
+        # apply it to data and uncertainty in one pass.
+        factor, new_unit = iris_tools.calculate_unit_conversion_factor(
+            self.unit, new_unit_type, detector_type, exposure_time=exposure_time_s,
+            radiance_factor=radiance_factor)
+        new_data, new_uncertainty = iris_tools.apply_unit_conversion_factor(
+            (self.data, self.uncertainty.array), factor)
         return IRISSpectrogramCube(
             new_data, self.wcs, new_uncertainty, new_unit, self.meta,
             convert_extra_coords_dict_to_input_format(self.extra_coords, self.missing_axis),
             mask=self.mask, missing_axis=self.missing_axis)
 
-    def apply_exposure_time_correction(self, undo=False, force=False):
+    def apply_exposure_time_correction(self, undo=False, force=False, inplace=False):
         """
         Applies or undoes exposure time correction to data and uncertainty and adjusts unit.
 
@@ -413,12 +736,194 @@ Axis Types: {axis_types}
             If True, correction is applied (undone) regardless of unit.  Unit is still
             adjusted accordingly.
 
+        inplace: `bool`
+            If True, data and uncertainty arrays are divided (multiplied) in place and
+            only the unit of this cube is changed.  Data must be a writeable floating
+            point array, e.g. not memory-mapped.  Arrays this cube does not own, e.g.
+            views of the cube this cube was sliced from, are copied before correction
+            so that the objects sharing them are left unchanged.
+            Default=False
+
         Returns
         -------
-        result: `IRISSpectrogramCube`
-            New IRISSpectrogramCube in new units.
+        result: `IRISSpectrogramCube` or `None`
+            New IRISSpectrogramCube in new units.  None if inplace=True.
+
+        """
+        exposure_time_s = self._get_exposure_time_for_broadcast()
+        if inplace:
+            iris_tools._apply_exposure_time_correction_inplace(self, exposure_time_s,
+                                                               undo=undo, force=force)
+            return None
+        # Based on value on undo kwarg, apply or remove exposure time correction.
+        if undo is True:
+            new_data_arrays, new_unit = iris_tools.uncalculate_exposure_time_correction(
+                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
+        else:
+            new_data_arrays, new_unit = iris_tools.calculate_exposure_time_correction(
+                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
+        # Return new instance of IRISSpectrogramCube with correction applied/undone.
+        return IRISSpectrogramCube(
+            new_data_arrays[0], self.wcs, new_data_arrays[1], new_unit, self.meta,
+            convert_extra_coords_dict_to_input_format(self.extra_coords, self.missing_axis),
+            mask=self.mask, missing_axis=self.missing_axis)
 
+    def calculate_line_moments(self, rest_wavelength, wavelength_range=None,
+                               chunk_size=None, workers=None):
         """
+        Calculates intensity, Doppler velocity and width maps of a spectral line.
+
+        Moments are calculated for every spectrum, i.e. all non-spectral pixels,
+        at once.  Masked pixels are ignored.
+
+        Parameters
+        ----------
+        rest_wavelength: `astropy.units.Quantity`
+            Rest wavelength of line relative to which Doppler velocity is calculated.
+
+        wavelength_range: `astropy.units.Quantity` of length 2 or `None`
+            Lower and upper wavelength bounds of line.  Only pixels within these
+            bounds contribute to moments.  Default=None, implies whole spectral axis.
+
+        chunk_size: `int` or `None`
+            Number of indices along first axis processed together.  Smaller chunks
+            reduce peak memory, e.g. for memory-mapped data.
+            Default=None, implies all data processed together.
+
+        workers: `int` or `None`
+            Number of threads with which to process chunks concurrently.
+            Default=None, implies chunks are processed serially.
+
+        Returns
+        -------
+        moments: `collections.OrderedDict` of `ndcube.NDCube`
+            Maps keyed by "intensity", "velocity" and "width".  See
+            `irispy.iris_tools.calculate_line_moments`.  Maps have the
+            coordinates of the non-spectral axes of this cube.
+
+        """
+        spectral_slice, wavelength = self._get_spectral_slice(wavelength_range)
+        n_first_axis = self.data.shape[0]
+        if not chunk_size:
+            chunk_size = n_first_axis
+        chunks = [slice(start, start + chunk_size) for start in range(0, n_first_axis, chunk_size)]
+
+        def _calculate_chunk_moments(chunk):
+            chunk_mask = None
+            if self.mask is not None:
+                chunk_mask = np.asarray(self.mask[chunk, ..., spectral_slice])
+            return iris_tools.calculate_line_moments(
+                np.asarray(self.data[chunk, ..., spectral_slice]), wavelength,
+                rest_wavelength, mask=chunk_mask)
+
+        if workers:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                chunk_moments = list(pool.map(_calculate_chunk_moments, chunks))
+        else:
+            chunk_moments = [_calculate_chunk_moments(chunk) for chunk in chunks]
+        moment_units = [chunk_moments[0][0].unit * self.unit, chunk_moments[0][1].unit,
+                        chunk_moments[0][2].unit]
+        moment_arrays = [np.concatenate([chunk[i].value for chunk in chunk_moments])
+                         for i in range(3)]
+        # Mask spectra without any valid positive intensity.
+        moment_mask = ~np.isfinite(moment_arrays[1])
+        return self._produce_spectral_maps(["intensity", "velocity", "width"], moment_arrays,
+                                           moment_units, moment_mask)
+
+    def fit_gaussians(self, n_gaussians=1, wavelength_range=None, chunk_size=None):
+        """
+        Fits one or two Gaussians on a linear background to every spectrum.
+
+        All spectra are fit simultaneously.  Masked pixels, e.g. bad pixels
+        with value -200, are ignored and residuals are weighted by the inverse
+        uncertainty.  Initial guesses are derived from spectral moments.
+
+        Parameters
+        ----------
+        n_gaussians: `int`
+            Number of Gaussians in model.  Must be 1 or 2.  Default=1
+
+        wavelength_range: `astropy.units.Quantity` of length 2 or `None`
+            Lower and upper wavelength bounds of fit.
+            Default=None, implies whole spectral axis.
+
+        chunk_size: `int` or `None`
+            Number of indices along first axis fit together.  Smaller chunks
+            reduce peak memory.  Default=None, implies all data fit together.
+
+        Returns
+        -------
+        parameters: `collections.OrderedDict` of `ndcube.NDCube`
+            Maps of best-fit parameters with their uncertainties keyed by parameter
+            name.  See `irispy.iris_tools.fit_gaussians_on_linear_bg`.  Spectra
+            whose fits did not converge are masked.
+
+        """
+        fit_arrays = _fit_gaussians_to_arrays(
+            *self._get_gaussian_fit_inputs(wavelength_range),
+            n_gaussians=n_gaussians, chunk_size=chunk_size)
+        return self._produce_gaussian_fit_maps(n_gaussians, *fit_arrays)
+
+    def _get_spectral_slice(self, wavelength_range=None):
+        # Returns slice of spectral axis within wavelength_range and the
+        # wavelengths of its pixels.
+        if self.data.ndim < 2:
+            raise ValueError("IRISSpectrogramCube must have at least one non-spectral axis.")
+        wavelength = self.axis_world_coords(self.data.ndim - 1)
+        if wavelength_range is None:
+            spectral_slice = slice(None)
+        else:
+            in_range = np.nonzero(np.logical_and(wavelength >= wavelength_range[0],
+                                                 wavelength <= wavelength_range[1]))[0]
+            if len(in_range) == 0:
+                raise ValueError("wavelength_range does not overlap with spectral axis.")
+            spectral_slice = slice(in_range[0], in_range[-1] + 1)
+        return spectral_slice, wavelength[spectral_slice]
+
+    def _get_gaussian_fit_inputs(self, wavelength_range=None):
+        # Returns data, mask, uncertainty and wavelength arrays to be fit.
+        spectral_slice, wavelength = self._get_spectral_slice(wavelength_range)
+        data = np.asarray(self.data[..., spectral_slice])
+        if self.mask is None:
+            mask = data == BAD_PIXEL_VALUE
+        else:
+            mask = np.asarray(self.mask[..., spectral_slice], dtype=bool)
+        uncertainty = None
+        if self.uncertainty is not None:
+            uncertainty = np.asarray(self.uncertainty.array[..., spectral_slice])
+        return data, mask, uncertainty, wavelength
+
+    def _produce_gaussian_fit_maps(self, n_gaussians, parameters, parameter_uncertainties,
+                                   converged):
+        # Returns NDCubes of gaussian fit parameters keyed by parameter name.
+        names = ["amplitude", "mean", "standard deviation"]
+        units = [self.unit, u.Angstrom, u.Angstrom]
+        if n_gaussians > 1:
+            names = ["{0} {1}".format(name, i + 1) for i in range(n_gaussians) for name in names]
+        units = units * n_gaussians + [self.unit, self.unit / u.Angstrom]
+        names = names + ["constant term", "linear term"]
+        return self._produce_spectral_maps(
+            names, np.moveaxis(parameters, -1, 0), units, ~converged,
+            uncertainties=np.moveaxis(parameter_uncertainties, -1, 0))
+
+    def _produce_spectral_maps(self, names, arrays, units, mask, uncertainties=None):
+        # Returns NDCubes holding quantities derived from each spectrum.
+        # Their coordinates are those of the cube without the spectral axis.
+        spatial_cube = self[..., 0]
+        extra_coords = convert_extra_coords_dict_to_input_format(spatial_cube.extra_coords,
+                                                                 spatial_cube.missing_axis)
+        if uncertainties is None:
+            uncertainties = [None] * len(names)
+        maps = collections.OrderedDict()
+        for name, array, unit, uncertainty in zip(names, arrays, units, uncertainties):
+            if uncertainty is not None:
+                uncertainty = StdDevUncertainty(uncertainty)
+            maps[name] = NDCube(array, spatial_cube.wcs, uncertainty=uncertainty, mask=mask,
+                                meta=self.meta, unit=unit, extra_coords=extra_coords,
+                                missing_axis=spatial_cube.missing_axis)
+        return maps
+
+    def _get_exposure_time_for_broadcast(self):
         # Get exposure time in seconds and change array's shape so that
         # it can be broadcast with data and uncertainty arrays.
         exposure_time_s = self.extra_coords["exposure time"]["value"].to(u.s).value
@@ -433,193 +938,781 @@ Axis Types: {axis_types}
                 raise ValueError(
                     "IRISSpectrogramCube dimensions must be 2 or 3. Dimensions={0}".format(
                         len(self.dimensions.shape)))
-        # Based on value on undo kwarg, apply or remove exposure time correction.
-        if undo is True:
-            new_data_arrays, new_unit = iris_tools.uncalculate_exposure_time_correction(
-                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
-        else:
-            new_data_arrays, new_unit = iris_tools.calculate_exposure_time_correction(
-                (self.data, self.uncertainty.array), self.unit, exposure_time_s, force=force)
-        # Return new instance of IRISSpectrogramCube with correction applied/undone.
-        return IRISSpectrogramCube(
-            new_data_arrays[0], self.wcs, new_data_arrays[1], new_unit, self.meta,
-            convert_extra_coords_dict_to_input_format(self.extra_coords, self.missing_axis),
-            mask=self.mask, missing_axis=self.missing_axis)
+        return exposure_time_s
 
 
-def read_iris_spectrograph_level2_fits(filenames, spectral_windows=None):
+def read_iris_spectrograph_level2_fits(filenames, spectral_windows=None, memmap=False,
+                                       workers=None, executor=None, datetime_objects=False,
+                                       wavelength_range=None, slit_range=None, packed=False,
+                                       verify=True):
     """
     Reads IRIS level 2 spectrograph FITS from an OBS into an IRISSpectrograph instance.
 
     Parameters
     ----------
-    filenames: `list` of `str` or `str`
+    filenames: `list` of `str` or `str` or `irispy.catalog.CatalogQuery`
         Filename of filenames to be read.  They must all be associated with the same
-        OBS number.
+        OBS number.  If a CatalogQuery, the spectrograph files matching the query
+        are read.
 
     spectral_windows: iterable of `str` or `str`
         Spectral windows to extract from files.  Default=None, implies, extract all
-        spectral windows.
+        spectral windows, or if filenames is a CatalogQuery with a spectral_window
+        criterion, extract the queried windows.
+
+    memmap: `bool`
+        If True, the data of each spectral window is memory-mapped rather than read
+        into memory.  Scaling of the data and the bad pixel mask are then only
+        calculated for the elements that are accessed, e.g. after slicing.
+        Default=False
+
+    workers: `int` or `None`
+        Number of threads with which to read files concurrently.
+        Default=None, implies files are read serially.
+
+    executor: `concurrent.futures.Executor` or `None`
+        Executor, e.g. a `concurrent.futures.ProcessPoolExecutor`, with which
+        to read files concurrently.  Overrides workers.  The executor is not shut
+        down by this function.  Must be a `concurrent.futures.ThreadPoolExecutor`
+        if memmap=True as data returned by other processes would be copied into
+        memory rather than memory-mapped.  Default=None
+
+    datetime_objects: `bool`
+        If True, the time extra coord is an object array of `datetime.datetime`
+        as in previous versions.  Otherwise it has datetime64 dtype.
+        Default=False
+
+    wavelength_range: `astropy.units.Quantity` of length 2 or `None`
+        Lower and upper wavelength bounds of section of each spectral window
+        to read.  Every requested window must overlap with it.
+        Default=None, implies whole spectral axis.
+
+    slit_range: `tuple` of 2 `int` or `None`
+        Start and stop pixel indices of section of slit to read.
+        Default=None, implies whole slit.
+
+    packed: `bool`
+        If True, the spectrograms of each spectral window are stored in contiguous
+        arrays.  See `IRISSpectrogramCubeSequence.pack`.  All files must then have
+        the same number of exposures.  Cannot be combined with memmap=True.
+        Default=False
+
+    verify: `bool`
+        If True, every header card of every HDU is verified and fixed when a file
+        is opened.  If False, only the cards of the header keywords used by the
+        reader are, which is faster for files with many keywords or extensions.
+        Default=True
 
     Returns
     -------
     result: `irispy.spectrograph.IRISSpectrograph`
 
+    Notes
+    -----
+    However the files are read, the cubes in each sequence are in the same order
+    as filenames.
+
+    The uncertainty of each cube is a `irispy.iris_tools.LazyPoissonUncertainty`
+    so it is only calculated when its array attribute is first accessed.
+
+    If wavelength_range or slit_range are set, only that section of each window
+    is read from disk and the WCS of each cube is offset accordingly.
+
+    The extra coord arrays of a file, e.g. time and pztx, are shared between
+    the cubes of its spectral windows rather than copied for each.  So that
+    changing them through one cube cannot change the others, they are
+    read-only and changing them in place raises a ValueError.  To change an
+    extra coord, copy its array first, e.g.
+    ``pztx = cube.extra_coords["pztx"]["value"].copy()``, and build a new cube
+    with it.
+
     """
+    if memmap and packed:
+        raise ValueError("memmap and packed cannot both be True.")
+    if memmap and executor is not None and \
+            not isinstance(executor, concurrent.futures.ThreadPoolExecutor):
+        raise ValueError("memmap=True requires executor to be a "
+                         "concurrent.futures.ThreadPoolExecutor.  Data read by other "
+                         "executors are copied into memory when returned.")
+    if isinstance(filenames, catalog.CatalogQuery):
+        if not spectral_windows:
+            spectral_windows = filenames.spectral_window
+        filenames = filenames.filenames(instrument=catalog.SPECTROGRAPH_INSTRUMENT)
+        if not filenames:
+            raise ValueError("No spectrograph files match catalog query.")
     if type(filenames) is str:
         filenames = [filenames]
-    for f, filename in enumerate(filenames):
-        hdulist = fits.open(filename)
-        hdulist.verify('fix')
-        if f == 0:
-            # Determine number of raster positions in a scan
-            raster_positions_per_scan = int(hdulist[0].header["NRASTERP"])
-            # Collecting the window observations.
-            windows_in_obs = np.array([hdulist[0].header["TDESC{0}".format(i)]
-                                       for i in range(1, hdulist[0].header["NWIN"]+1)])
-            # If spectral_window is not set then get every window.
-            # Else take the appropriate windows
-            if not spectral_windows:
-                spectral_windows_req = windows_in_obs
-                window_fits_indices = range(1, len(hdulist)-2)
-            else:
-                if type(spectral_windows) is str:
-                    spectral_windows_req = [spectral_windows]
-                spectral_windows_req = np.asarray(spectral_windows_req, dtype="U")
-                window_is_in_obs = np.asarray(
-                    [window in windows_in_obs for window in spectral_windows_req])
-                if not all(window_is_in_obs):
-                    missing_windows = window_is_in_obs == False
-                    raise ValueError("Spectral windows {0} not in file {1}".format(
-                        spectral_windows[missing_windows], filenames[0]))
-                window_fits_indices = np.nonzero(np.in1d(windows_in_obs,
-                                                         spectral_windows))[0]+1
-            # Generate top level meta dictionary from first file
-            # main header.
-            top_meta = {"TELESCOP": hdulist[0].header["TELESCOP"],
-                        "INSTRUME": hdulist[0].header["INSTRUME"],
-                        "DATA_LEV": hdulist[0].header["DATA_LEV"],
-                        "OBSID": hdulist[0].header["OBSID"],
-                        "OBS_DESC": hdulist[0].header["OBS_DESC"],
-                        "STARTOBS": parse_time(hdulist[0].header["STARTOBS"]),
-                        "ENDOBS": parse_time(hdulist[0].header["ENDOBS"]),
-                        "SAT_ROT": hdulist[0].header["SAT_ROT"] * u.deg,
-                        "AECNOBS": int(hdulist[0].header["AECNOBS"]),
-                        "FOVX": hdulist[0].header["FOVX"] * u.arcsec,
-                        "FOVY": hdulist[0].header["FOVY"] * u.arcsec,
-                        "SUMSPTRN": hdulist[0].header["SUMSPTRN"],
-                        "SUMSPTRF": hdulist[0].header["SUMSPTRF"],
-                        "SUMSPAT": hdulist[0].header["SUMSPAT"],
-                        "NEXPOBS": hdulist[0].header["NEXPOBS"],
-                        "NRASTERP": hdulist[0].header["NRASTERP"],
-                        "KEYWDDOC": hdulist[0].header["KEYWDDOC"]}
-            # Initialize meta dictionary for each spectral_window
-            window_metas = {}
-            for i, window_name in enumerate(spectral_windows_req):
-                if "FUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
-                    spectral_summing = hdulist[0].header["SUMSPTRF"]
-                else:
-                    spectral_summing = hdulist[0].header["SUMSPTRN"]
-                window_metas[window_name] = {
-                    "detector type":
-                        hdulist[0].header["TDET{0}".format(window_fits_indices[i])],
-                    "spectral window":
-                        hdulist[0].header["TDESC{0}".format(window_fits_indices[i])],
-                    "brightest wavelength":
-                        hdulist[0].header["TWAVE{0}".format(window_fits_indices[i])],
-                    "min wavelength":
-                        hdulist[0].header["TWMIN{0}".format(window_fits_indices[i])],
-                    "max wavelength":
-                        hdulist[0].header["TWMAX{0}".format(window_fits_indices[i])],
-                    "SAT_ROT": hdulist[0].header["SAT_ROT"],
-                    "spatial summing": hdulist[0].header["SUMSPAT"],
-                    "spectral summing": spectral_summing
-                }
-            # Create a empty list for every spectral window and each
-            # spectral window is a key for the dictionary.
-            data_dict = dict([(window_name, list())
-                              for window_name in spectral_windows_req])
-        # Determine extra coords for this raster.
-        times = np.array(
-            [parse_time(hdulist[0].header["STARTOBS"]) + datetime.timedelta(seconds=s)
-             for s in hdulist[-2].data[:,hdulist[-2].header["TIME"]]])
-        raster_positions = np.arange(int(hdulist[0].header["NRASTERP"]))
-        pztx = hdulist[-2].data[:, hdulist[-2].header["PZTX"]] * u.arcsec
-        pzty = hdulist[-2].data[:, hdulist[-2].header["PZTY"]] * u.arcsec
-        xcenix = hdulist[-2].data[:, hdulist[-2].header["XCENIX"]] * u.arcsec
-        ycenix = hdulist[-2].data[:, hdulist[-2].header["YCENIX"]] * u.arcsec
-        obs_vrix = hdulist[-2].data[:, hdulist[-2].header["OBS_VRIX"]] * u.m/u.s
-        ophaseix = hdulist[-2].data[:, hdulist[-2].header["OPHASEIX"]]
-        exposure_times_fuv = hdulist[-2].data[:, hdulist[-2].header["EXPTIMEF"]] * u.s
-        exposure_times_nuv = hdulist[-2].data[:, hdulist[-2].header["EXPTIMEN"]] * u.s
-        general_extra_coords = [("time", 0, times), ("raster position", 0, raster_positions),
-                                ("pztx", 0, pztx), ("pzty", 0, pzty),
-                                ("xcenix", 0, xcenix), ("ycenix", 0, ycenix),
-                                ("obs_vrix", 0, obs_vrix), ("ophaseix", 0, ophaseix)]
-        for i, window_name in enumerate(spectral_windows_req):
-            # Determine values of properties dependent on detector type.
-            if "FUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
-                exposure_times = exposure_times_fuv
-                DN_unit = iris_tools.DN_UNIT["FUV"]
-                readout_noise = iris_tools.READOUT_NOISE["FUV"]
-            elif "NUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
-                exposure_times = exposure_times_nuv
-                DN_unit = iris_tools.DN_UNIT["NUV"]
-                readout_noise = iris_tools.READOUT_NOISE["NUV"]
-            else:
-                raise ValueError("Detector type in FITS header not recognized.")
-            # Derive WCS, data and mask for NDCube from file.
-            wcs_ = WCS(hdulist[window_fits_indices[i]].header)
-            data_mask = hdulist[window_fits_indices[i]].data == -200.
-            # Derive extra coords for this spectral window.
-            window_extra_coords = copy.deepcopy(general_extra_coords)
-            window_extra_coords.append(("exposure time", 0, exposure_times))
-            # Collect metadata relevant to single files.
-            try:
-                date_obs = parse_time(hdulist[0].header["DATE_OBS"])
-            except ValueError:
-                date_obs = None
-            try:
-                date_end = parse_time(hdulist[0].header["DATE_END"])
-            except ValueError:
-                date_end = None
-            single_file_meta = {"SAT_ROT": hdulist[0].header["SAT_ROT"] * u.deg,
-                                "DATE_OBS": date_obs,
-                                "DATE_END": date_end,
-                                "HLZ": bool(int(hdulist[0].header["HLZ"])),
-                                "SAA": bool(int(hdulist[0].header["SAA"])),
-                                "DSUN_OBS": hdulist[0].header["DSUN_OBS"] * u.m,
-                                "IAECEVFL": hdulist[0].header["IAECEVFL"],
-                                "IAECFLAG": hdulist[0].header["IAECFLAG"],
-                                "IAECFLFL": hdulist[0].header["IAECFLFL"],
-                                "KEYWDDOC": hdulist[0].header["KEYWDDOC"],
-                                "detector type":
-                                     hdulist[0].header["TDET{0}".format(window_fits_indices[i])],
-                                "spectral window": window_name,
-                                "OBSID": hdulist[0].header["OBSID"],
-                                "OBS_DESC": hdulist[0].header["OBS_DESC"],
-                                "STARTOBS": parse_time(hdulist[0].header["STARTOBS"]),
-                                "ENDOBS": parse_time(hdulist[0].header["ENDOBS"])
-                                }
-            # Derive uncertainty of data
-            uncertainty = u.Quantity(np.sqrt(
-                (hdulist[window_fits_indices[i]].data*DN_unit).to(u.photon).value +
-                readout_noise.to(u.photon).value**2), unit=u.photon).to(DN_unit).value
-            # Appending NDCube instance to the corresponding window key in dictionary's list.
-            data_dict[window_name].append(
-                IRISSpectrogramCube(hdulist[window_fits_indices[i]].data, wcs_, uncertainty,
-                                    DN_unit, single_file_meta, window_extra_coords,
-                                    mask=data_mask))
-        hdulist.close()
+    # The first file is opened once, both for meta and to be read.
+    hdulist = fits.open(filenames[0], memmap=memmap, do_not_scale_image_data=memmap)
+    _verify_spectrograph_hdulist(hdulist, verify)
+    spectral_windows_req, window_fits_indices = _get_requested_spectral_windows(
+        hdulist, spectral_windows, filenames[0])
+    # Generate top level meta dictionary from first file
+    # main header.
+    top_meta = {"TELESCOP": hdulist[0].header["TELESCOP"],
+                "INSTRUME": hdulist[0].header["INSTRUME"],
+                "DATA_LEV": hdulist[0].header["DATA_LEV"],
+                "OBSID": hdulist[0].header["OBSID"],
+                "OBS_DESC": hdulist[0].header["OBS_DESC"],
+                "STARTOBS": parse_time(hdulist[0].header["STARTOBS"]),
+                "ENDOBS": parse_time(hdulist[0].header["ENDOBS"]),
+                "SAT_ROT": hdulist[0].header["SAT_ROT"] * u.deg,
+                "AECNOBS": int(hdulist[0].header["AECNOBS"]),
+                "FOVX": hdulist[0].header["FOVX"] * u.arcsec,
+                "FOVY": hdulist[0].header["FOVY"] * u.arcsec,
+                "SUMSPTRN": hdulist[0].header["SUMSPTRN"],
+                "SUMSPTRF": hdulist[0].header["SUMSPTRF"],
+                "SUMSPAT": hdulist[0].header["SUMSPAT"],
+                "NEXPOBS": hdulist[0].header["NEXPOBS"],
+                "NRASTERP": hdulist[0].header["NRASTERP"],
+                "KEYWDDOC": hdulist[0].header["KEYWDDOC"]}
+    # Initialize meta dictionary for each spectral_window
+    window_metas = {}
+    for i, window_name in enumerate(spectral_windows_req):
+        if "FUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
+            spectral_summing = hdulist[0].header["SUMSPTRF"]
+        else:
+            spectral_summing = hdulist[0].header["SUMSPTRN"]
+        window_metas[window_name] = {
+            "detector type":
+                hdulist[0].header["TDET{0}".format(window_fits_indices[i])],
+            "spectral window":
+                hdulist[0].header["TDESC{0}".format(window_fits_indices[i])],
+            "brightest wavelength":
+                hdulist[0].header["TWAVE{0}".format(window_fits_indices[i])],
+            "min wavelength":
+                hdulist[0].header["TWMIN{0}".format(window_fits_indices[i])],
+            "max wavelength":
+                hdulist[0].header["TWMAX{0}".format(window_fits_indices[i])],
+            "SAT_ROT": hdulist[0].header["SAT_ROT"],
+            "spatial summing": hdulist[0].header["SUMSPAT"],
+            "spectral summing": spectral_summing
+        }
+    # Read each file into a dictionary of IRISSpectrogramCubes, one for each
+    # spectral window.  Executor.map returns results in the order of filenames.
+    read_file = functools.partial(
+        _read_iris_spectrograph_level2_file, spectral_windows_req=spectral_windows_req,
+        window_fits_indices=window_fits_indices, memmap=memmap,
+        datetime_objects=datetime_objects, wavelength_range=wavelength_range,
+        slit_range=slit_range, verify=verify)
+    file_cubes = [read_file(filenames[0], hdulist=hdulist)]
+    if executor is not None:
+        file_cubes += list(executor.map(read_file, filenames[1:]))
+    elif workers:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            file_cubes += list(pool.map(read_file, filenames[1:]))
+    else:
+        file_cubes += [read_file(filename) for filename in filenames[1:]]
+    if executor is not None:
+        # Arrays returned by other processes are unpickled as writeable.
+        for cubes in file_cubes:
+            _set_extra_coords_read_only(cubes.values())
     # Construct dictionary of IRISSpectrogramCubeSequences for spectral windows
-    data = dict([(window_name, IRISSpectrogramCubeSequence(data_dict[window_name],
-                                                           window_metas[window_name],
-                                                           common_axis=0))
+    data = dict([(window_name, IRISSpectrogramCubeSequence(
+                      [cubes[window_name] for cubes in file_cubes],
+                      window_metas[window_name], common_axis=0))
                  for window_name in spectral_windows_req])
+    if packed:
+        # Free each file's arrays as soon as they have been copied.
+        del file_cubes
+        for sequence in data.values():
+            sequence.pack()
     # Initialize an IRISSpectrograph object.
     return IRISSpectrograph(data, meta=top_meta)
 
 
+def iter_iris_spectrograph_level2_fits(filenames, spectral_windows=None, chunk=None,
+                                       datetime_objects=False, wavelength_range=None,
+                                       slit_range=None, verify=True):
+    """
+    Iterates over IRIS level 2 spectrograph FITS files, one block of exposures at a time.
+
+    Data are memory-mapped and only the exposures of the current block are
+    read into memory.  Each file is released once all its blocks have been
+    yielded.  Therefore peak memory is bounded by the size of one block, rather
+    than that of the whole OBS as with `read_iris_spectrograph_level2_fits`.
+
+    Parameters
+    ----------
+    filenames: `list` of `str` or `str` or `irispy.catalog.CatalogQuery`
+        Filename of filenames to be read.  They must all be associated with the same
+        OBS number.  If a CatalogQuery, the spectrograph files matching the query
+        are read.
+
+    spectral_windows: iterable of `str` or `str`
+        Spectral windows to extract from files.  Default=None, implies, extract all
+        spectral windows, or if filenames is a CatalogQuery with a spectral_window
+        criterion, extract the queried windows.
+
+    chunk: `int` or `None`
+        Maximum number of exposures in each block.
+        Default=None, implies each block is a whole file, e.g. one raster.
+
+    datetime_objects, wavelength_range, slit_range, verify:
+        See `read_iris_spectrograph_level2_fits`.
+
+    Yields
+    ------
+    cubes: `dict` of `IRISSpectrogramCube`
+        Spectrogram of each requested spectral window for a block of exposures,
+        with the same meta and read-only extra coords as those read by
+        `read_iris_spectrograph_level2_fits`.  Keys are spectral window names.
+        Blocks are yielded in the order of filenames and then exposures.
+
+    """
+    if isinstance(filenames, catalog.CatalogQuery):
+        if not spectral_windows:
+            spectral_windows = filenames.spectral_window
+        filenames = filenames.filenames(instrument=catalog.SPECTROGRAPH_INSTRUMENT)
+        if not filenames:
+            raise ValueError("No spectrograph files match catalog query.")
+    if type(filenames) is str:
+        filenames = [filenames]
+    # The first file is opened once, both to find the windows and to be read.
+    hdulist = fits.open(filenames[0], memmap=True, do_not_scale_image_data=True)
+    _verify_spectrograph_hdulist(hdulist, verify)
+    spectral_windows_req, window_fits_indices = _get_requested_spectral_windows(
+        hdulist, spectral_windows, filenames[0])
+    for filename in filenames:
+        file_cubes = _read_iris_spectrograph_level2_file(
+            filename, spectral_windows_req, window_fits_indices, memmap=True,
+            datetime_objects=datetime_objects, wavelength_range=wavelength_range,
+            slit_range=slit_range, verify=verify, hdulist=hdulist)
+        hdulist = None
+        n_exposures = file_cubes[spectral_windows_req[0]].data.shape[0]
+        block_size = chunk if chunk else n_exposures
+        for start in range(0, n_exposures, block_size):
+            yield dict([(window_name, _load_spectrogram_cube(
+                             file_cubes[window_name][start:start+block_size]))
+                        for window_name in spectral_windows_req])
+        # Release memory map of file before moving onto the next.
+        del file_cubes
+
+
+def _set_extra_coords_read_only(cubes):
+    # Makes the extra coord arrays of cubes read-only as they may be shared
+    # between cubes.
+    for cube in cubes:
+        for coord in cube.extra_coords.values():
+            if isinstance(coord["value"], np.ndarray):
+                coord["value"].flags.writeable = False
+
+
+def _load_spectrogram_cube(cube):
+    # Returns copy of cube whose data and mask are read into memory, e.g.
+    # from a memory-mapped file.  The uncertainty is still only calculated
+    # on first access.
+    data = np.asarray(cube.data)
+    mask = None if cube.mask is None else np.asarray(cube.mask)
+    uncertainty = iris_tools.LazyPoissonUncertainty(
+        unit=cube.unit, data=data,
+        readout_noise=iris_tools.READOUT_NOISE[iris_tools.get_detector_type(cube.meta)])
+    return IRISSpectrogramCube(
+        data, cube.wcs, uncertainty, cube.unit, cube.meta,
+        convert_extra_coords_dict_to_input_format(cube.extra_coords, cube.missing_axis),
+        mask=mask, missing_axis=cube.missing_axis)
+
+
+def _verify_spectrograph_hdulist(hdulist, verify=True):
+    # Verifies and fixes every header card of a spectrograph file or, if
+    # verify is False, only those of the keywords used by the reader in the
+    # primary and auxiliary headers.  Headers of the spectral windows read
+    # are then verified by _read_iris_spectrograph_level2_file.
+    if verify:
+        hdulist.verify('fix')
+    else:
+        primary_header = hdulist[0].header
+        iris_tools.verify_header_keywords(primary_header, PRIMARY_HEADER_KEYWORDS)
+        iris_tools.verify_header_keywords(
+            primary_header, [keyword.format(i) for i in range(1, primary_header["NWIN"]+1)
+                             for keyword in PRIMARY_WINDOW_HEADER_KEYWORDS])
+        iris_tools.verify_header_keywords(hdulist[-2].header, AUX_HEADER_KEYWORDS)
+
+
+def _get_requested_spectral_windows(hdulist, spectral_windows, filename):
+    """
+    Determines the names and HDU indices of the requested spectral windows in a file.
+
+    Parameters
+    ----------
+    hdulist: `astropy.io.fits.HDUList`
+        Opened level 2 spectrograph file.
+
+    spectral_windows: iterable of `str` or `str` or `None`
+        Requested spectral windows.  None implies all windows.
+
+    filename: `str`
+        Name of file.  Used in error message.
+
+    Returns
+    -------
+    spectral_windows_req: `numpy.ndarray` of `str`
+        Requested spectral windows in the order they appear in the file.
+
+    window_fits_indices: iterable of `int`
+        Indices of the HDUs holding the spectral windows in spectral_windows_req.
+
+    """
+    # Collecting the window observations.
+    windows_in_obs = np.array([hdulist[0].header["TDESC{0}".format(i)]
+                               for i in range(1, hdulist[0].header["NWIN"]+1)])
+    # If spectral_window is not set then get every window.
+    # Else take the appropriate windows
+    if not spectral_windows:
+        spectral_windows_req = windows_in_obs
+        window_fits_indices = range(1, len(hdulist)-2)
+    else:
+        if type(spectral_windows) is str:
+            spectral_windows_req = [spectral_windows]
+        else:
+            spectral_windows_req = spectral_windows
+        spectral_windows_req = np.asarray(spectral_windows_req, dtype="U")
+        window_is_in_obs = np.asarray(
+            [window in windows_in_obs for window in spectral_windows_req])
+        if not all(window_is_in_obs):
+            missing_windows = window_is_in_obs == False
+            raise ValueError("Spectral windows {0} not in file {1}".format(
+                spectral_windows_req[missing_windows], filename))
+        window_fits_indices = np.nonzero(np.in1d(windows_in_obs,
+                                                 spectral_windows_req))[0]+1
+        # Order requested windows as they appear in the file.
+        spectral_windows_req = windows_in_obs[window_fits_indices-1]
+    return spectral_windows_req, window_fits_indices
+
+
+def _read_iris_spectrograph_level2_file(filename, spectral_windows_req, window_fits_indices,
+                                        memmap=False, datetime_objects=False,
+                                        wavelength_range=None, slit_range=None, verify=True,
+                                        hdulist=None):
+    """
+    Reads spectral windows from a single IRIS level 2 spectrograph FITS file.
+
+    Parameters
+    ----------
+    filename: `str`
+        Filename to be read.
+
+    spectral_windows_req: iterable of `str`
+        Names of spectral windows to be read.
+
+    window_fits_indices: iterable of `int`
+        Indices of the HDUs holding the spectral windows in spectral_windows_req.
+
+    memmap, datetime_objects, wavelength_range, slit_range, verify:
+        See `read_iris_spectrograph_level2_fits`.
+
+    hdulist: `astropy.io.fits.HDUList` or `None`
+        The file, already opened with the given memmap and verified with
+        `_verify_spectrograph_hdulist`.  It is closed once read.
+        Default=None, implies file is opened and verified here.
+
+    Returns
+    -------
+    cubes: `dict` of `IRISSpectrogramCube`
+        Spectrogram of each spectral window in file.  Keys are spectral window names.
+
+    """
+    if hdulist is None:
+        hdulist = fits.open(filename, memmap=memmap, do_not_scale_image_data=memmap)
+        _verify_spectrograph_hdulist(hdulist, verify)
+    # Determine extra coords for this raster.
+    times = iris_tools.calculate_times(hdulist[0].header["STARTOBS"],
+                                       hdulist[-2].data[:, hdulist[-2].header["TIME"]],
+                                       datetime_objects=datetime_objects)
+    raster_positions = np.arange(int(hdulist[0].header["NRASTERP"]))
+    pztx = hdulist[-2].data[:, hdulist[-2].header["PZTX"]] * u.arcsec
+    pzty = hdulist[-2].data[:, hdulist[-2].header["PZTY"]] * u.arcsec
+    xcenix = hdulist[-2].data[:, hdulist[-2].header["XCENIX"]] * u.arcsec
+    ycenix = hdulist[-2].data[:, hdulist[-2].header["YCENIX"]] * u.arcsec
+    obs_vrix = hdulist[-2].data[:, hdulist[-2].header["OBS_VRIX"]] * u.m/u.s
+    ophaseix = hdulist[-2].data[:, hdulist[-2].header["OPHASEIX"]]
+    exposure_times_fuv = hdulist[-2].data[:, hdulist[-2].header["EXPTIMEF"]] * u.s
+    exposure_times_nuv = hdulist[-2].data[:, hdulist[-2].header["EXPTIMEN"]] * u.s
+    general_extra_coords = [("time", 0, times), ("raster position", 0, raster_positions),
+                            ("pztx", 0, pztx), ("pzty", 0, pzty),
+                            ("xcenix", 0, xcenix), ("ycenix", 0, ycenix),
+                            ("obs_vrix", 0, obs_vrix), ("ophaseix", 0, ophaseix)]
+    # Extra coords are shared, not copied, between the windows of this file.
+    # They are made read-only so they cannot be changed through one window
+    # without first being copied.
+    for value in [coord[2] for coord in general_extra_coords] + [exposure_times_fuv,
+                                                                 exposure_times_nuv]:
+        value.flags.writeable = False
+    # Collect metadata relevant to single files.
+    try:
+        date_obs = parse_time(hdulist[0].header["DATE_OBS"])
+    except ValueError:
+        date_obs = None
+    try:
+        date_end = parse_time(hdulist[0].header["DATE_END"])
+    except ValueError:
+        date_end = None
+    try:
+        date_created = parse_time(hdulist[0].header["DATE"])
+    except (KeyError, ValueError):
+        date_created = None
+    file_meta = {"SAT_ROT": hdulist[0].header["SAT_ROT"] * u.deg,
+                 "DATE": date_created,
+                 "DATE_OBS": date_obs,
+                 "DATE_END": date_end,
+                 "HLZ": bool(int(hdulist[0].header["HLZ"])),
+                 "SAA": bool(int(hdulist[0].header["SAA"])),
+                 "DSUN_OBS": hdulist[0].header["DSUN_OBS"] * u.m,
+                 "IAECEVFL": hdulist[0].header["IAECEVFL"],
+                 "IAECFLAG": hdulist[0].header["IAECFLAG"],
+                 "IAECFLFL": hdulist[0].header["IAECFLFL"],
+                 "KEYWDDOC": hdulist[0].header["KEYWDDOC"],
+                 "OBSID": hdulist[0].header["OBSID"],
+                 "OBS_DESC": hdulist[0].header["OBS_DESC"],
+                 "STARTOBS": parse_time(hdulist[0].header["STARTOBS"]),
+                 "ENDOBS": parse_time(hdulist[0].header["ENDOBS"])
+                 }
+    cubes = {}
+    for i, window_name in enumerate(spectral_windows_req):
+        # Determine values of properties dependent on detector type.
+        if "FUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
+            exposure_times = exposure_times_fuv
+            DN_unit = iris_tools.DN_UNIT["FUV"]
+            readout_noise = iris_tools.READOUT_NOISE["FUV"]
+        elif "NUV" in hdulist[0].header["TDET{0}".format(window_fits_indices[i])]:
+            exposure_times = exposure_times_nuv
+            DN_unit = iris_tools.DN_UNIT["NUV"]
+            readout_noise = iris_tools.READOUT_NOISE["NUV"]
+        else:
+            raise ValueError("Detector type in FITS header not recognized.")
+        # Derive WCS, data and mask for NDCube from file.  Only the
+        # requested section of the window is read.
+        window_hdu = hdulist[window_fits_indices[i]]
+        if not verify:
+            iris_tools.verify_header_keywords(window_hdu.header, WINDOW_HEADER_KEYWORDS)
+        wcs_ = WCS(window_hdu.header)
+        item = _get_spectrogram_section_item(window_hdu.header, wcs_, wavelength_range,
+                                             slit_range)
+        if item is not None:
+            wcs_ = wcs_.slice(item)
+        if memmap:
+            # Leave data on disk and only evaluate scaling and mask on access.
+            window_data = iris_tools.get_hdu_data_scaled_on_access(window_hdu)
+            if item is not None:
+                window_data = window_data[item]
+            data_mask = iris_tools.LazyArray(window_data, np.equal, BAD_PIXEL_VALUE)
+        else:
+            if item is None:
+                window_data = window_hdu.data
+            else:
+                window_data = window_hdu.section[item]
+            data_mask = window_data == BAD_PIXEL_VALUE
+        # Derive extra coords for this spectral window.
+        window_extra_coords = general_extra_coords + [("exposure time", 0, exposure_times)]
+        # Add metadata specific to this spectral window.
+        single_file_meta = dict(file_meta)
+        single_file_meta["detector type"] = \
+            hdulist[0].header["TDET{0}".format(window_fits_indices[i])]
+        single_file_meta["spectral window"] = window_name
+        # Derive uncertainty of data when it is first accessed.
+        uncertainty = iris_tools.LazyPoissonUncertainty(unit=DN_unit, data=window_data,
+                                                        readout_noise=readout_noise)
+        cubes[window_name] = IRISSpectrogramCube(window_data, wcs_, uncertainty,
+                                                 DN_unit, single_file_meta,
+                                                 window_extra_coords, mask=data_mask)
+    hdulist.close()
+    return cubes
+
+
+def _get_spectrogram_section_item(header, wcs, wavelength_range=None, slit_range=None):
+    """
+    Returns tuple of slices selecting a wavelength range and slit range of a spectral window.
+
+    Parameters
+    ----------
+    header: `astropy.io.fits.Header`
+        Header of HDU holding spectral window.
+
+    wcs: `astropy.wcs.WCS`
+        WCS of spectral window.
+
+    wavelength_range, slit_range:
+        See `read_iris_spectrograph_level2_fits`.
+
+    Returns
+    -------
+    item: `tuple` of `slice` or `None`
+        Slices of raster, slit and spectral axes with non-negative start and
+        stop.  None if neither range is set.
+
+    """
+    if wavelength_range is None and slit_range is None:
+        return None
+    if slit_range is None:
+        slit_slice = slice(0, header["NAXIS2"])
+    else:
+        slit_slice = slice(*slice(*slit_range).indices(header["NAXIS2"])[:2])
+    if wavelength_range is None:
+        spectral_slice = slice(0, header["NAXIS1"])
+    else:
+        # Convert wavelength bounds to smallest pixel range containing them.
+        spectral_wcs_index = np.where(np.array(wcs.wcs.ctype) == "WAVE")[0][0]
+        spectral_wcs = wcs.sub([int(spectral_wcs_index) + 1])
+        spectral_pixels = spectral_wcs.all_world2pix(
+            u.Quantity(list(wavelength_range)).to(spectral_wcs.wcs.cunit[0]).value, 0)[0]
+        spectral_slice = slice(
+            *slice(max(int(np.floor(spectral_pixels.min() + 0.5)), 0),
+                   int(np.floor(spectral_pixels.max() + 0.5)) + 1).indices(header["NAXIS1"])[:2])
+    if slit_slice.stop <= slit_slice.start or spectral_slice.stop <= spectral_slice.start:
+        raise ValueError("wavelength_range and slit_range must overlap with spectral window.")
+    return (slice(0, header["NAXIS3"]), slit_slice, spectral_slice)
+
+
+def scan_iris_spectrograph_level2_fits(filenames, workers=None):
+    """
+    Builds an index of IRIS level 2 spectrograph files from their headers only.
+
+    Only the primary header and the auxiliary data HDU of each file are read.
+    The spectral window data are not read or decoded.
+
+    Parameters
+    ----------
+    filenames: `list` of `str` or `str`
+        Filename or filenames to be scanned.
+
+    workers: `int` or `None`
+        Number of threads with which to scan files concurrently.
+        Default=None, implies files are scanned serially.
+
+    Returns
+    -------
+    index: `astropy.table.Table`
+        Table with one row per exposure in the order of filenames.  Columns are:
+        filename, OBSID, STARTOBS, ENDOBS, NRASTERP, raster position, time,
+        exposure time FUV, exposure time NUV, pztx, pzty, xcenix, ycenix,
+        obs_vrix, ophaseix, spectral windows, detector types, brightest wavelengths.
+        The last three give the comma-separated TDESCn, TDETn and TWAVEn values
+        of the file.
+
+    """
+    if type(filenames) is str:
+        filenames = [filenames]
+    if workers:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            file_indices = list(pool.map(_scan_iris_spectrograph_level2_file, filenames))
+    else:
+        file_indices = [_scan_iris_spectrograph_level2_file(filename)
+                        for filename in filenames]
+    colnames = list(file_indices[0].keys())
+    columns = [np.concatenate([file_index[colname] for file_index in file_indices])
+               for colname in colnames]
+    index = Table(columns, names=colnames)
+    for colname, unit in [("exposure time FUV", u.s), ("exposure time NUV", u.s),
+                          ("pztx", u.arcsec), ("pzty", u.arcsec), ("xcenix", u.arcsec),
+                          ("ycenix", u.arcsec), ("obs_vrix", u.m/u.s)]:
+        index[colname].unit = unit
+    return index
+
+
+def _scan_iris_spectrograph_level2_file(filename):
+    """Returns columns of header index of a single level 2 spectrograph file."""
+    hdulist = fits.open(filename, memmap=True, lazy_load_hdus=True)
+    header = hdulist[0].header
+    aux_header = hdulist[-2].header
+    aux_data = hdulist[-2].data
+    n_exposures = aux_data.shape[0]
+    window_indices = range(1, header["NWIN"]+1)
+    file_index = collections.OrderedDict()
+    file_index["filename"] = np.array([filename] * n_exposures)
+    file_index["OBSID"] = np.array([header["OBSID"]] * n_exposures)
+    file_index["STARTOBS"] = np.array([header["STARTOBS"]] * n_exposures)
+    file_index["ENDOBS"] = np.array([header["ENDOBS"]] * n_exposures)
+    file_index["NRASTERP"] = np.zeros(n_exposures, dtype=int) + int(header["NRASTERP"])
+    file_index["raster position"] = np.arange(n_exposures)
+    file_index["time"] = iris_tools.calculate_times(header["STARTOBS"],
+                                                    aux_data[:, aux_header["TIME"]])
+    for colname, aux_key in [("exposure time FUV", "EXPTIMEF"),
+                             ("exposure time NUV", "EXPTIMEN"),
+                             ("pztx", "PZTX"), ("pzty", "PZTY"),
+                             ("xcenix", "XCENIX"), ("ycenix", "YCENIX"),
+                             ("obs_vrix", "OBS_VRIX"), ("ophaseix", "OPHASEIX")]:
+        file_index[colname] = np.array(aux_data[:, aux_header[aux_key]])
+    for colname, key in [("spectral windows", "TDESC"), ("detector types", "TDET"),
+                         ("brightest wavelengths", "TWAVE")]:
+        file_index[colname] = np.array(
+            [", ".join([str(header["{0}{1}".format(key, i)]) for i in window_indices])]
+            * n_exposures)
+    hdulist.close()
+    return file_index
+
+
+def _fit_gaussians_to_arrays(data, mask, uncertainty, wavelength, n_gaussians=1,
+                             chunk_size=None):
+    # Fits gaussians to spectra in chunks along first axis.  Defined at
+    # module level so it can be run in a process pool.
+    if not chunk_size:
+        chunk_size = len(data)
+    chunk_results = []
+    for start in range(0, len(data), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_uncertainty = None if uncertainty is None else uncertainty[chunk]
+        chunk_results.append(iris_tools.fit_gaussians_on_linear_bg(
+            data[chunk], wavelength, n_gaussians=n_gaussians,
+            uncertainty=chunk_uncertainty, mask=mask[chunk]))
+    return [np.concatenate(results) for results in zip(*chunk_results)]
+
+
+def calculate_orbital_wavelength_variation(sequence, slit_pixel_range=None,
+                                           spline_smoothing=False,
+                                           fit_individual_profiles=False,
+                                           date_data_created=None):
+    """
+    Calculates orbital wavelength variation in FUV and NUV from Mg II k 2796 spectrograms.
+
+    The variation is derived from the position of the photospheric Ni I 2799
+    line.  All exposures of all rasters in the sequence are fit in one pass.
+    Only the part of each spectrogram around the Ni I line is read.
+
+    Parameters
+    ----------
+    sequence: `IRISSpectrogramCubeSequence`
+        Mg II k 2796 spectral window, e.g. as returned by
+        `read_iris_spectrograph_level2_fits`.  Each cube's first axis must
+        correspond to time unless it has been sliced to a single exposure.
+
+    slit_pixel_range: `tuple` of length 2
+        Lower and upper bounds of section of slit over which to average line fits.
+        Default=None, implies whole slit.
+
+    spline_smoothing: `bool`
+        If True, variation is smoothed to eliminate 5 minute photospheric
+        oscillations.  Default=False
+
+    fit_individual_profiles: `bool`
+        If True, line is fit in each slit pixel (averaged with its 4 nearest
+        neighbours) and the line positions averaged.  Otherwise the slit averaged
+        line profile is fit.  Default=False
+
+    date_data_created: `datetime.datetime` or `None`
+        Date the data was created by IRIS pipeline.
+        Default=None, implies value of DATE in meta of first cube is used.
+
+    Returns
+    -------
+    orbital_wavelength_variation: `astropy.table.Table`
+        Columns are time, wavelength variation FUV and wavelength variation NUV.
+        There is one row per exposure in sequence.
+
+    """
+    cube0 = sequence.data[0]
+    wavelength = cube0.axis_world_coords(cube0.data.ndim - 1)
+    spectral_slice = iris_tools._get_nii_wavelength_slice(wavelength)
+    wavelength = wavelength[spectral_slice]
+    data = []
+    times = []
+    spacecraft_velocity = []
+    orbital_phase = []
+    for cube in sequence.data:
+        cube_data = np.asarray(cube.data[..., spectral_slice], dtype=float)
+        if cube.mask is None:
+            cube_mask = cube_data == BAD_PIXEL_VALUE
+        else:
+            cube_mask = np.asarray(cube.mask[..., spectral_slice], dtype=bool)
+        if cube.extra_coords["time"]["axis"] is None:
+            # Cube sliced to a single exposure has no time axis.
+            cube_data = cube_data[np.newaxis]
+            cube_mask = cube_mask[np.newaxis]
+        data.append(np.ma.masked_array(cube_data, mask=cube_mask))
+        times.append(np.atleast_1d(np.asarray(cube.extra_coords["time"]["value"],
+                                              dtype="datetime64[us]")))
+        spacecraft_velocity.append(np.atleast_1d(
+            cube.extra_coords["obs_vrix"]["value"].to(u.m/u.s).value))
+        orbital_phase.append(np.atleast_1d(cube.extra_coords["ophaseix"]["value"]))
+    if date_data_created is None and cube0.meta.get("DATE") is not None:
+        date_data_created = iris_tools._as_datetime(iris_tools._to_datetime64(cube0.meta["DATE"]))
+    return iris_tools._calculate_orbital_wavelength_variation(
+        np.ma.concatenate(data), wavelength, np.concatenate(times),
+        date_data_created=date_data_created, slit_pixel_range=slit_pixel_range,
+        spline_smoothing=spline_smoothing, fit_individual_profiles=fit_individual_profiles,
+        spacecraft_velocity=np.concatenate(spacecraft_velocity) * u.m/u.s,
+        orbital_phase=np.concatenate(orbital_phase), roll_angle=cube0.meta.get("SAT_ROT"))
+
+
+def apply_orbital_wavelength_correction(raster, orbital_wavelength_variation=None, **kwargs):
+    """
+    Corrects wavelength axis of every spectral window for orbital variation.
+
+    As a WCS can only describe one wavelength axis per spectrogram, the WCS of
+    each spectrogram is shifted by the mean variation over its exposures.
+    Variation between the exposures of a spectrogram, e.g. within a raster, is
+    therefore not corrected.  The variation at each exposure is added to the
+    spectrogram as the "orbital wavelength variation" extra coord, so the
+    residual of each exposure is that minus the mean.  To correct every
+    exposure, slice the spectrograms into single exposures before correction.
+    Data, uncertainty and mask arrays are shared with the input rather than
+    copied.
+
+    Parameters
+    ----------
+    raster: `IRISSpectrograph`
+        Spectrograph data, e.g. as returned by `read_iris_spectrograph_level2_fits`.
+
+    orbital_wavelength_variation: `astropy.table.Table` or `None`
+        Output of `calculate_orbital_wavelength_variation`.
+        Default=None, implies it is calculated from the Mg II k 2796 window of raster.
+
+    kwargs:
+        Passed to `calculate_orbital_wavelength_variation` if
+        orbital_wavelength_variation is None.
+
+    Returns
+    -------
+    result: `IRISSpectrograph`
+        New IRISSpectrograph with corrected wavelength axes.
+
+    """
+    mg_window = "Mg II k 2796"
+    if orbital_wavelength_variation is None:
+        if mg_window not in raster.data:
+            raise ValueError("{0} spectral window required to calculate orbital "
+                             "wavelength variation.".format(mg_window))
+        orbital_wavelength_variation = calculate_orbital_wavelength_variation(
+            raster.data[mg_window], **kwargs)
+    variation_times = np.asarray(orbital_wavelength_variation["time"], dtype="datetime64[us]")
+    data = {}
+    for window_name, sequence in raster.data.items():
+        detector_type = iris_tools.get_detector_type(sequence.meta)
+        variation = u.Quantity(
+            orbital_wavelength_variation["wavelength variation {0}".format(detector_type)])
+        cubes = [_apply_orbital_wavelength_correction_to_cube(cube, variation_times, variation)
+                 for cube in sequence.data]
+        data[window_name] = IRISSpectrogramCubeSequence(
+            cubes, meta=sequence.meta, common_axis=sequence._common_axis)
+    return IRISSpectrograph(data, meta=raster.meta)
+
+
+def _apply_orbital_wavelength_correction_to_cube(cube, variation_times, variation):
+    # Shifts the wavelength axis of the cube's WCS by the mean variation
+    # over its exposures, sharing the cube's arrays.
+    extra_coords = convert_extra_coords_dict_to_input_format(cube.extra_coords,
+                                                             cube.missing_axis)
+    if "orbital wavelength variation" in [coord[0] for coord in extra_coords]:
+        raise ValueError("Orbital wavelength correction has already been applied.")
+    cube_times = np.atleast_1d(np.asarray(cube.extra_coords["time"]["value"],
+                                          dtype="datetime64[us]"))
+    cube_variation = variation[np.clip(np.searchsorted(variation_times, cube_times),
+                                       0, len(variation_times) - 1)]
+    finite_variation = cube_variation[np.isfinite(cube_variation)]
+    if len(finite_variation) == 0:
+        shift = 0 * variation.unit
+    else:
+        shift = finite_variation.mean()
+    wcs_ = cube.wcs.deepcopy()
+    spectral_wcs_index = np.where(np.array(wcs_.wcs.ctype) == "WAVE")[0][0]
+    wcs_.wcs.crval[spectral_wcs_index] -= shift.to(wcs_.wcs.cunit[spectral_wcs_index]).value
+    wcs_.wcs.set()
+    if cube.extra_coords["time"]["axis"] is None:
+        cube_variation = cube_variation[0]
+    extra_coords.append(("orbital wavelength variation", cube.extra_coords["time"]["axis"],
+                         cube_variation))
+    return IRISSpectrogramCube(cube.data, wcs_, cube.uncertainty, cube.unit, cube.meta,
+                               extra_coords, mask=cube.mask, missing_axis=cube.missing_axis)
+
 
 def _produce_obs_repr_string(meta):
     obs_info = [meta.get(key, "Unknown") for key in ["OBSID", "OBS_DESC", "STARTOBS", "ENDOBS"]]
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Helpers for irispy tests."""
+
+import numpy as np
+from astropy.io import fits
+
+__all__ = ['write_synthetic_raster_file', 'write_synthetic_sji_file']
+
+# Spectral windows written to synthetic raster files.
+# name: (detector, brightest wavelength, min wavelength, max wavelength, n wavelengths)
+SYNTHETIC_WINDOWS = {"C II 1336": ("FUV1", 1335.71, 1332.8, 1338.6, 8),
+                     "Si IV 1394": ("FUV2", 1393.76, 1391.2, 1396.3, 6),
+                     "Mg II k 2796": ("NUV", 2796.20, 2790.6, 2802.1, 10)}
+# Columns of the auxiliary data HDU.
+AUX_COLUMNS = ["TIME", "PZTX", "PZTY", "EXPTIMEF", "EXPTIMEN",
+               "XCENIX", "YCENIX", "OBS_VRIX", "OPHASEIX"]
+SJI_AUX_COLUMNS = ["TIME", "PZTX", "PZTY", "EXPTIMES", "SLTPX1IX", "SLTPX2IX",
+                   "XCENIX", "YCENIX", "OBS_VRIX", "OPHASEIX"]
+
+
+def write_synthetic_raster_file(filename, raster_index=0, n_raster_positions=3,
+                                n_slit_pixels=4, obsid=3690215148,
+                                startobs="2017-02-22T15:36:35.000",
+                                endobs="2017-02-22T18:36:35.000", scaled=True):
+    """
+    Writes a small synthetic IRIS level 2 raster FITS file.
+
+    The file has the same HDU layout and the header keywords used by
+    `irispy.spectrograph.read_iris_spectrograph_level2_fits`.  Data values
+    are deterministic and include some bad pixels.
+
+    Parameters
+    ----------
+    filename: `str`
+        Path of file to write.
+
+    raster_index: `int`
+        Index of raster in OBS.  Used to offset data values and times.
+
+    n_raster_positions: `int`
+        Number of raster positions, i.e. exposures, in file.
+
+    n_slit_pixels: `int`
+        Number of pixels along slit.
+
+    obsid: `int`
+        OBS ID of file.
+
+    startobs: `str`
+        Start time of OBS.
+
+    endobs: `str`
+        End time of OBS.
+
+    scaled: `bool`
+        If True, data are stored as scaled 16-bit integers.
+
+    Returns
+    -------
+    data: `dict`
+        Data arrays written to each spectral window HDU, keyed by window name.
+
+    """
+    window_names = list(SYNTHETIC_WINDOWS.keys())
+    primary_header = fits.Header()
+    primary_header["TELESCOP"] = "IRIS"
+    primary_header["INSTRUME"] = "SPEC"
+    primary_header["DATA_LEV"] = 2.
+    primary_header["OBSID"] = str(obsid)
+    primary_header["OBS_DESC"] = "Synthetic raster"
+    primary_header["STARTOBS"] = startobs
+    primary_header["ENDOBS"] = endobs
+    primary_header["DATE_OBS"] = startobs
+    primary_header["DATE_END"] = endobs
+    primary_header["SAT_ROT"] = 0.
+    primary_header["AECNOBS"] = 0
+    primary_header["FOVX"] = 0.33 * n_raster_positions
+    primary_header["FOVY"] = 0.167 * n_slit_pixels
+    primary_header["SUMSPTRN"] = 1
+    primary_header["SUMSPTRF"] = 1
+    primary_header["SUMSPAT"] = 1
+    primary_header["NEXPOBS"] = n_raster_positions
+    primary_header["NRASTERP"] = n_raster_positions
+    primary_header["KEYWDDOC"] = "https://www.lmsal.com/iris_science/irisfitskeywords.pdf"
+    primary_header["HLZ"] = 0
+    primary_header["SAA"] = 0
+    primary_header["DSUN_OBS"] = 1.48e11
+    primary_header["IAECEVFL"] = "NO"
+    primary_header["IAECFLAG"] = "NO"
+    primary_header["IAECFLFL"] = "NO"
+    primary_header["NWIN"] = len(window_names)
+    for i, window_name in enumerate(window_names):
+        detector, brightest, wmin, wmax, n_wavelengths = SYNTHETIC_WINDOWS[window_name]
+        primary_header["TDESC{0}".format(i + 1)] = window_name
+        primary_header["TDET{0}".format(i + 1)] = detector
+        primary_header["TWAVE{0}".format(i + 1)] = brightest
+        primary_header["TWMIN{0}".format(i + 1)] = wmin
+        primary_header["TWMAX{0}".format(i + 1)] = wmax
+    hdus = [fits.PrimaryHDU(header=primary_header)]
+    data = {}
+    for i, window_name in enumerate(window_names):
+        detector, brightest, wmin, wmax, n_wavelengths = SYNTHETIC_WINDOWS[window_name]
+        window_data = (np.arange(n_raster_positions * n_slit_pixels * n_wavelengths,
+                                 dtype=np.float32).reshape(
+            (n_raster_positions, n_slit_pixels, n_wavelengths)) + 10 * raster_index + i)
+        window_data[0, 0, 0] = -200.
+        window_data[-1, -1, -1] = -200.
+        header = fits.Header()
+        header["CTYPE1"] = "WAVE"
+        header["CUNIT1"] = "Angstrom"
+        header["CRPIX1"] = 1.
+        header["CRVAL1"] = wmin
+        header["CDELT1"] = (wmax - wmin) / (n_wavelengths - 1)
+        header["CTYPE2"] = "HPLT-TAN"
+        header["CUNIT2"] = "arcsec"
+        header["CRPIX2"] = n_slit_pixels / 2.
+        header["CRVAL2"] = 100.
+        header["CDELT2"] = 0.167
+        header["CTYPE3"] = "HPLN-TAN"
+        header["CUNIT3"] = "arcsec"
+        header["CRPIX3"] = n_raster_positions / 2.
+        header["CRVAL3"] = -200.
+        header["CDELT3"] = 0.33
+        hdu = fits.ImageHDU(data=window_data.copy(), header=header)
+        if scaled:
+            hdu.scale("int16", bscale=0.25, bzero=7992.)
+        hdus.append(hdu)
+        data[window_name] = window_data
+    aux_header = fits.Header()
+    for i, column in enumerate(AUX_COLUMNS):
+        aux_header[column] = i
+    aux_data = np.zeros((n_raster_positions, len(AUX_COLUMNS)))
+    aux_data[:, AUX_COLUMNS.index("TIME")] = \
+        np.arange(n_raster_positions) * 9.4 + 100 * raster_index + 0.1234567
+    aux_data[:, AUX_COLUMNS.index("EXPTIMEF")] = 8.
+    aux_data[:, AUX_COLUMNS.index("EXPTIMEN")] = 4.
+    aux_data[:, AUX_COLUMNS.index("PZTX")] = np.arange(n_raster_positions) * 0.33
+    aux_data[:, AUX_COLUMNS.index("OBS_VRIX")] = 1000.
+    hdus.append(fits.ImageHDU(data=aux_data, header=aux_header))
+    hdus.append(fits.BinTableHDU.from_columns(
+        [fits.Column(name="FRMID", format="K", array=np.arange(n_raster_positions))]))
+    fits.HDUList(hdus).writeto(filename, overwrite=True)
+    return data
+
+
+def write_synthetic_sji_file(filename, n_frames=5, n_y=6, n_x=4, obsid=3690215148,
+                             startobs="2017-02-22T15:36:35.000", bandpass=1400):
+    """
+    Writes a small synthetic IRIS level 2 SJI FITS file.
+
+    The file has the same HDU layout and the header keywords used by
+    `irispy.sji.read_iris_sji_level2_fits`.  Data are stored as scaled 16-bit
+    integers and include some bad pixels.
+
+    Parameters
+    ----------
+    filename: `str`
+        Path of file to write.
+
+    n_frames: `int`
+        Number of frames in file.
+
+    n_y: `int`
+        Number of pixels along the y (latitude) axis.
+
+    n_x: `int`
+        Number of pixels along the x (longitude) axis.
+
+    obsid: `int`
+        OBS ID of file.
+
+    startobs: `str`
+        Start time of OBS.
+
+    bandpass: `int`
+        Wavelength of SJI passband.
+
+    Returns
+    -------
+    data: `numpy.ndarray`
+        Scaled data written to file.
+
+    """
+    header = fits.Header()
+    header["TELESCOP"] = "IRIS"
+    header["INSTRUME"] = "SJI"
+    header["DATA_LEV"] = 2.
+    header["OBSID"] = str(obsid)
+    header["OBS_DESC"] = "Synthetic SJI"
+    header["STARTOBS"] = startobs
+    header["ENDOBS"] = "2017-02-22T18:36:35.000"
+    header["DATE_OBS"] = startobs
+    header["DATE_END"] = "2017-02-22T18:36:35.000"
+    header["TWAVE1"] = bandpass
+    header["TDESC1"] = "SJI_{0}".format(bandpass)
+    header["TDET1"] = "SJI"
+    header["FOVX"] = 0.167 * n_x
+    header["FOVY"] = 0.167 * n_y
+    header["XCEN"] = -200.
+    header["YCEN"] = 100.
+    header["CTYPE1"] = "HPLN-TAN"
+    header["CUNIT1"] = "arcsec"
+    header["CRPIX1"] = n_x / 2.
+    header["CRVAL1"] = -200.
+    header["CDELT1"] = 0.167
+    header["CTYPE2"] = "HPLT-TAN"
+    header["CUNIT2"] = "arcsec"
+    header["CRPIX2"] = n_y / 2.
+    header["CRVAL2"] = 100.
+    header["CDELT2"] = 0.167
+    header["CTYPE3"] = "Time"
+    header["CUNIT3"] = "s"
+    header["CRPIX3"] = 1.
+    header["CRVAL3"] = 0.
+    header["CDELT3"] = 10.
+    data = np.arange(n_frames * n_y * n_x, dtype=np.float32).reshape((n_frames, n_y, n_x))
+    data[0, 0, 0] = -200.
+    data[-1, -1, -1] = -200.
+    hdu = fits.PrimaryHDU(data=data.copy(), header=header)
+    hdu.scale("int16", bscale=0.25, bzero=7992.)
+    aux_header = fits.Header()
+    for i, column in enumerate(SJI_AUX_COLUMNS):
+        aux_header[column] = i
+    aux_data = np.zeros((n_frames, len(SJI_AUX_COLUMNS)))
+    aux_data[:, SJI_AUX_COLUMNS.index("TIME")] = np.arange(n_frames) * 10. + 0.1234567
+    aux_data[:, SJI_AUX_COLUMNS.index("EXPTIMES")] = 4. + np.arange(n_frames)
+    aux_data[:, SJI_AUX_COLUMNS.index("SLTPX1IX")] = n_x / 2.
+    aux_data[:, SJI_AUX_COLUMNS.index("SLTPX2IX")] = n_y / 2.
+    hdulist = fits.HDUList([hdu, fits.ImageHDU(data=aux_data, header=aux_header),
+                            fits.BinTableHDU.from_columns(
+                                [fits.Column(name="FRMID", format="K",
+                                             array=np.arange(n_frames))])])
+    hdulist.writeto(filename, overwrite=True)
+    return data
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Tests for functions in catalog.py"""
+import os
+
+import pytest
+
+from irispy.catalog import IRISLevel2Catalog, CatalogQuery
+from irispy.spectrograph import read_iris_spectrograph_level2_fits
+from irispy.sji import read_iris_sji_level2_fits
+from irispy.tests.helpers import write_synthetic_raster_file, write_synthetic_sji_file
+
+
+@pytest.fixture
+def level2_dir(tmpdir):
+    tmpdir.mkdir("sub")
+    write_synthetic_raster_file(str(tmpdir.join("raster_r00000.fits")), raster_index=0)
+    write_synthetic_raster_file(str(tmpdir.join("raster_r00001.fits")), raster_index=1)
+    write_synthetic_raster_file(str(tmpdir.join("sub", "other_raster.fits")), obsid=1,
+                                startobs="2017-03-01T00:00:00.000",
+                                endobs="2017-03-01T01:00:00.000")
+    write_synthetic_sji_file(str(tmpdir.join("sji_1400.fits")))
+    return tmpdir
+
+
+def test_update_incremental(level2_dir):
+    catalog = IRISLevel2Catalog(":memory:")
+    assert catalog.update(str(level2_dir)) == 4
+    assert len(catalog) == 4
+    assert catalog.update(str(level2_dir)) == 0
+    filename = str(level2_dir.join("raster_r00000.fits"))
+    new_mtime = os.path.getmtime(filename) + 10
+    os.utime(filename, (new_mtime, new_mtime))
+    assert catalog.update(str(level2_dir)) == 1
+    os.remove(str(level2_dir.join("sji_1400.fits")))
+    catalog.update(str(level2_dir), prune=True)
+    assert len(catalog) == 3
+
+
+def test_catalog_persists(level2_dir):
+    database = str(level2_dir.join("catalog.db"))
+    with IRISLevel2Catalog(database) as catalog:
+        catalog.update(str(level2_dir))
+    with IRISLevel2Catalog(database) as catalog:
+        assert len(catalog) == 4
+
+
+@pytest.mark.parametrize("criteria, instrument, expected_basenames", [
+    ({}, None, ["raster_r00000.fits", "raster_r00001.fits", "sji_1400.fits",
+                "other_raster.fits"]),
+    ({}, "SJI", ["sji_1400.fits"]),
+    ({"obsid": 1}, None, ["other_raster.fits"]),
+    ({"start_time": "2017-02-28", "end_time": "2017-03-02"}, None, ["other_raster.fits"]),
+    ({"end_time": "2017-02-23"}, "SPEC", ["raster_r00000.fits", "raster_r00001.fits"]),
+    ({"spectral_window": "Si IV 1394", "obsid": 3690215148}, None,
+     ["raster_r00000.fits", "raster_r00001.fits"]),
+    ({"detector": "FUV", "start_time": "2017-03-01"}, None, ["other_raster.fits"]),
+    ({"spectral_window": "Fe XII 1349"}, None, [])
+])
+def test_query(level2_dir, criteria, instrument, expected_basenames):
+    catalog = IRISLevel2Catalog(":memory:")
+    catalog.update(str(level2_dir))
+    query = catalog.query(**criteria)
+    assert isinstance(query, CatalogQuery)
+    filenames = query.filenames(instrument=instrument)
+    assert sorted([os.path.basename(f) for f in filenames]) == sorted(expected_basenames)
+
+
+def test_readers_accept_query(level2_dir):
+    catalog = IRISLevel2Catalog(":memory:")
+    catalog.update(str(level2_dir))
+    raster = read_iris_spectrograph_level2_fits(
+        catalog.query(obsid=3690215148, spectral_window="Si IV 1394"))
+    assert list(raster.data.keys()) == ["Si IV 1394"]
+    assert len(raster.data["Si IV 1394"].data) == 2
+    sji = read_iris_sji_level2_fits(catalog.query(obsid=3690215148))
+    assert sji.meta["TWAVE1"] == 1400
+    with pytest.raises(ValueError):
+        read_iris_spectrograph_level2_fits(catalog.query(spectral_window="Fe XII 1349"))
@@ -3,6 +3,8 @@ from __future__ import print_function
 
 import pytest
 
+import datetime
+
 import numpy as np
 import numpy.testing as np_test
 import astropy.units as u
@@ -148,3 +150,326 @@ def test_calculate_orbital_wavelength_variation():
     (data_dust, dust_mask_expected)])
 def test_calculate_dust_mask(input_array, expected_array):
     np_test.assert_array_equal(iris_tools.calculate_dust_mask(input_array), expected_array)
+
+
+@pytest.mark.parametrize("datetime_objects", [False, True])
+def test_calculate_times(datetime_objects):
+    start_time = "2017-02-22T15:36:35.000"
+    seconds = np.array([0., 9.4, 18.8000004, 3600.1234567])
+    expected = np.array([datetime.datetime(2017, 2, 22, 15, 36, 35) +
+                         datetime.timedelta(seconds=s) for s in seconds])
+    times = iris_tools.calculate_times(start_time, seconds, datetime_objects=datetime_objects)
+    assert times.shape == seconds.shape
+    if datetime_objects:
+        assert times.dtype == object
+        assert list(times) == list(expected)
+    else:
+        assert times.dtype == np.dtype("datetime64[us]")
+        np_test.assert_array_equal(times, expected.astype("datetime64[us]"))
+
+
+def test_lazy_poisson_uncertainty():
+    unit = iris_tools.DN_UNIT["FUV"]
+    readout_noise = iris_tools.READOUT_NOISE["FUV"]
+    data = np.abs(SOURCE_DATA_DN)
+    expected = iris_tools.calculate_poisson_uncertainty(data, unit, readout_noise)
+    uncertainty = iris_tools.LazyPoissonUncertainty(unit=unit, data=data,
+                                                    readout_noise=readout_noise)
+    sliced_uncertainty = uncertainty[1, 1:]
+    assert not uncertainty.calculated
+    assert not sliced_uncertainty.calculated
+    np_test.assert_allclose(sliced_uncertainty.array, expected[1, 1:])
+    assert not uncertainty.calculated
+    np_test.assert_allclose(uncertainty.array, expected)
+    assert uncertainty.calculated
+    assert uncertainty.unit == unit
+    np_test.assert_allclose(uncertainty[0].array, expected[0])
+
+
+# Arbitrary counts/s-to-radiance factor for testing unit conversion factors.
+RADIANCE_FACTOR_VALUE = np.array([1.5, 2., 4.])
+RADIANCE_FACTOR = RADIANCE_FACTOR_VALUE * iris_tools.RADIANCE_UNIT / (u.photon / u.s)
+
+
+@pytest.mark.parametrize("old_unit, new_unit_type, expected_data, expected_unit", [
+    (iris_tools.DN_UNIT["FUV"], "DN", SOURCE_DATA_DN, iris_tools.DN_UNIT["FUV"]),
+    (iris_tools.DN_UNIT["FUV"], "photons", SOURCE_DATA_PHOTONS_FUV, u.photon),
+    (iris_tools.DN_UNIT["FUV"] / u.s, "photons", SOURCE_DATA_PHOTONS_FUV, u.photon / u.s),
+    (u.photon / u.s, "DN", SOURCE_DATA_DN / 4., iris_tools.DN_UNIT["FUV"] / u.s),
+    (iris_tools.DN_UNIT["FUV"], "radiance",
+     SOURCE_DATA_PHOTONS_FUV / single_exposure_time * RADIANCE_FACTOR_VALUE,
+     iris_tools.RADIANCE_UNIT),
+    (u.photon / u.s, "radiance", SOURCE_DATA_DN * RADIANCE_FACTOR_VALUE,
+     iris_tools.RADIANCE_UNIT),
+    (iris_tools.RADIANCE_UNIT, "DN", SOURCE_DATA_DN / RADIANCE_FACTOR_VALUE / 4.,
+     iris_tools.DN_UNIT["FUV"] / u.s),
+    (iris_tools.RADIANCE_UNIT, "radiance", SOURCE_DATA_DN, iris_tools.RADIANCE_UNIT)
+])
+def test_calculate_unit_conversion_factor(old_unit, new_unit_type, expected_data,
+                                          expected_unit):
+    factor, new_unit = iris_tools.calculate_unit_conversion_factor(
+        old_unit, new_unit_type, "FUV", exposure_time=EXPOSURE_TIME[:2, np.newaxis],
+        radiance_factor=RADIANCE_FACTOR)
+    new_data, = iris_tools.apply_unit_conversion_factor([SOURCE_DATA_DN], factor)
+    assert new_unit == expected_unit
+    np_test.assert_allclose(new_data, expected_data)
+
+
+def test_apply_unit_conversion_factor_out():
+    data = SOURCE_DATA_DN.copy()
+    factor = np.array([1., 2., 3.])
+    new_data, = iris_tools.apply_unit_conversion_factor([data], factor, out=[data])
+    assert new_data is data
+    np_test.assert_allclose(data, SOURCE_DATA_DN * factor)
+
+
+@pytest.fixture
+def fake_response_file(tmpdir, monkeypatch):
+    # Replace readsav with a function returning a minimal version 2
+    # response structure and counting how many times it is called.
+    p0 = np.rec.array(np.zeros(1, dtype=[
+        ("LAMBDA", object), ("AREA_SG", object), ("AREA_SJI", object), ("GEOM_AREA", object),
+        ("VERSION", object), ("DATE", object), ("COMMENT", object), ("ELEMENTS", object)]))
+    p0["LAMBDA"][0] = np.linspace(130., 290., 5)
+    p0["AREA_SG"][0] = np.ones((2, 5))
+    p0["AREA_SJI"][0] = np.ones((4, 5))
+    p0["GEOM_AREA"][0] = np.float32(2.2)
+    p0["VERSION"][0] = np.int16(2)
+    p0["DATE"][0] = b"20130715"
+    p0["COMMENT"][0] = b"Synthetic response"
+    # Nested structure of object fields as read by readsav.
+    elements = np.rec.array(np.zeros(2, dtype=[("NAME", object), ("TRANS", object)]))
+    elements["NAME"][:] = [b"window", b"filter"]
+    elements["TRANS"][0] = np.linspace(0.5, 1., 5)
+    elements["TRANS"][1] = np.linspace(1., 0.5, 5)
+    p0["ELEMENTS"][0] = elements
+    calls = []
+
+    def readsav(filename):
+        calls.append(filename)
+        return {"p0": p0}
+
+    monkeypatch.setattr(iris_tools.scipy.io, "readsav", readsav)
+    response_file = tmpdir.join("iris_sra_test.geny")
+    response_file.write("")
+    iris_tools.clear_iris_response_cache()
+    yield str(response_file), calls
+    iris_tools.clear_iris_response_cache()
+
+
+def test_get_iris_response_cache(fake_response_file):
+    response_file, calls = fake_response_file
+    response = iris_tools.get_iris_response(response_file=response_file)
+    # Cached arrays are shared between calls and read-only.
+    with pytest.raises(ValueError):
+        response["AREA_SG"][0, 0] = 0 * u.cm**2
+    with pytest.raises(ValueError):
+        response["ELEMENTS"]["TRANS"][0][0] = 0.
+    response["AREA_SG"] = None
+    cached_response = iris_tools.get_iris_response(response_file=response_file)
+    assert len(calls) == 1
+    assert cached_response["AREA_SG"][0, 0] == 1 * u.cm**2
+    assert cached_response["LAMBDA"] is response["LAMBDA"]
+    iris_tools.get_iris_response(response_file=response_file, use_cache=False)
+    assert len(calls) == 2
+    iris_tools.clear_iris_response_cache()
+    iris_tools.get_iris_response(response_file=response_file)
+    assert len(calls) == 3
+
+
+def test_get_iris_response_persistent_cache(fake_response_file):
+    response_file, calls = fake_response_file
+    response = iris_tools.get_iris_response(response_file=response_file,
+                                            persistent_cache=True)
+    persistent_response = iris_tools.get_iris_response(
+        response_file=response_file, use_cache=False, persistent_cache=True)
+    assert len(calls) == 1
+    # Persistent cache holds no pickled objects.
+    with np.load(response_file + ".npz", allow_pickle=False) as npz:
+        assert all([npz[name].dtype != object for name in npz.files])
+    assert persistent_response.keys() == response.keys()
+    for name in ["LAMBDA", "AREA_SG", "AREA_SJI", "GEOM_AREA"]:
+        np_test.assert_array_equal(persistent_response[name], response[name])
+    assert persistent_response["VERSION"] == response["VERSION"]
+    assert persistent_response["VERSION_DATE"] == response["VERSION_DATE"]
+    assert persistent_response["COMMENT"] == b"Synthetic response"
+    elements = persistent_response["ELEMENTS"]
+    assert list(elements["NAME"]) == [b"window", b"filter"]
+    np_test.assert_array_equal(elements["TRANS"][1], np.linspace(1., 0.5, 5))
+    assert elements[0].TRANS is elements["TRANS"][0]
+    # Cache of an older format holding pickled objects is replaced.
+    np.savez(response_file + ".npz", p0=np.array([None, b"x"], dtype=object))
+    iris_tools.get_iris_response(response_file=response_file, use_cache=False,
+                                 persistent_cache=True)
+    assert len(calls) == 2
+    with np.load(response_file + ".npz", allow_pickle=False) as npz:
+        assert "structure" in npz.files
+
+
+def test_get_interpolated_effective_area_cache(monkeypatch):
+    response_wavelength = np.linspace(130., 140., 11) * u.nm
+    area_sg = np.array([np.linspace(1., 2., 11), np.linspace(3., 4., 11)]) * u.cm**2
+    calls = []
+
+    def get_iris_response(**kwargs):
+        calls.append(kwargs)
+        return {"LAMBDA": response_wavelength, "AREA_SG": area_sg}
+
+    monkeypatch.setattr(iris_tools, "get_iris_response", get_iris_response)
+    iris_tools.clear_iris_response_cache()
+    obs_wavelength = np.array([1332., 1334.5, 1337.]) * u.Angstrom
+    eff_area = iris_tools._get_interpolated_effective_area("FUV", obs_wavelength)
+    eff_area_cached = iris_tools._get_interpolated_effective_area("FUV", obs_wavelength)
+    iris_tools._get_interpolated_effective_area("FUV", obs_wavelength[1:])
+    assert len(calls) == 1
+    assert not eff_area_cached.value.flags.writeable
+    expected = np.interp(obs_wavelength.to(u.nm).value, response_wavelength.value,
+                         area_sg[0].value)
+    np_test.assert_allclose(eff_area.to(u.cm**2).value, expected)
+    np_test.assert_array_equal(eff_area_cached, eff_area)
+    iris_tools.clear_iris_response_cache()
+
+
+def _synthetic_time_dependent_response():
+    # Minimal version 4 response with two effective area intervals at a
+    # pair of reference wavelengths on each FUV CCD.
+    interval_times = np.array([["2014-01-01", "2015-01-01T06"],
+                               ["2015-01-01T06", "2030-01-01"]], dtype="datetime64[us]")
+    coeffs = np.array([[[1., 0.2, 0.], [1., 0.5, 0.]],
+                       [[2., 0., 0.], [2., 0., np.log(0.5)]],
+                       [[4., -1., 0.], [4., 0., 0.]],
+                       [[3., 0., 0.], [2., 1., 0.]]])
+    return {"VERSION": 4,
+            "LAMBDA": np.array([132., 133.2, 133.5, 134.5, 135.5, 137., 139.2, 139.8, 140.4,
+                                140.6, 141.]) * u.nm,
+            "C_F_TIME": interval_times,
+            "C_F_LAMBDA": np.array([133.5, 135.5, 139.2, 140.4]) * u.nm,
+            "COEFFS_FUV": coeffs, "GEOM_AREA": 2. * u.cm**2}
+
+
+def test_calculate_time_dependent_sg_effective_area():
+    iris_response = _synthetic_time_dependent_response()
+    # Half a year into the first interval and a year into the second.
+    obs_times = np.array(["2014-07-02T15", "2016-01-01T12"], dtype="datetime64[us]")
+    eff_area = iris_tools.calculate_time_dependent_sg_effective_area(
+        iris_response, "FUV", obs_times)
+    # Effective areas derived by hand following SSW's iris_get_response:
+    # each FUV CCD is interpolated, and extrapolated, from its own pair of
+    # reference wavelengths and is zero outside its range, e.g. at 137 nm.
+    expected = np.array([[0., 0.965, 1.1, 1.55, 2., 0., 3.5, 3.25, 3., 35. / 12, 0.],
+                         [0., 1.575, 1.5, 1.25, 1., 0., 4., 3.5, 3., 17. / 6, 0.]])
+    assert eff_area.unit == u.cm**2
+    np_test.assert_allclose(eff_area.value, expected)
+
+
+def test_calculate_time_dependent_sg_effective_area_error():
+    # Reference wavelengths that are not a pair per CCD are rejected.
+    iris_response = _synthetic_time_dependent_response()
+    iris_response["C_F_LAMBDA"] = iris_response["C_F_LAMBDA"][:3]
+    iris_response["COEFFS_FUV"] = iris_response["COEFFS_FUV"][:3]
+    with pytest.raises(ValueError, match="version 4"):
+        iris_tools.calculate_time_dependent_sg_effective_area(
+            iris_response, "FUV", np.array(["2016-01-01"], dtype="datetime64[us]"))
+
+
+def test_get_interpolated_effective_area_time_dependent(monkeypatch):
+    calls = []
+
+    def get_iris_response(**kwargs):
+        calls.append(kwargs)
+        return _synthetic_time_dependent_response()
+
+    monkeypatch.setattr(iris_tools, "get_iris_response", get_iris_response)
+    iris_tools.clear_iris_response_cache()
+    obs_wavelength = np.array([1335., 1340., 1400.]) * u.Angstrom
+    obs_times = np.array(["2016-01-01T01", "2016-01-01T20", "2016-01-02T01"],
+                         dtype="datetime64[us]")
+    eff_area = iris_tools._get_interpolated_effective_area(
+        "FUV", obs_wavelength, obs_times=obs_times, response_version=4)
+    assert eff_area.shape == (3, 3)
+    # Exposures in the same day share an effective area.
+    np_test.assert_array_equal(eff_area[0], eff_area[1])
+    assert np.all(eff_area[0] != eff_area[2])
+    iris_tools._get_interpolated_effective_area(
+        "FUV", obs_wavelength, obs_times=obs_times[1:], response_version=4)
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        iris_tools._get_interpolated_effective_area("FUV", obs_wavelength, response_version=4)
+    iris_tools.clear_iris_response_cache()
+
+
+def test_convert_response_times():
+    seconds = np.array([[[1.1e9, 1.2e9], [1.15e9, 1.25e9]],
+                        [[1.05e9 + 0.5, 1.3e9], [1.1e9, 1.2e9 + 1e-6]]])
+    times = iris_tools._convert_response_times(seconds)
+    assert times.shape == seconds.shape
+    expected = np.array([datetime.datetime(1979, 1, 1) + datetime.timedelta(seconds=t)
+                         for t in seconds.ravel()]).reshape(seconds.shape)
+    np_test.assert_array_equal(times, expected.astype("datetime64[us]"))
+
+
+def test_fit_batched_levenberg_marquardt():
+    x = np.linspace(2799.3, 2799.8, 20)
+    true_parameters = np.array([[-20., 2799.47, 0.08, 100., 0.],
+                                [-35., 2799.50, 0.06, 90., 0.],
+                                [-10., 2799.45, 0.10, 120., 0.],
+                                [-10., 2799.45, 0.10, 120., 0.]])
+    y = iris_tools._evaluate_gaussian1d_on_linear_bg(x, true_parameters)
+    y[-1, 3] = np.nan
+    parameters, converged = iris_tools._fit_batched_levenberg_marquardt(
+        iris_tools._evaluate_gaussian1d_on_linear_bg,
+        iris_tools._jacobian_gaussian1d_on_linear_bg,
+        x, y, np.array([-20., 2799.474, 0.1, 100., 0.]))
+    assert converged[:-1].all()
+    np_test.assert_allclose(parameters[:-1, :2], true_parameters[:-1, :2], rtol=1e-6)
+    assert not converged[-1]
+    assert np.isnan(parameters[-1]).all()
+
+
+@pytest.mark.parametrize("velocity, width", [(0., 0.05), (30., 0.05), (-15., 0.1)])
+def test_calculate_line_moments(velocity, width):
+    wavelength = np.linspace(1402., 1404., 401) * u.Angstrom
+    rest_wavelength = 1402.77 * u.Angstrom
+    centroid = rest_wavelength.value * (1 + velocity / 299792.458)
+    profile = 10. * np.exp(-0.5 * ((wavelength.value - centroid) / (width)) ** 2)
+    data = profile * np.ones((2, 3, 1))
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[0, 0] = True
+    data[1, 1, 0] = np.nan
+    intensity, line_velocity, line_width = iris_tools.calculate_line_moments(
+        data, wavelength, rest_wavelength, mask=mask)
+    assert intensity.shape == (2, 3)
+    assert intensity[0, 0] == 0 * u.Angstrom
+    assert np.isnan(line_velocity[0, 0]) and np.isnan(line_width[0, 0])
+    np_test.assert_allclose(intensity[mask[..., 0] == False].value,
+                            10. * width * np.sqrt(2 * np.pi), rtol=1e-6)
+    np_test.assert_allclose(line_velocity[mask[..., 0] == False].to(u.km/u.s).value,
+                            velocity, atol=1e-6)
+    np_test.assert_allclose(line_width[mask[..., 0] == False].to(u.Angstrom).value,
+                            width, rtol=1e-6)
+
+
+@pytest.mark.parametrize("n_gaussians, true_parameters", [
+    (1, [100., 1393.76, 0.06, 50., -0.02]),
+    (2, [100., 1393.76, 0.06, 30., 1393.8, 0.2, 50., -0.02])])
+def test_fit_gaussians_on_linear_bg(n_gaussians, true_parameters):
+    wavelength = np.linspace(1393., 1394.5, 80) * u.Angstrom
+    true_parameters = np.array(true_parameters)
+    if n_gaussians == 1:
+        function = iris_tools._evaluate_gaussian1d_on_linear_bg
+    else:
+        function = iris_tools._evaluate_double_gaussian1d_on_linear_bg
+    data = function(wavelength.value, true_parameters) * np.ones((2, 3, 1))
+    data[0, 0, 10] = -200.
+    mask = data == -200.
+    data[1, 2] = np.nan
+    parameters, parameter_uncertainties, converged = iris_tools.fit_gaussians_on_linear_bg(
+        data, wavelength, n_gaussians=n_gaussians, uncertainty=np.ones(data.shape), mask=mask)
+    assert parameters.shape == (2, 3, 3 * n_gaussians + 2)
+    assert parameter_uncertainties.shape == parameters.shape
+    np_test.assert_array_equal(converged, [[True, True, True], [True, True, False]])
+    assert np.isnan(parameters[1, 2]).all()
+    np_test.assert_allclose(parameters[converged],
+                            true_parameters * np.ones((converged.sum(), 1)),
+                            rtol=1e-6, atol=1e-6)
+    assert (parameter_uncertainties[converged] > 0).all()
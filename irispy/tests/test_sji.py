@@ -8,7 +8,8 @@ from astropy import units as u
 from ndcube.utils.wcs import WCS
 
 from irispy import iris_tools
-from irispy.sji import IRISMapCube, IRISMapCubeSequence
+from irispy.sji import IRISMapCube, IRISMapCubeSequence, read_iris_sji_level2_fits
+from irispy.tests.helpers import write_synthetic_sji_file
 
 # Sample data for IRISMapCube tests
 data = np.array([[[1, 2, 3, 4], [2, 4, 5, 3], [0, 1, 2, 3]],
@@ -209,3 +210,110 @@ def test_IRISMapCubeSequence_apply_dust_mask(test_input, expected):
     test_input.apply_dust_mask(undo=True)
     for cube_test in seq_dust.data:
         np.testing.assert_array_equal(cube_test.mask, mask_dust)
+
+
+@pytest.mark.parametrize("frames, region, expected_item", [
+    ((1, 4), ((1, 5), (0, 2)), (slice(1, 4), slice(1, 5), slice(0, 2))),
+    (slice(0, 5, 2), None, (slice(0, 5, 2), slice(None), slice(None))),
+    (None, "world", (slice(None), slice(1, 5), slice(1, 3)))])
+def test_read_iris_sji_level2_fits_section(tmpdir, frames, region, expected_item):
+    filename = str(tmpdir.join("sji_1400.fits"))
+    write_synthetic_sji_file(filename, n_frames=5, n_y=6, n_x=4)
+    cube = read_iris_sji_level2_fits(filename)
+    if region == "world":
+        # Region given by the world coordinates of pixel centres.
+        lon, lat, _ = cube.wcs.all_pix2world([1, 2], [1, 4], [0, 0], 0)
+        region = (lat * u.Unit(cube.wcs.wcs.cunit[1]), lon * u.Unit(cube.wcs.wcs.cunit[0]))
+    cube_section = read_iris_sji_level2_fits(filename, frames=frames, region=region)
+    expected_cube = cube[expected_item]
+    np.testing.assert_array_equal(cube_section.data, expected_cube.data)
+    np.testing.assert_array_equal(cube_section.mask, expected_cube.mask)
+    assert not cube_section.uncertainty.calculated
+    np.testing.assert_allclose(cube_section.uncertainty.array, expected_cube.uncertainty.array)
+    np.testing.assert_allclose(cube_section.wcs.all_pix2world(0, 0, 0, 0),
+                               expected_cube.wcs.all_pix2world(0, 0, 0, 0))
+    np.testing.assert_array_equal(cube_section.extra_coords["TIME"]["value"],
+                                  expected_cube.extra_coords["TIME"]["value"])
+    np.testing.assert_array_equal(
+        cube_section.extra_coords["SLIT X POSITION"]["value"],
+        cube.extra_coords["SLIT X POSITION"]["value"][expected_item[0]] -
+        (expected_item[2].start or 0) * u.pix)
+    assert cube_section.meta["NBFRAMES"] == cube_section.data.shape[0]
+
+
+def test_read_iris_sji_level2_fits_memmap(tmpdir):
+    filename = str(tmpdir.join("sji_1400.fits"))
+    write_synthetic_sji_file(filename, n_frames=5, n_y=6, n_x=4)
+    with open(filename, "rb") as f:
+        file_bytes = f.read()
+    cube = read_iris_sji_level2_fits(filename)
+    cube_memmap = read_iris_sji_level2_fits(filename, memmap=True)
+    assert isinstance(cube_memmap.data, iris_tools.LazyArray)
+    assert isinstance(cube_memmap.mask, iris_tools.LazyArray)
+    assert not cube_memmap.uncertainty.calculated
+    assert cube_memmap.unit == cube.unit
+    assert cube_memmap.scaled
+    np.testing.assert_array_equal(np.asarray(cube_memmap.data), cube.data)
+    np.testing.assert_array_equal(np.asarray(cube_memmap.mask), cube.mask)
+    assert np.asarray(cube_memmap.mask).sum() == 2
+    np.testing.assert_allclose(cube_memmap.uncertainty.array, cube.uncertainty.array)
+    # Exposure time correction and dust masking of a slice only read that slice.
+    cube_memmap_slice = cube_memmap[1:3]
+    corrected = cube_memmap_slice.apply_exposure_time_correction()
+    expected = cube[1:3].apply_exposure_time_correction()
+    np.testing.assert_allclose(corrected.data, expected.data)
+    np.testing.assert_allclose(corrected.uncertainty.array, expected.uncertainty.array)
+    assert corrected.unit == expected.unit
+    cube_slice = cube[1:3]
+    cube_memmap_slice.apply_dust_mask()
+    cube_slice.apply_dust_mask()
+    np.testing.assert_array_equal(cube_memmap_slice.mask, cube_slice.mask)
+    assert isinstance(cube_memmap.mask, iris_tools.LazyArray)
+    # File on disk is not modified.
+    del cube_memmap, cube_memmap_slice
+    with open(filename, "rb") as f:
+        assert f.read() == file_bytes
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_read_iris_sji_level2_fits_verify(tmpdir, memmap):
+    filename = str(tmpdir.join("sji_1400.fits"))
+    write_synthetic_sji_file(filename, n_frames=5, n_y=6, n_x=4)
+    cube = read_iris_sji_level2_fits(filename, memmap=memmap)
+    cube_lenient = read_iris_sji_level2_fits(filename, memmap=memmap, verify=False)
+    np.testing.assert_array_equal(np.asarray(cube_lenient.data), np.asarray(cube.data))
+    np.testing.assert_array_equal(np.asarray(cube_lenient.mask), np.asarray(cube.mask))
+    np.testing.assert_array_equal(cube_lenient.extra_coords["TIME"]["value"],
+                                  cube.extra_coords["TIME"]["value"])
+    assert cube_lenient.meta == cube.meta
+
+
+@pytest.mark.parametrize("undo, force", [(False, False), (True, True)])
+def test_IRISMapCube_apply_exposure_time_correction_inplace(tmpdir, undo, force):
+    filename = str(tmpdir.join("sji_1400.fits"))
+    write_synthetic_sji_file(filename, n_frames=5, n_y=6, n_x=4)
+    cube = read_iris_sji_level2_fits(filename)
+    expected = cube.apply_exposure_time_correction(undo=undo, force=force)
+    data_buffer = cube.data
+    assert cube.apply_exposure_time_correction(undo=undo, force=force, inplace=True) is None
+    assert cube.data is data_buffer
+    assert cube.unit == expected.unit
+    assert cube.uncertainty.unit == expected.unit
+    np.testing.assert_allclose(cube.data, expected.data)
+    np.testing.assert_allclose(cube.uncertainty.array, expected.uncertainty.array)
+    # Slices are copied on write so their parent is left unchanged.
+    cube_data = cube.data.copy()
+    cube_slice = cube[1:3]
+    expected_slice = cube_slice.apply_exposure_time_correction(force=True)
+    cube_slice.apply_exposure_time_correction(force=True, inplace=True)
+    np.testing.assert_allclose(cube_slice.data, expected_slice.data)
+    np.testing.assert_array_equal(cube.data, cube_data)
+    assert cube.unit == expected.unit
+    # Memory-mapped data cannot be corrected in place.
+    cube_memmap = read_iris_sji_level2_fits(filename, memmap=True)
+    with pytest.raises(ValueError):
+        cube_memmap.apply_exposure_time_correction(inplace=True)
+    sequence = IRISMapCubeSequence(data_list=[cube_memmap, cube_memmap])
+    with pytest.raises(ValueError):
+        sequence.apply_exposure_time_correction(inplace=True)
+
@@ -2,6 +2,7 @@
 # Author: Daniel Ryan <ryand5@tcd.ie>
 
 import os.path
+import concurrent.futures
 import pytest
 import copy
 import datetime
@@ -10,12 +11,20 @@ import numpy as np
 import astropy.wcs as wcs
 from astropy.io import fits
 import astropy.units as u
+from ndcube import NDCube
 from ndcube.utils.wcs import WCS
+from ndcube.utils.cube import convert_extra_coords_dict_to_input_format
 from ndcube.tests.helpers import assert_cubes_equal, assert_cubesequences_equal
 
-from irispy.spectrograph import IRISSpectrogramCube, IRISSpectrogramCubeSequence, IRISSpectrograph, read_iris_spectrograph_level2_fits
+from irispy.spectrograph import (IRISSpectrogramCube, IRISSpectrogramCubeSequence,
+                                 IRISSpectrograph, read_iris_spectrograph_level2_fits,
+                                 scan_iris_spectrograph_level2_fits,
+                                 iter_iris_spectrograph_level2_fits,
+                                 calculate_orbital_wavelength_variation,
+                                 apply_orbital_wavelength_correction, BAD_PIXEL_VALUE)
 import irispy.data.test
 from irispy import iris_tools
+from irispy.tests.helpers import write_synthetic_raster_file
 
 testpath = irispy.data.test.rootdir
 
@@ -119,6 +128,22 @@ sequence_photon_per_s_per_s = IRISSpectrogramCubeSequence(
 sequence_photon_s = IRISSpectrogramCubeSequence(
     [spectrogram_photon_s0, spectrogram_photon_s1], meta_seq)
 
+@pytest.fixture
+def raster_files(tmpdir, request):
+    # Writes synthetic raster files to tmpdir.  Tests can parametrize the fixture
+    # indirectly with the number of files or with a list of keyword arguments
+    # to write_synthetic_raster_file, one per file.
+    file_kwargs = getattr(request, "param", 2)
+    if isinstance(file_kwargs, int):
+        file_kwargs = [{}] * file_kwargs
+    filenames = []
+    for i, kwargs in enumerate(file_kwargs):
+        filename = str(tmpdir.join("raster_r{0:05d}.fits".format(i)))
+        write_synthetic_raster_file(filename, raster_index=i, **kwargs)
+        filenames.append(filename)
+    return filenames
+
+
 @pytest.fixture
 def iris_l2_test_raster():
     return read_iris_spectrograph_level2_fits(
@@ -178,6 +203,29 @@ def test_IRISSpectrogramCube_apply_exposure_time_correction(input_cube, undo,
     assert_cubes_equal(output_cube, expected_cube)
 
 
+@pytest.mark.parametrize("item", [
+    slice(1, None),
+    (slice(None), 0),
+    (slice(0, 1), slice(None), 1),
+    (slice(None), 0, slice(0, 2))
+])
+def test_IRISSpectrogramCube_getitem(item):
+    output_cube = spectrogram_DN0[item]
+    ndcube_slice = NDCube(SOURCE_DATA_DN, wcs0, uncertainty=SOURCE_UNCERTAINTY_DN,
+                          unit=iris_tools.DN_UNIT["FUV"], meta=meta0,
+                          extra_coords=extra_coords0)[item]
+    expected_cube = IRISSpectrogramCube(
+        ndcube_slice.data, ndcube_slice.wcs, ndcube_slice.uncertainty, ndcube_slice.unit,
+        ndcube_slice.meta, convert_extra_coords_dict_to_input_format(
+            ndcube_slice.extra_coords, ndcube_slice.missing_axis),
+        missing_axis=ndcube_slice.missing_axis)
+    assert_cubes_equal(output_cube, expected_cube)
+    # Meta and extra coords are shared with, not copied from, the original cube.
+    assert output_cube.meta is spectrogram_DN0.meta
+    assert np.shares_memory(output_cube.extra_coords["time"]["value"],
+                            spectrogram_DN0.extra_coords["time"]["value"])
+
+
 @pytest.mark.parametrize("input_sequence, new_unit, expected_sequence", [
     (sequence_DN, "DN", sequence_DN),
     (sequence_DN, "photons", sequence_photon),
@@ -194,6 +242,56 @@ def test_IRISSpectrogramCubeSequence_convert_to(input_sequence, new_unit,
     assert_cubesequences_equal(output_sequence, expected_sequence)
 
 
+@pytest.mark.parametrize("new_unit_type, response_version, workers", [
+    ("photons", 2, None),
+    ("radiance", 2, None),
+    ("radiance", 2, 2),
+    ("radiance", 4, 2)
+])
+@pytest.mark.parametrize("raster_files", [3], indirect=True)
+def test_IRISSpectrogramCubeSequence_convert_to_shared_factors(
+        raster_files, monkeypatch, new_unit_type, response_version, workers):
+    sequence = read_iris_spectrograph_level2_fits(raster_files).data["C II 1336"]
+    # Synthetic responses covering the FUV windows.
+    interval_times = np.array([["2013-07-20", "2016-01-01"], ["2016-01-01", "2020-01-01"]],
+                              dtype="datetime64[us]")
+    responses = {
+        2: {"LAMBDA": np.linspace(130., 140., 11) * u.nm,
+            "AREA_SG": np.array([np.linspace(1., 2., 11), np.linspace(3., 4., 11)]) * u.cm**2},
+        4: {"VERSION": 4, "LAMBDA": np.linspace(132., 142., 21) * u.nm,
+            "C_F_TIME": interval_times,
+            "C_F_LAMBDA": np.array([133.5, 135.5, 139.2, 140.4]) * u.nm,
+            "COEFFS_FUV": np.array([[[1., 0., -0.1], [0.9, -0.02, 0.]],
+                                    [[2., 0.1, 0.], [1.8, 0., -0.2]],
+                                    [[1.5, 0., 0.], [1.4, 0., -0.1]],
+                                    [[1., 0., 0.], [0.9, 0.1, 0.]]]),
+            "GEOM_AREA": 2. * u.cm**2}}
+    monkeypatch.setattr(iris_tools, "get_iris_response",
+                        lambda **kwargs: responses[response_version])
+    iris_tools.clear_iris_response_cache()
+    expected = [cube.convert_to(new_unit_type, response_version=response_version)
+                for cube in sequence.data]
+    # Radiometric calibration factor is calculated once for the whole sequence.
+    calls = []
+    calculate_factor = iris_tools.calculate_photons_per_sec_to_radiance_factor
+
+    def calculate_photons_per_sec_to_radiance_factor(*args, **kwargs):
+        calls.append(kwargs)
+        return calculate_factor(*args, **kwargs)
+
+    monkeypatch.setattr(iris_tools, "calculate_photons_per_sec_to_radiance_factor",
+                        calculate_photons_per_sec_to_radiance_factor)
+    output_sequence = sequence.convert_to(new_unit_type, copy=True,
+                                          response_version=response_version, workers=workers)
+    assert len(calls) == (new_unit_type == "radiance")
+    for output_cube, expected_cube in zip(output_sequence.data, expected):
+        assert output_cube.unit == expected_cube.unit
+        np.testing.assert_allclose(output_cube.data, expected_cube.data)
+        np.testing.assert_allclose(output_cube.uncertainty.array,
+                                   expected_cube.uncertainty.array)
+    iris_tools.clear_iris_response_cache()
+
+
 @pytest.mark.parametrize("input_sequence, undo, force, expected_sequence", [
     (sequence_DN, False, False, sequence_DN_per_s),
     (sequence_DN_per_s, True, False, sequence_DN),
@@ -207,3 +305,464 @@ def test_IRISSpectrogramCubeSequence_apply_exposure_time_correction(
     output_sequence = input_sequence.apply_exposure_time_correction(undo, copy=True,
                                                                     force=force)
     assert_cubesequences_equal(output_sequence, expected_sequence)
+
+
+@pytest.mark.parametrize("undo, force", [(False, False), (True, True)])
+def test_IRISSpectrogramCube_apply_exposure_time_correction_inplace(tmpdir, undo, force):
+    filename = str(tmpdir.join("raster_r00000.fits"))
+    write_synthetic_raster_file(filename)
+    raster = read_iris_spectrograph_level2_fits(filename)
+    for window_name in raster.data.keys():
+        cube = raster.data[window_name].data[0]
+        expected = cube.apply_exposure_time_correction(undo=undo, force=force)
+        data_buffer = cube.data
+        uncertainty_buffer = cube.uncertainty.array
+        assert cube.apply_exposure_time_correction(undo=undo, force=force,
+                                                   inplace=True) is None
+        assert cube.data is data_buffer
+        assert cube.uncertainty.array is uncertainty_buffer
+        assert cube.unit == expected.unit
+        assert cube.uncertainty.unit == expected.unit
+        np.testing.assert_allclose(cube.data, expected.data)
+        np.testing.assert_allclose(cube.uncertainty.array, expected.uncertainty.array)
+
+
+def test_IRISSpectrogramCube_apply_exposure_time_correction_inplace_slice(tmpdir):
+    filename = str(tmpdir.join("raster_r00000.fits"))
+    write_synthetic_raster_file(filename)
+    cube = read_iris_spectrograph_level2_fits(filename).data["C II 1336"].data[0]
+    original_data = cube.data.copy()
+    cube_slice = cube[1:]
+    assert np.shares_memory(cube.data, cube_slice.data)
+    expected = cube_slice.apply_exposure_time_correction()
+    cube_slice.apply_exposure_time_correction(inplace=True)
+    np.testing.assert_allclose(cube_slice.data, expected.data)
+    np.testing.assert_allclose(cube_slice.uncertainty.array, expected.uncertainty.array)
+    assert cube_slice.unit == expected.unit
+    # Slice's data are copied on write so parent cube, including its
+    # uncalculated uncertainty, is left unchanged.
+    assert not np.shares_memory(cube.data, cube_slice.data)
+    np.testing.assert_array_equal(cube.data, original_data)
+    assert cube.unit == iris_tools.DN_UNIT["FUV"]
+    assert not cube.uncertainty.calculated
+    np.testing.assert_allclose(
+        cube.uncertainty.array,
+        iris_tools.calculate_poisson_uncertainty(original_data, cube.unit,
+                                                 iris_tools.READOUT_NOISE["FUV"]))
+    # Slice of a cube whose uncertainty has been calculated.
+    cube_slice = cube[1:]
+    cube_slice.apply_exposure_time_correction(inplace=True)
+    assert not np.shares_memory(cube.uncertainty.array, cube_slice.uncertainty.array)
+    np.testing.assert_array_equal(cube.data, original_data)
+
+
+def test_IRISSpectrogramCubeSequence_apply_exposure_time_correction_inplace(raster_files):
+    raster = read_iris_spectrograph_level2_fits(raster_files)
+    raster_memmap = read_iris_spectrograph_level2_fits(raster_files, memmap=True)
+    for window_name in raster.data.keys():
+        sequence = raster.data[window_name]
+        expected = sequence.apply_exposure_time_correction(copy=True)
+        cubes = list(sequence.data)
+        sequence.apply_exposure_time_correction(inplace=True)
+        assert all([cube is new_cube for cube, new_cube in zip(cubes, sequence.data)])
+        assert_cubesequences_equal(sequence, expected)
+        with pytest.raises(ValueError):
+            sequence.apply_exposure_time_correction(undo=True, copy=True, inplace=True)
+        with pytest.raises(ValueError):
+            raster_memmap.data[window_name].apply_exposure_time_correction(inplace=True)
+
+
+@pytest.mark.parametrize("raster_files", [3], indirect=True)
+def test_IRISSpectrogramCubeSequence_pack(raster_files):
+    raster = read_iris_spectrograph_level2_fits(raster_files)
+    raster_packed = read_iris_spectrograph_level2_fits(raster_files, packed=True)
+    for window_name, sequence in raster.data.items():
+        sequence_packed = raster_packed.data[window_name]
+        assert sequence.packed_data is None
+        packed_data = sequence_packed.packed_data
+        assert packed_data.shape == (len(raster_files),) + sequence.data[0].data.shape
+        assert packed_data.flags.c_contiguous
+        for i, (cube, cube_packed) in enumerate(zip(sequence.data, sequence_packed.data)):
+            assert np.shares_memory(cube_packed.data, packed_data)
+            assert np.shares_memory(cube_packed.uncertainty.array,
+                                    sequence_packed.packed_uncertainty)
+            assert np.shares_memory(cube_packed.mask, sequence_packed.packed_mask)
+            np.testing.assert_array_equal(packed_data[i], cube.data)
+            np.testing.assert_allclose(sequence_packed.packed_uncertainty[i],
+                                       cube.uncertainty.array)
+            np.testing.assert_array_equal(sequence_packed.packed_mask[i], cube.mask)
+            assert cube_packed.uncertainty.unit == cube.uncertainty.unit
+        # Slicing a cube returns views of packed arrays.
+        assert np.shares_memory(sequence_packed.data[1][1:, 0].data, packed_data)
+        # In place operations keep the sequence packed.
+        sequence_packed.apply_exposure_time_correction(inplace=True)
+        sequence.apply_exposure_time_correction(copy=False)
+        np.testing.assert_allclose(sequence_packed.packed_data,
+                                   np.stack([cube.data for cube in sequence.data]))
+        # Replacing the cubes unpacks the sequence.
+        sequence_packed.apply_exposure_time_correction(undo=True)
+        assert sequence_packed.packed_data is None
+        assert sequence_packed.packed_mask is None
+
+
+@pytest.mark.parametrize("raster_files", [[{"n_raster_positions": 2}, {"n_raster_positions": 3}]],
+                         indirect=True)
+def test_IRISSpectrogramCubeSequence_pack_error(raster_files):
+    with pytest.raises(ValueError):
+        read_iris_spectrograph_level2_fits(raster_files, packed=True)
+    with pytest.raises(ValueError):
+        read_iris_spectrograph_level2_fits(raster_files, memmap=True, packed=True)
+
+
+@pytest.mark.parametrize("datetime_objects, use_executor", [
+    (False, False), (True, False), (False, True)])
+def test_read_iris_spectrograph_level2_fits_shared_extra_coords(raster_files, datetime_objects,
+                                                                 use_executor):
+    if use_executor:
+        # Files after the first are read by, and pickled from, other processes.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            raster = read_iris_spectrograph_level2_fits(
+                raster_files, datetime_objects=datetime_objects, executor=executor)
+    else:
+        raster = read_iris_spectrograph_level2_fits(raster_files,
+                                                    datetime_objects=datetime_objects)
+    cubes = [sequence.data[-1] for sequence in raster.data.values()]
+    for coord_name in ["time", "raster position", "pztx", "obs_vrix", "ophaseix"]:
+        values = [cube.extra_coords[coord_name]["value"] for cube in cubes]
+        assert all([value is values[0] for value in values])
+        assert not values[0].flags.writeable
+    with pytest.raises(ValueError):
+        cubes[0].extra_coords["pztx"]["value"][0] = 1 * u.arcsec
+    # Changing a copy leaves other windows unaffected.
+    pztx = cubes[0].extra_coords["pztx"]["value"].copy()
+    pztx[0] = 1 * u.arcsec
+    assert cubes[1].extra_coords["pztx"]["value"][0] == 0 * u.arcsec
+    fuv_exposure_times = [cube.extra_coords["exposure time"]["value"] for cube in cubes
+                          if "FUV" in cube.meta["detector type"]]
+    assert fuv_exposure_times[0] is fuv_exposure_times[1]
+    assert cubes[0].meta["spectral window"] != cubes[1].meta["spectral window"]
+
+
+def test_read_iris_spectrograph_level2_fits_memmap(raster_files):
+    raster = read_iris_spectrograph_level2_fits(raster_files)
+    raster_memmap = read_iris_spectrograph_level2_fits(raster_files, memmap=True)
+    for window_name in raster.data.keys():
+        for cube, cube_memmap in zip(raster.data[window_name].data,
+                                     raster_memmap.data[window_name].data):
+            assert isinstance(cube_memmap.data, iris_tools.LazyArray)
+            assert not cube_memmap.uncertainty.calculated
+            np.testing.assert_allclose(cube_memmap.uncertainty.array, cube.uncertainty.array)
+            np.testing.assert_array_equal(np.asarray(cube_memmap.data), cube.data)
+            np.testing.assert_array_equal(np.asarray(cube_memmap.mask), cube.mask)
+            np.testing.assert_array_equal(np.asarray(cube_memmap[1:, 0].data),
+                                          cube[1:, 0].data)
+
+
+@pytest.mark.parametrize("chunk, spectral_windows", [(None, None), (2, "Si IV 1394")])
+def test_iter_iris_spectrograph_level2_fits(raster_files, chunk, spectral_windows):
+    raster = read_iris_spectrograph_level2_fits(raster_files, spectral_windows=spectral_windows)
+    blocks = list(iter_iris_spectrograph_level2_fits(
+        raster_files, spectral_windows=spectral_windows, chunk=chunk))
+    n_blocks_per_file = 1 if chunk is None else 2
+    assert len(blocks) == len(raster_files) * n_blocks_per_file
+    for window_name in raster.data.keys():
+        assert all([list(block.keys()) == list(raster.data.keys()) for block in blocks])
+        for i, cube in enumerate(raster.data[window_name].data):
+            file_blocks = [block[window_name]
+                           for block in blocks[i*n_blocks_per_file:(i+1)*n_blocks_per_file]]
+            assert all([type(block.data) is np.ndarray for block in file_blocks])
+            assert not any([block.uncertainty.calculated for block in file_blocks])
+            np.testing.assert_array_equal(np.concatenate([block.data for block in file_blocks]),
+                                          cube.data)
+            np.testing.assert_array_equal(np.concatenate([block.mask for block in file_blocks]),
+                                          cube.mask)
+            np.testing.assert_allclose(
+                np.concatenate([block.uncertainty.array for block in file_blocks]),
+                cube.uncertainty.array)
+            np.testing.assert_array_equal(
+                np.concatenate([block.extra_coords["time"]["value"] for block in file_blocks]),
+                cube.extra_coords["time"]["value"])
+            assert file_blocks[0].meta == cube.meta
+
+
+@pytest.mark.parametrize("memmap, wavelength_range, slit_range, expected_item", [
+    (False, u.Quantity([1392.2, 1394.3], unit=u.Angstrom), (1, 3),
+     (slice(None), slice(1, 3), slice(1, 4))),
+    (True, u.Quantity([1392.2, 1394.3], unit=u.Angstrom), None,
+     (slice(None), slice(None), slice(1, 4))),
+    (False, None, (2, None), (slice(None), slice(2, None), slice(None)))])
+def test_read_iris_spectrograph_level2_fits_section(raster_files, memmap, wavelength_range,
+                                                     slit_range, expected_item):
+    window_name = "Si IV 1394"
+    raster = read_iris_spectrograph_level2_fits(raster_files, spectral_windows=window_name)
+    raster_section = read_iris_spectrograph_level2_fits(
+        raster_files, spectral_windows=window_name, memmap=memmap,
+        wavelength_range=wavelength_range, slit_range=slit_range)
+    for cube, cube_section in zip(raster.data[window_name].data,
+                                  raster_section.data[window_name].data):
+        expected_cube = cube[expected_item]
+        np.testing.assert_array_equal(np.asarray(cube_section.data), expected_cube.data)
+        np.testing.assert_array_equal(np.asarray(cube_section.mask), expected_cube.mask)
+        np.testing.assert_allclose(cube_section.uncertainty.array,
+                                   expected_cube.uncertainty.array)
+        np.testing.assert_allclose(cube_section.axis_world_coords(2).value,
+                                   expected_cube.axis_world_coords(2).value)
+        np.testing.assert_allclose(cube_section.wcs.all_pix2world(0, 0, 0, 0),
+                                   expected_cube.wcs.all_pix2world(0, 0, 0, 0))
+
+
+def test_read_iris_spectrograph_level2_fits_section_error(tmpdir):
+    filename = str(tmpdir.join("raster_r00000.fits"))
+    write_synthetic_raster_file(filename)
+    with pytest.raises(ValueError):
+        read_iris_spectrograph_level2_fits(
+            filename, spectral_windows="Si IV 1394",
+            wavelength_range=u.Quantity([1300., 1310.], unit=u.Angstrom))
+
+
+def test_read_iris_spectrograph_level2_fits_datetime_objects(tmpdir):
+    filename = str(tmpdir.join("raster_r00000.fits"))
+    write_synthetic_raster_file(filename)
+    raster = read_iris_spectrograph_level2_fits([filename])
+    raster_legacy = read_iris_spectrograph_level2_fits([filename], datetime_objects=True)
+    for window_name in raster.data.keys():
+        times = raster.data[window_name][0].extra_coords["time"]["value"]
+        times_legacy = raster_legacy.data[window_name][0].extra_coords["time"]["value"]
+        assert times.dtype == np.dtype("datetime64[us]")
+        assert times_legacy.dtype == object
+        np.testing.assert_array_equal(times, times_legacy.astype("datetime64[us]"))
+
+
+@pytest.mark.parametrize("workers, executor_class", [
+    (2, None),
+    (None, concurrent.futures.ThreadPoolExecutor),
+    (None, concurrent.futures.ProcessPoolExecutor)])
+@pytest.mark.parametrize("raster_files", [4], indirect=True)
+def test_read_iris_spectrograph_level2_fits_concurrent(raster_files, workers, executor_class):
+    raster = read_iris_spectrograph_level2_fits(raster_files)
+    if executor_class is not None:
+        with executor_class(max_workers=2) as executor:
+            raster_concurrent = read_iris_spectrograph_level2_fits(raster_files,
+                                                                   executor=executor)
+            if executor_class is concurrent.futures.ProcessPoolExecutor:
+                # Memory-mapped data cannot be returned by other processes.
+                with pytest.raises(ValueError):
+                    read_iris_spectrograph_level2_fits(raster_files, memmap=True,
+                                                        executor=executor)
+    else:
+        raster_concurrent = read_iris_spectrograph_level2_fits(raster_files, workers=workers)
+    assert list(raster_concurrent.data.keys()) == list(raster.data.keys())
+    for window_name in raster.data.keys():
+        if executor_class is concurrent.futures.ProcessPoolExecutor:
+            # WCS pickled by other processes are only equal to within rounding.
+            for cube_concurrent, cube in zip(raster_concurrent.data[window_name].data,
+                                             raster.data[window_name].data):
+                np.testing.assert_array_equal(cube_concurrent.data, cube.data)
+                np.testing.assert_array_equal(cube_concurrent.mask, cube.mask)
+                np.testing.assert_allclose(cube_concurrent.uncertainty.array,
+                                           cube.uncertainty.array)
+                np.testing.assert_allclose(cube_concurrent.wcs.wcs.crval, cube.wcs.wcs.crval)
+                np.testing.assert_allclose(cube_concurrent.wcs.wcs.cdelt, cube.wcs.wcs.cdelt)
+                np.testing.assert_array_equal(cube_concurrent.extra_coords["time"]["value"],
+                                              cube.extra_coords["time"]["value"])
+                assert cube_concurrent.meta == cube.meta
+        else:
+            assert_cubesequences_equal(raster_concurrent.data[window_name],
+                                       raster.data[window_name])
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_read_iris_spectrograph_level2_fits_verify(raster_files, monkeypatch, memmap):
+    raster = read_iris_spectrograph_level2_fits(raster_files, memmap=memmap)
+    # Count files opened and record keywords verified.
+    opened = []
+    verified_keywords = []
+    fits_open = fits.open
+    verify_header_keywords = iris_tools.verify_header_keywords
+
+    def open_file(filename, *args, **kwargs):
+        opened.append(filename)
+        return fits_open(filename, *args, **kwargs)
+
+    def verify_keywords(header, keywords):
+        verified_keywords.extend([keyword for keyword in keywords if keyword in header])
+        return verify_header_keywords(header, keywords)
+
+    monkeypatch.setattr(fits, "open", open_file)
+    monkeypatch.setattr(iris_tools, "verify_header_keywords", verify_keywords)
+    raster_lenient = read_iris_spectrograph_level2_fits(raster_files, memmap=memmap, verify=False)
+    monkeypatch.undo()
+    assert opened == raster_files
+    # Keywords of the headers of every window read are verified.
+    assert verified_keywords.count("CTYPE1") == len(raster_files) * len(raster.data)
+    assert raster_lenient.meta == raster.meta
+    for window_name in raster.data.keys():
+        for cube, cube_lenient in zip(raster.data[window_name].data,
+                                      raster_lenient.data[window_name].data):
+            np.testing.assert_array_equal(np.asarray(cube_lenient.data), np.asarray(cube.data))
+            np.testing.assert_array_equal(cube_lenient.extra_coords["time"]["value"],
+                                          cube.extra_coords["time"]["value"])
+            assert cube_lenient.meta == cube.meta
+    blocks = list(iter_iris_spectrograph_level2_fits(raster_files, verify=False))
+    for i, block in enumerate(blocks):
+        for window_name, cube in block.items():
+            np.testing.assert_array_equal(cube.data, raster.data[window_name].data[i].data)
+
+
+@pytest.mark.parametrize("raster_files", [[{"n_raster_positions": 3}] * 2], indirect=True)
+def test_scan_iris_spectrograph_level2_fits(raster_files):
+    raster = read_iris_spectrograph_level2_fits(raster_files)
+    index = scan_iris_spectrograph_level2_fits(raster_files)
+    assert len(index) == 6
+    assert list(index["filename"]) == [raster_files[0]] * 3 + [raster_files[1]] * 3
+    np.testing.assert_array_equal(index["raster position"], [0, 1, 2, 0, 1, 2])
+    window_name = "C II 1336"
+    expected_times = np.concatenate([cube.extra_coords["time"]["value"]
+                                     for cube in raster.data[window_name].data])
+    np.testing.assert_array_equal(index["time"], expected_times)
+    assert index["spectral windows"][0] == "C II 1336, Si IV 1394, Mg II k 2796"
+    assert index["detector types"][0] == "FUV1, FUV2, NUV"
+    assert index["exposure time FUV"].unit == u.s
+
+
+def _produce_orbital_variation_raster(line_shifts, n_rasters=2):
+    # Produces an IRISSpectrograph whose Mg II k window contains a Ni I 2799
+    # absorption line shifted by line_shifts in each exposure.
+    n_exposures = len(line_shifts) // n_rasters
+    header = {'CTYPE1': 'WAVE', 'CUNIT1': 'Angstrom', 'CDELT1': 0.0255, 'CRPIX1': 1,
+              'CRVAL1': 2798.9, 'NAXIS1': 60,
+              'CTYPE2': 'HPLT-TAN', 'CUNIT2': 'deg', 'CDELT2': 0.5, 'CRPIX2': 2, 'CRVAL2': 0.5,
+              'NAXIS2': 8,
+              'CTYPE3': 'HPLN-TAN', 'CUNIT3': 'deg', 'CDELT3': 0.4, 'CRPIX3': 2, 'CRVAL3': 1,
+              'NAXIS3': n_exposures}
+    wavelength = 2798.9 + np.arange(60) * 0.0255
+    data = {}
+    for window_name, detector_type in [("Mg II k 2796", "NUV"), ("C II 1336", "FUV")]:
+        cubes = []
+        for i in range(n_rasters):
+            shifts = line_shifts[i * n_exposures:(i + 1) * n_exposures]
+            cube_data = 100. - 40. * np.exp(
+                -((wavelength - 2799.474 - shifts[:, np.newaxis, np.newaxis]) / 0.07) ** 2)
+            cube_data = cube_data * np.ones((1, 8, 1))
+            times = np.datetime64("2017-01-01T00:00:00", "us") + \
+                (np.arange(n_exposures) + i * n_exposures) * np.timedelta64(10, "s")
+            extra_coords = [("time", 0, times),
+                            ("exposure time", 0, np.ones(n_exposures) * u.s),
+                            ("obs_vrix", 0, np.zeros(n_exposures) * u.m / u.s),
+                            ("ophaseix", 0, np.zeros(n_exposures))]
+            meta = {"detector type": detector_type, "OBSID": 1,
+                    "spectral window": window_name, "SAT_ROT": 0 * u.deg, "DATE": None}
+            cubes.append(IRISSpectrogramCube(
+                cube_data, WCS(header=header, naxis=3), np.sqrt(cube_data),
+                iris_tools.DN_UNIT[detector_type], meta, extra_coords,
+                mask=np.zeros(cube_data.shape, dtype=bool)))
+        sequence_meta = {"detector type": detector_type, "spectral window": window_name,
+                         "brightest wavelength": 2799., "min wavelength": 2798.9,
+                         "max wavelength": 2800.4}
+        data[window_name] = IRISSpectrogramCubeSequence(cubes, meta=sequence_meta)
+    return IRISSpectrograph(data, meta={"OBSID": 1})
+
+
+@pytest.mark.parametrize("fit_individual_profiles", [False, True])
+def test_apply_orbital_wavelength_correction(fit_individual_profiles):
+    line_shifts = 0.02 * np.sin(np.arange(8) / 2.)
+    raster = _produce_orbital_variation_raster(line_shifts)
+    variation = calculate_orbital_wavelength_variation(
+        raster.data["Mg II k 2796"], fit_individual_profiles=fit_individual_profiles)
+    expected_variation = line_shifts - line_shifts.mean()
+    np.testing.assert_allclose(variation["wavelength variation NUV"].to(u.Angstrom).value,
+                               expected_variation, atol=1e-6)
+    np.testing.assert_allclose(variation["wavelength variation FUV"].to(u.Angstrom).value,
+                               -expected_variation, atol=1e-6)
+    corrected = apply_orbital_wavelength_correction(
+        raster, fit_individual_profiles=fit_individual_profiles)
+    for window_name, sign in [("Mg II k 2796", 1), ("C II 1336", -1)]:
+        for i, cube in enumerate(corrected.data[window_name].data):
+            original_cube = raster.data[window_name].data[i]
+            cube_variation = sign * expected_variation[i * 4:(i + 1) * 4]
+            np.testing.assert_allclose(
+                cube.extra_coords["orbital wavelength variation"]["value"].to(u.Angstrom).value,
+                cube_variation, atol=1e-6)
+            np.testing.assert_allclose(
+                cube.axis_world_coords(2).to(u.Angstrom).value,
+                original_cube.axis_world_coords(2).to(u.Angstrom).value - cube_variation.mean(),
+                atol=1e-6)
+            assert cube.data is original_cube.data
+            assert cube.mask is original_cube.mask
+
+
+def test_apply_orbital_wavelength_correction_single_exposures():
+    line_shifts = 0.02 * np.sin(np.arange(8) / 2.)
+    raster = _produce_orbital_variation_raster(line_shifts)
+    # Slice spectrograms into single exposures so each is corrected.
+    raster_exposures = IRISSpectrograph(dict([
+        (window_name, IRISSpectrogramCubeSequence(
+            [cube[i] for cube in sequence.data for i in range(cube.data.shape[0])],
+            meta=sequence.meta))
+        for window_name, sequence in raster.data.items()]), meta=raster.meta)
+    variation = calculate_orbital_wavelength_variation(raster.data["Mg II k 2796"])
+    variation_exposures = calculate_orbital_wavelength_variation(
+        raster_exposures.data["Mg II k 2796"])
+    np.testing.assert_array_equal(variation_exposures["time"], variation["time"])
+    np.testing.assert_allclose(
+        variation_exposures["wavelength variation NUV"].to(u.Angstrom).value,
+        variation["wavelength variation NUV"].to(u.Angstrom).value, atol=1e-6)
+    corrected = apply_orbital_wavelength_correction(raster_exposures)
+    expected_variation = line_shifts - line_shifts.mean()
+    for i, cube in enumerate(corrected.data["Mg II k 2796"].data):
+        original_cube = raster_exposures.data["Mg II k 2796"].data[i]
+        np.testing.assert_allclose(
+            cube.axis_world_coords(1).to(u.Angstrom).value,
+            original_cube.axis_world_coords(1).to(u.Angstrom).value - expected_variation[i],
+            atol=1e-6)
+
+
+@pytest.mark.parametrize("chunk_size, workers", [(None, None), (1, None), (1, 2)])
+def test_IRISSpectrogramCube_calculate_line_moments(chunk_size, workers):
+    line_shifts = 0.02 * np.sin(np.arange(8) / 2.)
+    sequence = _produce_orbital_variation_raster(line_shifts).data["Mg II k 2796"]
+    sequence.data[0].mask[0, 0] = True
+    rest_wavelength = 2799.474 * u.Angstrom
+    moments = sequence.calculate_line_moments(
+        rest_wavelength, wavelength_range=u.Quantity([2799.0, 2800.0], unit=u.Angstrom),
+        chunk_size=chunk_size, workers=workers)
+    expected_moments = [cube.calculate_line_moments(
+        rest_wavelength, wavelength_range=u.Quantity([2799.0, 2800.0], unit=u.Angstrom))
+        for cube in sequence.data]
+    for key in ["intensity", "velocity", "width"]:
+        assert len(moments[key].data) == len(sequence.data)
+        for moment, expected_moment in zip(moments[key].data, expected_moments):
+            assert moment.data.shape == (4, 8)
+            assert moment.unit == expected_moment[key].unit
+            np.testing.assert_array_equal(moment.data, expected_moment[key].data)
+            np.testing.assert_array_equal(moment.mask, expected_moment[key].mask)
+    assert moments["intensity"].data[0].unit == \
+        iris_tools.DN_UNIT["NUV"] * u.Angstrom
+    assert moments["velocity"].data[0].mask[0, 0]
+    assert not moments["velocity"].data[0].mask[1:].any()
+    assert "time" in moments["velocity"].data[0].extra_coords
+
+
+@pytest.mark.parametrize("chunk_size, workers", [(None, None), (2, None), (None, 2)])
+def test_IRISSpectrogramCubeSequence_fit_gaussians(chunk_size, workers):
+    line_shifts = 0.02 * np.sin(np.arange(8) / 2.)
+    sequence = _produce_orbital_variation_raster(line_shifts).data["Mg II k 2796"]
+    sequence.data[0].data[0, 0, 20] = BAD_PIXEL_VALUE
+    sequence.data[0].mask[0, 0, 20] = True
+    fit_maps = sequence.fit_gaussians(chunk_size=chunk_size, workers=workers)
+    assert list(fit_maps.keys()) == ["amplitude", "mean", "standard deviation",
+                                     "constant term", "linear term"]
+    for i, cube in enumerate(sequence.data):
+        expected_means = 2799.474 + line_shifts[i * 4:(i + 1) * 4]
+        mean_map = fit_maps["mean"].data[i]
+        assert mean_map.data.shape == (4, 8)
+        assert mean_map.unit == u.Angstrom
+        assert not mean_map.mask.any()
+        np.testing.assert_allclose(mean_map.data, expected_means[:, np.newaxis] * np.ones((1, 8)),
+                                   atol=1e-6)
+        np.testing.assert_allclose(fit_maps["amplitude"].data[i].data, -40., atol=1e-4)
+        np.testing.assert_allclose(fit_maps["constant term"].data[i].data, 100., atol=1e-2)
+        assert fit_maps["amplitude"].data[i].unit == iris_tools.DN_UNIT["NUV"]
+        assert (mean_map.uncertainty.array > 0).all()
+        assert "time" in mean_map.extra_coords
+    assert_cubes_equal(sequence.data[1].fit_gaussians()["mean"], fit_maps["mean"].data[1])